@@ -0,0 +1,87 @@
+import numpy as np
+from numba import njit, prange, types
+from concurrent.futures import ThreadPoolExecutor
+import os
+import simple_sim as simple_sim
+import ctmc_longrun as ctmc_longrun
+
+"""
+Evaluates the long-run proportions, and the cost from costfun.m, for a whole batch of parameter vectors in one call.
+
+costfun.m -> run_sim.py handles one parameter vector per call, so exploring the viable space one point at a time pays
+the MatLab -> Python overhead for every point and only ever uses one core. Here every row of an (n_points x 13)
+parameter matrix is one point, and all of the points are evaluated in parallel:
+- "gillespie" and "converge" run one simulation per point in a parallel Numba loop, each with its own generator
+- "exact" solves for the stationary distribution of each point (see ctmc_longrun.py) on a pool of threads
+
+The solvers mean the same thing as in run_sim.py. run_batch.py and costfun_batch.m call this from MatLab.
+"""
+
+#the cost given to parameters that spend too much time in the middle - they aren't bistable
+MIDDLE_LIMIT = 0.8
+
+#Creates `count` independent random number generators from one seed (None gives different results every run)
+spawn_generators = simple_sim.spawn_generators
+
+#Runs one long simulation for every row of param_matrix in parallel - point i uses rngs[i].
+#If converge is True, each run stops once its proportions converge (see simple_sim.GillespieLongRunConvergeFun).
+#The time in each region is added up with the given estimator (one of simple_sim.SAMPLED, EXPECTED or EMBEDDED).
+#Returns the (n_points x 4) proportions (methylated, unmethylated, middle, sort-of methylated) and the step each run stopped at.
+@njit((types.int64, types.float64[:, ::1], types.int64, types.int64, types.int64, types.List(simple_sim.generator_type, reflected=True), types.boolean, types.int64, types.float64[:], types.int64, types.int64), parallel=True, cache=True)
+def simulate_batch(steps, param_matrix, totalpop, pop_methyl, pop_unmethyl, rngs, converge, estimator, tolerances, sample_n_steps, window_size):
+    n_points = param_matrix.shape[0]
+    output = np.zeros((n_points, 4))
+    stop_steps = np.zeros(n_points, dtype=np.int64)
+    for point in prange(n_points):
+        rate_table = simple_sim.build_rate_table(param_matrix[point], totalpop)
+        occupancy_table = simple_sim.build_occupancy_table(rate_table, totalpop, estimator)
+        if converge:
+            methyl, unmethyl, middle, sortamethyl, stop_step = simple_sim.GillespieLongRunConvergeFun(steps, rate_table, occupancy_table, totalpop, pop_methyl, pop_unmethyl, rngs[point], estimator, tolerances, sample_n_steps, window_size)
+            output[point, 0] = methyl
+            output[point, 1] = unmethyl
+            output[point, 2] = middle
+            output[point, 3] = sortamethyl
+        else:
+            #a single batch - the standard errors aren't needed here
+            proportions, standard_errors = simple_sim.GillespieLongRunEstimateFun(steps, rate_table, occupancy_table, totalpop, pop_methyl, pop_unmethyl, rngs[point], estimator, 1)
+            output[point] = proportions
+            stop_step = steps - 1
+        stop_steps[point] = stop_step
+    return output, stop_steps
+
+#Finds the long-run proportions for every row of param_matrix with the given solver ("exact", "gillespie", or "converge"),
+#and for the simulations, the given estimator (a key of simple_sim.ESTIMATORS).
+#Returns the (n_points x 4) proportions, and the step where each simulation stopped (None for "exact").
+def BatchProportions(param_matrix, solver="exact", steps=100000000, totalpop=100, pop_methyl=50, pop_unmethyl=50, seed=None,
+                     tolerances=np.array([1e-3, 1e-3, 1e-3, 1e-3]), sample_n_steps=1000, window_size=50, estimator="expected"):
+    param_matrix = np.ascontiguousarray(np.atleast_2d(param_matrix), dtype=np.float64)
+    if param_matrix.shape[1] != 13:
+        raise ValueError(f"param_matrix should have 13 columns, but it has {param_matrix.shape[1]}")
+    if solver == "exact":
+        #the sparse solves spend most of their time outside of Python, so threads are enough to use every core
+        with ThreadPoolExecutor(os.cpu_count()) as executor:
+            output = np.array(list(executor.map(lambda params: ctmc_longrun.LongRunProportions(params, totalpop), param_matrix)))
+        return output.reshape(len(param_matrix), 4), None
+    if solver not in ("gillespie", "converge"):
+        raise ValueError(f"unknown solver {solver}")
+    if estimator not in simple_sim.ESTIMATORS:
+        raise ValueError(f"unknown estimator {estimator}")
+    rngs = spawn_generators(len(param_matrix), seed)
+    return simulate_batch(steps, param_matrix, totalpop, pop_methyl, pop_unmethyl, rngs, solver == "converge", simple_sim.ESTIMATORS[estimator],
+                          np.asarray(tolerances, dtype=np.float64), sample_n_steps, window_size)
+
+#The cost from costfun.m for every row of proportions: infinite if more than 80% of the time is spent in the middle,
+#otherwise the difference between the methylated and unmethylated proportions relative to their sum.
+def Cost(proportions, X=0):
+    proportions = np.atleast_2d(proportions)
+    methyl = proportions[:, 0]
+    unmethyl = proportions[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost = np.abs(methyl - unmethyl + X) / (methyl + unmethyl)
+    return np.where(proportions[:, 2] > MIDDLE_LIMIT, np.inf, cost)
+
+#Finds the cost of every row of param_matrix - takes the same arguments as BatchProportions.
+#Returns the costs and the (n_points x 4) proportions they came from.
+def BatchCost(param_matrix, solver="exact", **kwargs):
+    proportions, stop_steps = BatchProportions(param_matrix, solver, **kwargs)
+    return Cost(proportions), proportions
@@ -0,0 +1,76 @@
+import numpy as np
+import simple_sim as simple_sim
+import ctmc_longrun as ctmc_longrun
+import time
+
+"""
+Compares the estimators of the long-run proportions in simple_sim.py (see simple_sim.ESTIMATORS).
+
+Every estimator is run `replicas` times for the same number of steps, each time with a different seed. The spread of
+the replicas around the exact proportions (ctmc_longrun.py) is the real precision of the estimator, and the mean of the
+batch-means standard errors shows whether the reported errors can be trusted. The last column is how many steps the
+estimator needs to match the precision of "sampled" (the error shrinks like 1/sqrt(steps)).
+
+How much the expected holding times help depends on the parameters: with the default (bistable) rates almost all of the
+error comes from the few switches between the methylated and unmethylated sides, so the estimators are about as precise
+as each other and "expected" only wins by skipping the exponential draws. Away from bistability (try a birth_rate of 5)
+the waiting times are a large part of the noise, and "expected" needs roughly 40% fewer steps.
+"""
+
+#-----------parameters - edit here-----------
+#number of steps for each run
+trial_max_length = 1000000
+#number of independent runs of each estimator
+replicas = 20
+#number of batches used for the standard errors
+batch_count = 20
+#define starting population
+totalpop = 100
+methylatedpop = 50
+unmethylatedpop = 50
+seed = 0
+#-----------Rates Dictionary---------
+default_parameters = {"r_hm": 0.5,          #0
+                      "r_hm_m": 20/totalpop, #1
+                      "r_hm_h": 10/totalpop, #2
+                      "r_uh": 0.35,         #3
+                      "r_uh_m": 11/totalpop,#4
+                      "r_uh_h": 5.5/totalpop,#5
+                      "r_mh": 0.1,           #6
+                      "r_mh_u": 10/totalpop, #7
+                      "r_mh_h": 5/totalpop,  #8
+                      "r_hu": 0.1,            #9
+                      "r_hu_u": 10/totalpop, #10
+                      "r_hu_h": 5/totalpop,   #11
+                      "birth_rate": 1         #12
+}
+parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+default_arr = np.array([default_parameters[key] for key in parameter_labels])
+
+#-----------benchmark-----------
+exact = np.array(ctmc_longrun.LongRunProportions(default_arr, totalpop))
+rate_table = simple_sim.build_rate_table(default_arr, totalpop)
+labels = ["methylated", "unmethylated", "middle", "sort-of methylated"]
+print(f"exact proportions: {np.round(exact, 4)} ({', '.join(labels)})")
+print(f"{replicas} runs of {trial_max_length} steps per estimator\n")
+
+sampled_error = None
+for name, estimator in simple_sim.ESTIMATORS.items():
+    occupancy_table = simple_sim.build_occupancy_table(rate_table, totalpop, estimator)
+    #one short run first, so compilation isn't timed
+    simple_sim.GillespieLongRunEstimateFun(10, rate_table, occupancy_table, totalpop, methylatedpop, unmethylatedpop, np.random.default_rng(seed), estimator, batch_count)
+
+    estimates = np.zeros((replicas, 4))
+    standard_errors = np.zeros((replicas, 4))
+    start = time.perf_counter()
+    for replica in range(replicas):
+        estimates[replica], standard_errors[replica] = simple_sim.GillespieLongRunEstimateFun(trial_max_length, rate_table, occupancy_table, totalpop, methylatedpop, unmethylatedpop,
+                                                                                              np.random.default_rng([seed, replica]), estimator, batch_count)
+    seconds = (time.perf_counter() - start) / replicas
+
+    #root mean square error against the exact proportions, over the replicas and the four regions
+    error = np.sqrt(np.mean((estimates - exact)**2))
+    if sampled_error is None:
+        sampled_error = error
+    print(f"{name:>9}: rms error {error:.5f}, mean reported standard error {np.mean(standard_errors):.5f}, "
+          f"{seconds:.3f} s per run, {(error/sampled_error)**2:.2f}x the steps of sampled for the same precision")
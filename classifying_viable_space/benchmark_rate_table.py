@@ -0,0 +1,66 @@
+import numpy as np
+import simple_sim as simple_sim
+import time
+
+"""
+Compares how many gillespie steps per second we get with and without the precomputed rate table.
+
+GillespieLongRunFun recomputes the four collaborative rates on every step, while GillespieLongRunTableFun
+looks them up in a table built once by build_rate_table, then picks the event with a binary search.
+Both are run with the same seed, so they should print the same proportions.
+"""
+
+#-----------parameters - edit here-----------
+#number of steps for each timed run
+trial_max_length = 10000000
+#how many times to repeat each run - we report the best one
+repeats = 3
+#define starting population
+totalpop = 100
+methylatedpop = 50
+unmethylatedpop = 50
+seed = 0
+#-----------Rates Dictionary---------
+default_parameters = {"r_hm": 0.5,          #0
+                      "r_hm_m": 20/totalpop, #1
+                      "r_hm_h": 10/totalpop, #2
+                      "r_uh": 0.35,         #3
+                      "r_uh_m": 11/totalpop,#4
+                      "r_uh_h": 5.5/totalpop,#5
+                      "r_mh": 0.1,           #6
+                      "r_mh_u": 10/totalpop, #7
+                      "r_mh_h": 5/totalpop,  #8
+                      "r_hu": 0.1,            #9
+                      "r_hu_u": 10/totalpop, #10
+                      "r_hu_h": 5/totalpop,   #11
+                      "birth_rate": 1         #12
+}
+parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+default_arr = np.array([default_parameters[key] for key in parameter_labels])
+
+#-----------compile both versions before timing them-----------
+rate_table = simple_sim.build_rate_table(default_arr, totalpop)
+simple_sim.GillespieLongRunFun(10, default_arr, totalpop, methylatedpop, unmethylatedpop, np.random.default_rng(seed))
+simple_sim.GillespieLongRunTableFun(10, rate_table, totalpop, methylatedpop, unmethylatedpop, np.random.default_rng(seed))
+
+#-----------benchmark-----------
+def best_time(function, *args):
+    best = np.inf
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        result = function(*args, np.random.default_rng(seed))
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+start = time.perf_counter()
+rate_table = simple_sim.build_rate_table(default_arr, totalpop)
+table_time = time.perf_counter() - start
+
+direct_time, direct_result = best_time(simple_sim.GillespieLongRunFun, trial_max_length, default_arr, totalpop, methylatedpop, unmethylatedpop)
+lookup_time, lookup_result = best_time(simple_sim.GillespieLongRunTableFun, trial_max_length, rate_table, totalpop, methylatedpop, unmethylatedpop)
+
+print(f"Building the rate table ({rate_table.shape[0]} x {rate_table.shape[1]}) took {table_time*1000:.2f} ms")
+print(f"Recomputed rates: {trial_max_length/direct_time:,.0f} steps/second")
+print(f"Rate table:       {trial_max_length/lookup_time:,.0f} steps/second ({direct_time/lookup_time:.2f}x)")
+print(f"Proportions (recomputed): {direct_result}")
+print(f"Proportions (rate table): {lookup_result}")
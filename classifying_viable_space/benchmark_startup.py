@@ -0,0 +1,63 @@
+import subprocess
+import tempfile
+import statistics
+import time
+import sys
+import os
+
+"""
+Measures how long one call of run_sim.py takes from a fresh Python process - this is what MatLab pays on every
+evaluation of costfun.m, and for short runs it is mostly numba compiling the kernels rather than simulating.
+
+Each solver is timed in two ways:
+- cold: with an empty numba cache, so every kernel is compiled from scratch (the first run after editing a kernel)
+- warm: with the cache filled by an earlier run, so the compiled kernels are just loaded from disk (every run after that)
+Every run is a new interpreter, so the times include starting Python and importing numpy/scipy/numba.
+The cache goes into a temporary directory (NUMBA_CACHE_DIR) instead of __pycache__, so this doesn't touch your real cache.
+"""
+
+#-----------parameters - edit here-----------
+#solvers to time (see run_sim.py) - "gillespie" always runs 10^8 steps, so it measures the simulation more than the startup
+solvers = ["exact", "converge"]
+#how many times to repeat each measurement - we report the median and the best
+repeats = 3
+#rates passed to run_sim.py, the same way costfun.m passes them
+rates = {"r_hm": 0.5, "r_hm_h": 0.1, "r_uh": 0.35, "r_uh_h": 0.055, "r_mh": 0.1, "r_mh_h": 0.05, "r_hu": 0.1, "r_hu_h": 0.05, "r_cell_div": 1.0}
+
+#runs run_sim.py with the given solver, with the rates already defined like pyrunfile does
+CHILD = """
+source = open("run_sim.py").read().replace('SOLVER = "exact"', 'SOLVER = "{solver}"')
+variables = {rates!r}
+exec(compile(source, "run_sim.py", "exec"), variables)
+print(variables["output"])
+"""
+
+#Runs one fresh process with the given numba cache directory and returns how many seconds it took
+def time_run(solver, cache_dir):
+    environment = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", CHILD.format(solver=solver, rates=rates)], env=environment, check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+#Times `repeats` cold starts (a new empty cache each time) and `repeats` warm starts (one cache filled beforehand)
+def time_solver(solver):
+    cold = []
+    for repeat in range(repeats):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold.append(time_run(solver, cache_dir))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        time_run(solver, cache_dir)
+        warm = [time_run(solver, cache_dir) for repeat in range(repeats)]
+    return cold, warm
+
+#the time it takes to start python and import everything, without running any kernels
+start = time.perf_counter()
+subprocess.run([sys.executable, "-c", "import numpy, scipy.sparse, numba"], check=True)
+print(f"python + numpy/scipy/numba imports: {time.perf_counter() - start:.2f} s")
+
+for solver in solvers:
+    cold, warm = time_solver(solver)
+    print(f"{solver:>9}: cold start {statistics.median(cold):.2f} s (best {min(cold):.2f} s), "
+          f"warm start {statistics.median(warm):.2f} s (best {min(warm):.2f} s), "
+          f"{statistics.median(cold)/statistics.median(warm):.1f}x faster with the cache")
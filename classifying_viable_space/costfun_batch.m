@@ -0,0 +1,14 @@
+function [costs, props] =costfun_batch(points)
+% costfun.m for a whole batch of points in one call - each row of points holds the 8 rates that costfun.m takes
+% returns one cost per row, along with the proportions (methylated, unmethylated, middle, sort-of methylated)
+n = size(points, 1);
+% build the 13 rates for each point the same way run_sim.py does, with r_cell_div = 1
+param_matrix = [points(:,1), 2*points(:,2), points(:,2), ...
+                points(:,3), 2*points(:,4), points(:,4), ...
+                points(:,5), 2*points(:,6), points(:,6), ...
+                points(:,7), 2*points(:,8), points(:,8), ...
+                ones(n, 1)];
+[costs, props] = pyrunfile("run_batch.py", ["costs", "output"], param_matrix=param_matrix);
+costs = double(costs)'; % gotta make these useable in MatLab; before they are weird python data types
+props = double(props);
+end
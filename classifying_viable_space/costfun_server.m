@@ -0,0 +1,24 @@
+function [cost] =costfun_server(params)
+% same as costfun.m, but asks sim_server.py for the proportions instead of running run_sim.py every time
+% start the server first with `python sim_server.py` (from this folder), then use 'costfun_server' in search.m
+persistent client
+if isempty(client)
+    client = tcpclient("127.0.0.1", 8765, "Timeout", 600);
+    configureTerminator(client, "LF");
+end
+X = 0;
+request = struct("params", [params(1:8), 1]); % the last value is r_cell_div, just like in costfun.m
+writeline(client, jsonencode(request));
+response = jsondecode(readline(client));
+if isfield(response, "error")
+    error("sim_server.py: %s", response.error);
+end
+props = response.output;
+% if we spend 80+% in the middle, it is not bistable --> cost of infinity
+if props(3) > .8
+    cost = inf;
+% otherwise the cost is the ratio of the difference between the two regions to their sum
+else
+    cost = abs(props(1) - props(2) + X) / (props(1) + props(2));
+end
+end
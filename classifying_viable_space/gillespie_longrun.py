@@ -1,9 +1,26 @@
+import os
+import sys
 import numpy as np
-from numba import jit
-from numba import njit
-import matplotlib.pyplot as plt
-
-# NOTE: this is where the current progress on stopping simulations based on convergence are
+from numba import njit, types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from methylation_sim import (
+    generator_type,
+    maintenance_rate_collaborative,
+    denovo_rate_collaborative,
+    demaintenance_rate_collaborative,
+    demethylation_rate_collaborative,
+    birth_rate,
+    region_cutoffs,
+    classify_state_cutoff,
+    events,
+    window_add,
+    window_refresh,
+    window_rmsd,
+    converges,
+)
+
+# NOTE: this is where simulations are stopped early once the proportions converge
 
 """
 This file represents a long-run version of the gillespie algorithm. 
@@ -13,131 +30,39 @@ Goal: Get the proportion of time spent in a variety of regions for a specific pa
 Input: steps, parameter list, target parameter, parameter start, parameter end, bin count
 Output: wide variety of descriptive statistics
 
+The model and the rolling window helpers (window_add, window_refresh, window_rmsd, converges) live in the shared
+methylation_sim package at the top of the repository.
 """
 
+# number of samples in the rolling window, and how many steps apart the samples are
 B_SIZE = 50
-THRESHOLD = 0
 SAMPLE_N_STEPS = 1000
-
-
-@njit
-def maintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (
-        param_local[0] + param_local[2] * hemimethylated + param_local[1] * methylated
-    )  # r_hm param
-    # rate = hemimethylated * (self.params["r_hm"] + self.params["r_hm_h"]*hemimethylated + self.params["r_hm_m"]*methylated)
-
-
-@njit
-def denovo_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return unmethylated * (
-        param_local[3] + param_local[5] * hemimethylated + param_local[4] * methylated
-    )
-    # rate = unmethylated * (self.params["r_uh"] + self.params["r_uh_h"]*hemimethylated + self.params["r_uh_m"]*methylated)
-
-
-@njit
-def demaintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (
-        param_local[9]
-        + param_local[11] * hemimethylated
-        + param_local[10] * unmethylated
-    )
-    # rate = hemimethylated * (self.params["r_hu"] + self.params["r_hu_h"]*hemimethylated + self.params["r_hu_u"]*unmethylated)
-
-
-@njit
-def demethylation_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return methylated * (
-        param_local[6] + param_local[8] * hemimethylated + param_local[7] * unmethylated
-    )
-    # rate = methylated * (self.params["r_mh"] + self.params["r_mh_h"]*hemimethylated + self.params["r_mh_u"]*unmethylated)
-
-
-@njit
-def birth_rate(param_local):
-    return param_local[12]
-
-
-# Helper function that finds the state of the model for given site_count
-# 1 means >70% methylated, -1 means >70% unmethylated, 0 means somewhere in the middle
-# 2 means less than 30% methylated
-@njit
-def classify_state(methylated, unmethylated, site_count):
-    if methylated > 0.7 * site_count:
-        return 1
-    elif unmethylated > 0.7 * site_count:
-        return -1
-    elif unmethylated < 0.3 * site_count:
-        return 2
-    return 0
-
-
-# This function defines the events that can happen. It's equivalent to the event list in config.py
-# i_local indicates which loop called this function - that is, i_local indicates which event we're doing.
-@njit
-def events(methylated, unmethylated, totalpop, i_local, rng_local):
-    # maintenance event
-    if i_local == 0:
-        return methylated + 1, unmethylated
-    # denovo methylation event
-    elif i_local == 1:
-        return methylated, unmethylated - 1
-    # demaintenance event
-    elif i_local == 2:
-        return methylated, unmethylated + 1
-    # demethylation event
-    elif i_local == 3:
-        return methylated - 1, unmethylated
-    # birth event
-    elif i_local == 4:
-        hemimethylated = totalpop - (methylated + unmethylated)
-        newly_unmethylated = rng_local.binomial(hemimethylated, 0.5)
-        return 0, (unmethylated + newly_unmethylated)
-
-@njit
-def converges(data, threshold):
-    """
-    For checking if the proportions are converging
-    
-    input:
-        data:   an M x N numpy array where 
-                    M is the number of series
-                    N is the number of data points
-    
-    output:
-        a boolean:
-            True if the sum of all M series' root mean square deviances is below the threshold
-            False otherwise
-        a float:
-            the total RMSD
-    """
-    M, N = data.shape
-    
-    total_rmsd = 0.0
-    for i in range(M):
-        series = data[i]
-        mean = np.mean(series)
-
-        sse = 0
-        for j in range(N):
-            sse += (series[j] - mean) ** 2
-        
-        total_rmsd += np.sqrt(sse / N)
-
-    return (np.bool(total_rmsd < threshold), total_rmsd)
-
-
-@njit
-def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rng):
-    methylated_arr = np.zeros(steps)
-    unmethylated_arr = np.zeros(steps)
+# a run stops once the root mean square deviance of every proportion over the window is below its tolerance
+# order: methylated, unmethylated, sort-of methylated, middle
+TOLERANCES = np.array([1e-3, 1e-3, 1e-3, 1e-3])
+
+
+@njit(
+    (
+        types.int64,
+        types.float64[:],
+        types.int64,
+        types.int64,
+        types.int64,
+        generator_type,
+        types.float64[:],
+    ),
+    cache=True,
+)
+def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rng, tolerances):
+    # the counts are whole numbers of sites, so they are stored as integers
+    methylated_arr = np.zeros(steps, dtype=np.int32)
+    unmethylated_arr = np.zeros(steps, dtype=np.int32)
     time_arr = np.zeros(steps)
-    rmsd_arr = np.zeros(steps//SAMPLE_N_STEPS)
+    # the counts that classify_state compares with, worked out once instead of on every step
+    high_cutoff, low_cutoff = region_cutoffs(totalpop)
+    # the RMSD of each series every time we sample the proportions (one row per sample)
+    rmsd_arr = np.zeros((steps // SAMPLE_N_STEPS + 1, 4))
     # set the first elements of the methylated/unmethylated arrays to the starting values
     methylated_arr[0] = pop_methyl
     unmethylated_arr[0] = pop_unmethyl
@@ -155,9 +80,14 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
     unmethyl_cumulative_prop = np.zeros(steps)
     sortamethyl_cumulative_prop = np.zeros(steps)
 
-    # a 4 X B_SIZE matrix holding a rolling window of B_SIZE many proportions to check for convergence
-    buffer = np.zeros((B_SIZE, 3))
-    total_steps = steps  # this will get changed if we exit early
+    # a 4 X B_SIZE ring buffer holding a rolling window of B_SIZE many proportions to check for convergence
+    # the rows are methylated, unmethylated, sort-of methylated, and middle (same order as tolerances)
+    buffer = np.zeros((4, B_SIZE))
+    sums = np.zeros(4)
+    sums_sq = np.zeros(4)
+    sample = np.zeros(4)
+    rmsd = np.zeros(4)
+    total_steps = steps - 1  # this will get changed if we exit early
 
     # main loop - each generation or step is one iteration of this loop
     for i in range(
@@ -185,8 +115,8 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
         time_arr[i] = tau + time_arr[i - 1]
 
         # calculate the time increment after calculating tau but BEFORE calculating the next step
-        curr_state = classify_state(
-            methylated_arr[i - 1], unmethylated_arr[i - 1], totalpop
+        curr_state = classify_state_cutoff(
+            methylated_arr[i - 1], unmethylated_arr[i - 1], high_cutoff, low_cutoff
         )
         if curr_state == 1:
             methyl_cumulative += tau
@@ -224,13 +154,17 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
         # check if the proportions need to be saved to the buffer
         if i % SAMPLE_N_STEPS == 0:
             index = (i // SAMPLE_N_STEPS) % B_SIZE
-            buffer[0, index] = methyl_cumulative_prop[i]
-            buffer[1, index] = unmethyl_cumulative_prop[i]
-            buffer[2, index] = sortamethyl_cumulative_prop[i]
-            buffer[3, index] = 1 - methyl_cumulative_prop[i] - unmethyl_cumulative_prop[i] - sortamethyl_cumulative_prop[i]
-            check, rmsd = converges(buffer,THRESHOLD)
+            sample[0] = methyl_cumulative_prop[i]
+            sample[1] = unmethyl_cumulative_prop[i]
+            sample[2] = sortamethyl_cumulative_prop[i]
+            sample[3] = 1 - sample[0] - sample[1] - sample[2]
+            window_add(buffer, sums, sums_sq, index, sample)
+            if index == B_SIZE - 1:
+                window_refresh(buffer, sums, sums_sq)
+            window_rmsd(buffer, sums, sums_sq, rmsd)
             rmsd_arr[i // SAMPLE_N_STEPS] = rmsd
-            if check and (i > SAMPLE_N_STEPS * B_SIZE):
+            # only stop once the window is full of real samples
+            if i >= SAMPLE_N_STEPS * B_SIZE and converges(rmsd, tolerances):
                 total_steps = i
                 break
 
@@ -243,5 +177,6 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
         methyl_cumulative_prop[: total_steps + 1],
         unmethyl_cumulative_prop[: total_steps + 1],
         sortamethyl_cumulative_prop[: total_steps + 1],
-        rmsd_arr[: (total_steps // SAMPLE_N_STEPS) + 1]
+        rmsd_arr[: (total_steps // SAMPLE_N_STEPS) + 1],
+        total_steps,
     )
@@ -0,0 +1,18 @@
+import batch_cost as batch_cost
+import numpy as np
+
+# NOTE: The purpose of this file is to interface with the MatLab file costfun_batch.m
+#
+#       When this script is ran from MatLab, param_matrix is initialized by MatLab - one row of 13 rates per point
+
+MAX = 100000000
+POP = 100
+POP_M = 50
+POP_H = 50
+# same options as run_sim.py - "exact", "gillespie", or "converge"
+SOLVER = "exact"
+# same options as run_sim.py - "sampled", "expected", or "embedded"
+ESTIMATOR = "expected"
+
+# param_matrix is intentionally not defined because of how MatLab interfaces with this script
+costs, output = batch_cost.BatchCost(np.asarray(param_matrix, dtype=np.float64), SOLVER, steps=MAX, totalpop=POP, pop_methyl=POP_M, pop_unmethyl=POP_H, estimator=ESTIMATOR)
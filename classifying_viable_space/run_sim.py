@@ -1,14 +1,32 @@
 import simple_sim as simple_sim
+import ctmc_longrun as ctmc_longrun
 import numpy as np
 
 # NOTE: The purpose of this file is to interface with the MatLab file costfun.m
-#       
+#
 #       When this script is ran from MatLab, the values in the params array are initialized by MatLab
 
 MAX = 100000000
 POP = 100
 POP_M = 50
 POP_H = 50
+# "exact" solves for the stationary distribution directly (see ctmc_longrun.py) - this takes milliseconds
+# "gillespie" runs a single simulation of MAX steps instead
+# "converge" runs a simulation that stops once the proportions stop changing (usually around 10^6 steps, see simple_sim.py)
+SOLVER = "exact"
+# for "converge" - the proportions are sampled every SAMPLE_N_STEPS steps, and the run stops once the RMSD of each one
+# over the last WINDOW_SIZE samples is below its tolerance (methylated, unmethylated, sort-of methylated, middle)
+TOLERANCES = np.array([1e-3, 1e-3, 1e-3, 1e-3])
+SAMPLE_N_STEPS = 1000
+WINDOW_SIZE = 50
+# for "gillespie" and "converge" - how the time spent in each region is added up (see simple_sim.ESTIMATORS)
+# "sampled" uses the simulated waiting times, while "expected" uses their expected values, which gives the same proportions
+# without the noise of the waiting times (and skips drawing them). "embedded" also averages over the next event.
+# For bistable parameters most of the error comes from how rarely the run switches sides, which no estimator removes -
+# see benchmark_estimators.py
+ESTIMATOR = "expected"
+# for "gillespie" - the run is split into this many batches to estimate the standard error of each proportion
+BATCH_COUNT = 20
 
 # these are intentionally not defined because of how MatLab interfaces with this script
 params = np.array([r_hm, 2*r_hm_h, r_hm_h,
@@ -17,6 +35,19 @@ params = np.array([r_hm, 2*r_hm_h, r_hm_h,
           r_hu, 2*r_hu_h, r_hu_h,
           r_cell_div])
 
-generator = np.random.default_rng()
+if SOLVER == "exact":
+    output = ctmc_longrun.LongRunProportions(params, POP)
+else:
+    generator = np.random.default_rng()
+    estimator = simple_sim.ESTIMATORS[ESTIMATOR]
+    rate_table = simple_sim.build_rate_table(params, POP)
+    occupancy_table = simple_sim.build_occupancy_table(rate_table, POP, estimator)
 
-output = simple_sim.GillespieLongRunFun(MAX, params, POP, POP_M, POP_H, generator)
\ No newline at end of file
+    if SOLVER == "converge":
+        # the last value is the step where the run stopped, which MatLab doesn't need
+        *output, stop_step = simple_sim.GillespieLongRunConvergeFun(MAX, rate_table, occupancy_table, POP, POP_M, POP_H, generator, estimator, TOLERANCES, SAMPLE_N_STEPS, WINDOW_SIZE)
+        output = tuple(output)
+    else:
+        # the standard errors aren't used by MatLab, but are available here as standard_errors
+        proportions, standard_errors = simple_sim.GillespieLongRunEstimateFun(MAX, rate_table, occupancy_table, POP, POP_M, POP_H, generator, estimator, BATCH_COUNT)
+        output = tuple(proportions)
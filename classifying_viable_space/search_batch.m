@@ -0,0 +1,18 @@
+% plain Monte Carlo exploration of the viable space - every batch of points is evaluated with a single call to costfun_batch
+% (MCexp in search.m picks its points one at a time, so it can't use the batched cost function)
+
+LOWER_BOUNDS = [0 0 0 0 0 0 0 0];
+UPPER_BOUNDS = [100 100 100 100 100 100 100 100];
+THRESHOLD = .7
+BATCH_SIZE = 1000
+BATCH_COUNT = 10
+
+viable = [];
+viable_costs = [];
+for batch = 1:BATCH_COUNT
+    points = LOWER_BOUNDS + rand(BATCH_SIZE, numel(LOWER_BOUNDS)) .* (UPPER_BOUNDS - LOWER_BOUNDS);
+    costs = costfun_batch(points);
+    viable = [viable; points(costs < THRESHOLD, :)];
+    viable_costs = [viable_costs; costs(costs < THRESHOLD)];
+    fprintf('batch %d: %d viable points so far\n', batch, size(viable, 1));
+end
@@ -0,0 +1,141 @@
+import simple_sim as simple_sim
+import ctmc_longrun as ctmc_longrun
+import batch_cost as batch_cost
+import numpy as np
+import socketserver
+import json
+import time
+import sys
+
+"""
+A long-running version of run_sim.py for MatLab's optimizer.
+
+costfun.m runs run_sim.py with pyrunfile on every evaluation, which means importing numpy and numba, compiling the
+kernels, and creating a new generator every time - that's seconds of overhead before any simulation happens.
+This server does all of that once, then answers requests until it is stopped.
+
+Requests and responses are single lines of JSON:
+    request:  {"params": [r_hm, r_hm_h, r_uh, r_uh_h, r_mh, r_mh_h, r_hu, r_hu_h, r_cell_div], "solver": "exact", "id": 1}
+    response: {"output": [methylated, unmethylated, middle, sort-of methylated], "seconds": 0.002, "id": 1}
+"params" can also be the full list of 13 rates used everywhere else. "solver" and "id" are optional -
+the solver defaults to SOLVER (same options as run_sim.py), and the id is just sent back with the response.
+"estimator" is also optional and defaults to ESTIMATOR (see simple_sim.ESTIMATORS).
+"converge" responses also include "stop_step", "gillespie" responses include the "standard_errors" of the output,
+and bad requests get {"error": message} instead of an output.
+
+A whole batch of points can be sent at once with "points" instead of "params" (a list of parameter lists).
+They are evaluated in parallel with batch_cost.py, and the response has one output per point plus their "costs".
+
+Usage:
+    python sim_server.py            listens on HOST:PORT (use it from MatLab with costfun_server.m)
+    python sim_server.py stdio      reads requests from stdin and writes responses to stdout instead
+"""
+
+#-----------parameters - edit here-----------
+HOST = "127.0.0.1"
+PORT = 8765
+#these are the same as in run_sim.py
+MAX = 100000000
+POP = 100
+POP_M = 50
+POP_H = 50
+SOLVER = "exact"
+TOLERANCES = np.array([1e-3, 1e-3, 1e-3, 1e-3])
+SAMPLE_N_STEPS = 1000
+WINDOW_SIZE = 50
+ESTIMATOR = "expected"
+BATCH_COUNT = 20
+#random seed for the server's generator - None gives different results every time the server starts
+SEED = None
+
+#one generator for the whole life of the server
+generator = np.random.default_rng(SEED)
+
+#Builds the 13 rates from the 9 values that costfun.m passes, exactly like run_sim.py does
+def full_parameters(values):
+    values = [float(value) for value in values]
+    if len(values) == 13:
+        return np.array(values)
+    if len(values) != 9:
+        raise ValueError(f"expected 9 or 13 parameters, got {len(values)}")
+    r_hm, r_hm_h, r_uh, r_uh_h, r_mh, r_mh_h, r_hu, r_hu_h, r_cell_div = values
+    return np.array([r_hm, 2*r_hm_h, r_hm_h,
+                     r_uh, 2*r_uh_h, r_uh_h,
+                     r_mh, 2*r_mh_h, r_mh_h,
+                     r_hu, 2*r_hu_h, r_hu_h,
+                     r_cell_div])
+
+#Finds the four proportions for one parameter vector with the given solver and estimator - the same branches as run_sim.py
+def proportions(params, solver, estimator_name):
+    if solver == "exact":
+        return list(ctmc_longrun.LongRunProportions(params, POP)), {}
+    if solver not in ("converge", "gillespie"):
+        raise ValueError(f"unknown solver {solver}")
+    if estimator_name not in simple_sim.ESTIMATORS:
+        raise ValueError(f"unknown estimator {estimator_name}")
+    estimator = simple_sim.ESTIMATORS[estimator_name]
+    rate_table = simple_sim.build_rate_table(params, POP)
+    occupancy_table = simple_sim.build_occupancy_table(rate_table, POP, estimator)
+    if solver == "converge":
+        *output, stop_step = simple_sim.GillespieLongRunConvergeFun(MAX, rate_table, occupancy_table, POP, POP_M, POP_H, generator, estimator, TOLERANCES, SAMPLE_N_STEPS, WINDOW_SIZE)
+        return output, {"stop_step": int(stop_step)}
+    output, standard_errors = simple_sim.GillespieLongRunEstimateFun(MAX, rate_table, occupancy_table, POP, POP_M, POP_H, generator, estimator, BATCH_COUNT)
+    return list(output), {"standard_errors": standard_errors.tolist()}
+
+#Answers one line of JSON with one line of JSON
+def handle_request(line):
+    start = time.perf_counter()
+    response = {}
+    try:
+        request = json.loads(line)
+        if "id" in request:
+            response["id"] = request["id"]
+        if "points" in request:
+            param_matrix = np.array([full_parameters(point) for point in request["points"]])
+            costs, output = batch_cost.BatchCost(param_matrix, request.get("solver", SOLVER), steps=MAX, totalpop=POP, pop_methyl=POP_M, pop_unmethyl=POP_H,
+                                                 tolerances=TOLERANCES, sample_n_steps=SAMPLE_N_STEPS, window_size=WINDOW_SIZE,
+                                                 estimator=request.get("estimator", ESTIMATOR))
+            response["output"] = output.tolist()
+            #json has no infinity, so points that aren't bistable get a cost of null
+            response["costs"] = [float(cost) if np.isfinite(cost) else None for cost in costs]
+        else:
+            output, extra = proportions(full_parameters(request["params"]), request.get("solver", SOLVER), request.get("estimator", ESTIMATOR))
+            response["output"] = [float(value) for value in output]
+            response.update(extra)
+    except Exception as error:
+        response["error"] = f"{type(error).__name__}: {error}"
+    response["seconds"] = time.perf_counter() - start
+    return json.dumps(response)
+
+#Compiles every kernel once, so that the first real request is as fast as the rest
+def warm_up():
+    default_params = full_parameters([0.5, 10/POP, 0.35, 5.5/POP, 0.1, 5/POP, 0.1, 5/POP, 1])
+    ctmc_longrun.LongRunProportions(default_params, POP)
+    rate_table = simple_sim.build_rate_table(default_params, POP)
+    occupancy_table = simple_sim.build_occupancy_table(rate_table, POP, simple_sim.ESTIMATORS[ESTIMATOR])
+    simple_sim.GillespieLongRunEstimateFun(10, rate_table, occupancy_table, POP, POP_M, POP_H, generator, simple_sim.ESTIMATORS[ESTIMATOR], BATCH_COUNT)
+    simple_sim.GillespieLongRunConvergeFun(10, rate_table, occupancy_table, POP, POP_M, POP_H, generator, simple_sim.ESTIMATORS[ESTIMATOR], TOLERANCES, SAMPLE_N_STEPS, WINDOW_SIZE)
+    batch_cost.BatchProportions(default_params, "converge", steps=10, totalpop=POP, pop_methyl=POP_M, pop_unmethyl=POP_H)
+
+#Each connection can send any number of requests, one per line
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                self.wfile.write((handle_request(line) + "\n").encode())
+                self.wfile.flush()
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    warm_up()
+    if len(sys.argv) > 1 and sys.argv[1] == "stdio":
+        #anything printed to stdout would be read as a response, so the status goes to stderr
+        print(f"Ready after {time.perf_counter() - start:.1f} seconds", file=sys.stderr, flush=True)
+        for line in sys.stdin:
+            if line.strip():
+                print(handle_request(line), flush=True)
+    else:
+        socketserver.TCPServer.allow_reuse_address = True
+        with socketserver.TCPServer((HOST, PORT), RequestHandler) as server:
+            print(f"Ready after {time.perf_counter() - start:.1f} seconds, listening on {HOST}:{PORT}", flush=True)
+            server.serve_forever()
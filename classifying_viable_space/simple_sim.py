@@ -1,10 +1,14 @@
 import numpy as np
-from numba import jit
-from numba import njit
-import matplotlib.pyplot as plt
+from numba import njit, types
+import os
 import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from methylation_sim import (generator_type, maintenance_rate_collaborative, denovo_rate_collaborative,
+                             demaintenance_rate_collaborative, demethylation_rate_collaborative, birth_rate, region_cutoffs,
+                             classify_state_cutoff, events, build_rate_table, spawn_generators, SAMPLED, ESTIMATORS,
+                             build_occupancy_table, batch_means_error, occupancy_kernel)
 
-# This is the "simple" simulation w/o early termination
+# This is the "simple" simulation - GillespieLongRunConvergeFun is the only version with early termination
 # Currently MatLab is using this
 
 """
@@ -15,74 +19,20 @@ Goal: Get the proportion of time spent in a variety of regions for a specific pa
 Input: steps, parameter list, target parameter, parameter start, parameter end, bin count
 Output: wide variety of descriptive statistics
 
+The model, the estimators and the table-based simulation loop live in the shared methylation_sim package at the top of
+the repository - the functions below keep their old arguments and return values, and the package's functions that
+run_sim.py and the other scripts here use (ESTIMATORS, build_rate_table, build_occupancy_table and so on) are re-exported from here.
 """
 
-@njit
-def maintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (param_local[0] + param_local[2]*hemimethylated + param_local[1]*methylated)#r_hm param
-    #rate = hemimethylated * (self.params["r_hm"] + self.params["r_hm_h"]*hemimethylated + self.params["r_hm_m"]*methylated)
-@njit
-def denovo_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return unmethylated * (param_local[3] + param_local[5]*hemimethylated + param_local[4]*methylated)
-    #rate = unmethylated * (self.params["r_uh"] + self.params["r_uh_h"]*hemimethylated + self.params["r_uh_m"]*methylated)
-@njit
-def demaintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (param_local[9] + param_local[11]*hemimethylated + param_local[10]*unmethylated)
-    #rate = hemimethylated * (self.params["r_hu"] + self.params["r_hu_h"]*hemimethylated + self.params["r_hu_u"]*unmethylated)
-@njit
-def demethylation_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return methylated * (param_local[6] + param_local[8]*hemimethylated + param_local[7]*unmethylated)
-    #rate = methylated * (self.params["r_mh"] + self.params["r_mh_h"]*hemimethylated + self.params["r_mh_u"]*unmethylated)
-@njit
-def birth_rate(param_local):
-      return param_local[12]
-
-#Helper function that finds the state of the model for given site_count
-#1 means >70% methylated, -1 means >70% unmethylated, 0 means somewhere in the middle
-#2 means less than 30% methylated
-@njit
-def classify_state(methylated, unmethylated, site_count):
-      if methylated > 0.7*site_count:
-          return 1
-      elif unmethylated > 0.7*site_count:
-          return -1
-      elif unmethylated < 0.3*site_count:
-          return 2
-      return 0
-
-#This function defines the events that can happen. It's equivalent to the event list in config.py
-#i_local indicates which loop called this function - that is, i_local indicates which event we're doing.
-@njit
-def events(methylated, unmethylated, totalpop, i_local, rng_local):
-    #maintenance event
-    if i_local == 0:
-        return methylated+1, unmethylated
-    #denovo methylation event
-    elif i_local == 1:
-        return methylated, unmethylated-1
-    #demaintenance event
-    elif i_local == 2:
-        return methylated, unmethylated+1
-    #demethylation event
-    elif i_local == 3:
-        return methylated-1, unmethylated
-    #birth event
-    elif i_local == 4:
-        hemimethylated = totalpop - (methylated + unmethylated)
-        newly_unmethylated = rng_local.binomial(hemimethylated, 0.5)
-        return 0, (unmethylated + newly_unmethylated)
-
-@njit
+@njit(cache=True)
 def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rng):
     #set the first elements of the methylated/unmethylated arrays to the starting values
     curr_methylated = pop_methyl 
     curr_unmethylated = pop_unmethyl
     #set the first element of the time array to zero, so that it stays synced up with the (un)methylated arrays
     total_time = 0
+    #the counts that classify_state compares with, worked out once instead of on every step
+    high_cutoff, low_cutoff = region_cutoffs(totalpop)
     rates = np.zeros(5)
     #define our four amounts of cumulative time spent in different areas. By the end these will sum to time_arr[-1]
     methyl_cumulative = 0
@@ -106,7 +56,7 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
         total_time += tau
 
         #calculate the time increment after calculating tau but BEFORE calculating the next step
-        curr_state = classify_state(curr_methylated, curr_unmethylated, totalpop)
+        curr_state = classify_state_cutoff(curr_methylated, curr_unmethylated, high_cutoff, low_cutoff)
         if curr_state == 1:
             methyl_cumulative += tau
         elif curr_state == -1:
@@ -135,3 +85,53 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
             unmethyl_cumulative / total_time,
             middle_cumulative / total_time,
             sortamethl_cumulative / total_time)
+
+
+#Same as GillespieLongRunTableFun, but adds up the time in each region with the given estimator (see SAMPLED/EXPECTED/EMBEDDED)
+#using an occupancy table from build_occupancy_table, built for the same estimator.
+#The run is split into batch_count batches of consecutive steps to estimate the standard errors (see batch_means_error).
+#Returns the proportions (methylated, unmethylated, middle, sort-of methylated) and their standard errors, as two arrays.
+@njit((types.int64, types.float64[:, ::1], types.float64[:, ::1], types.int64, types.int64, types.int64, generator_type, types.int64, types.int64), cache=True)
+def GillespieLongRunEstimateFun(steps, rate_table, occupancy_table, totalpop, pop_methyl, pop_unmethyl, rng, estimator, batch_count):
+    totals = np.zeros(5)
+    batch_sums = np.zeros((batch_count, 5))
+    #only the sampled estimator needs the actual wait for the event
+    occupancy_kernel(steps, rate_table, occupancy_table, totalpop, pop_methyl, pop_unmethyl, rng, estimator == SAMPLED,
+                     totals, batch_sums, None, None, None)
+    return batch_means_error(batch_sums)
+
+#Same as GillespieLongRunFun, but looks up the rates in a table from build_rate_table instead of recomputing them every step.
+@njit((types.int64, types.float64[:, ::1], types.int64, types.int64, types.int64, generator_type), cache=True)
+def GillespieLongRunTableFun(steps, rate_table, totalpop, pop_methyl, pop_unmethyl, rng):
+    #define our four amounts of cumulative time spent in different areas, and their sum (total_time)
+    totals = np.zeros(5)
+    occupancy_kernel(steps, rate_table, build_occupancy_table(rate_table, totalpop, SAMPLED), totalpop, pop_methyl, pop_unmethyl,
+                     rng, SAMPLED == SAMPLED, totals, None, None, None, None)
+    total_time = totals[4]
+
+    #we should reach this return point on every run
+    return (totals[0] / total_time,
+            totals[1] / total_time,
+            totals[2] / total_time,
+            totals[3] / total_time)
+
+#Same as GillespieLongRunTableFun, but stops as soon as the cumulative proportions have converged, using the same
+#rolling window as gillespie_longrun.GillespieLongRunFun: every sample_n_steps steps the proportions are added to a window
+#of the last window_size samples, and the run stops once the RMSD of every proportion over the window is below its tolerance.
+#tolerances are in the order methylated, unmethylated, sort-of methylated, middle (like gillespie_longrun.TOLERANCES).
+#The time in each region is added up with the given estimator (see SAMPLED/EXPECTED/EMBEDDED), using an occupancy table from
+#build_occupancy_table - the less noisy estimators converge in fewer steps. With SAMPLED this is the same run as before.
+#Returns the proportions in the same order as GillespieLongRunTableFun, followed by the step where the run stopped.
+@njit((types.int64, types.float64[:, ::1], types.float64[:, ::1], types.int64, types.int64, types.int64, generator_type, types.int64, types.float64[:], types.int64, types.int64), cache=True)
+def GillespieLongRunConvergeFun(steps, rate_table, occupancy_table, totalpop, pop_methyl, pop_unmethyl, rng, estimator, tolerances, sample_n_steps, window_size):
+    totals = np.zeros(5)
+    #only the sampled estimator needs the actual wait for the event
+    stop_step = occupancy_kernel(steps, rate_table, occupancy_table, totalpop, pop_methyl, pop_unmethyl, rng, estimator == SAMPLED,
+                                 totals, None, None, None, (tolerances, sample_n_steps, window_size))
+    total_time = totals[4]
+
+    return (totals[0] / total_time,
+            totals[1] / total_time,
+            totals[2] / total_time,
+            totals[3] / total_time,
+            stop_step)
@@ -1,9 +1,9 @@
 import numpy as np
 import gillespie_longrun
 import matplotlib.pyplot as plt
-import numba
 
 # This is the file I am currently using to run tests with converging by RMSD (Root Mean Squared Deviance)
+# The run stops early once the RMSD of every proportion over the rolling window is below its tolerance (see gillespie_longrun.py)
 
 """
 Performs a single, very long, gillespie run to see what proportion of time is spent in each state - 
@@ -22,6 +22,8 @@ trial_max_length = 100000000
 totalpop = 100
 methylatedpop = 50
 unmethylatedpop = 50
+#largest RMSD allowed for each proportion before the run stops - methylated, unmethylated, sort-of methylated, middle
+tolerances = gillespie_longrun.TOLERANCES
 #-----------Rates Dictionary---------
 
 default_parameters = {"r_hm": 0.5,          #0
@@ -64,10 +66,9 @@ parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh
 default_arr = np.array([default_parameters[key] for key in parameter_labels])
 
 #-----------simulation-----------
-@numba.jit()
+#the kernels it calls are compiled (or loaded from the cache) when gillespie_longrun is imported, so this stays plain python
 def main(rng):
-        methyl_time, unmethyl_time, middle_time, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop, rmsd_arr = gillespie_longrun.GillespieLongRunFun(trial_max_length, default_arr, totalpop, methylatedpop, unmethylatedpop, rng)
-        return methyl_time,unmethyl_time,middle_time, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop, rmsd_arr
+        return gillespie_longrun.GillespieLongRunFun(trial_max_length, default_arr, totalpop, methylatedpop, unmethylatedpop, rng, tolerances)
     
 #-----------setup-----------
 
@@ -76,8 +77,9 @@ generator = np.random.default_rng()
 
 #-----------Call simulation-----------
 #call our gillespie algorithm and save the raw data
-methylated_time, unmethylated_time, time_in_middle, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop, rmsd_arr = main(generator)
+methylated_time, unmethylated_time, time_in_middle, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop, rmsd_arr, stop_step = main(generator)
 total_steps = len(time_arr)
+print(f"Stopped at step {stop_step} out of {trial_max_length}")
 
 #print the amount of time that our simulation lasted
 total_time = time_arr[-1]
@@ -117,7 +119,14 @@ plt.plot(xes, middle_cumulative_prop_thinned,label="Transitionary")
 plt.legend(loc='upper right')
 
 plt.subplot(2,1,2)
-plt.plot(rmsd_arr)
+#the RMSD of each proportion over the window, every time the proportions were sampled
+sample_steps = np.arange(len(rmsd_arr)) * gillespie_longrun.SAMPLE_N_STEPS
+for series, label in enumerate(["Methylated", "Unmethylated", "Sort of methylated", "Transitionary"]):
+    line, = plt.plot(sample_steps, rmsd_arr[:, series], label=label)
+    plt.axhline(tolerances[series], color=line.get_color(), linestyle='dotted')
+plt.yscale('log')
+plt.xlabel('step')
+plt.ylabel('RMSD over the window')
 
 plt.show()
       
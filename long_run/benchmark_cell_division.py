@@ -0,0 +1,81 @@
+import numpy as np
+import numba
+import gillespie_longrun as gillespie_longrun
+import time
+
+"""
+Simulates many cells that each carry loci_per_cell domains (loci) and divide together, with
+methylation_sim.CellOccupancy (see methylation_sim/loci.py), and compares it with the same domains dividing
+independently of each other (LociOccupancy, with the division rate as every domain's birth_rate).
+
+Every locus of a cell gets its own parameters - the defaults, with r_hm_m spread between r_hm_m_low and r_hm_m_high
+times the default - and the same loci are used in every cell. We print the time per gillespie step of both versions,
+the number of divisions, and the proportion of time in each region averaged over the loci. Every locus divides at the
+same rate either way, so the proportions agree on average - but the loci of a cell share their divisions, so the
+shared average is noisier (it only has cell_count independent division histories).
+The cells are the work items of the parallel loop, so the run time shrinks with the number of cores
+(numba.get_num_threads()) - extrapolate from the printed time per step for bigger runs (e.g. 10,000 loci x 1,000 cells).
+"""
+
+#-----------parameters - edit here-----------
+#number of cells, and of loci in each of them
+cell_count = 100
+loci_per_cell = 1000
+#number of sites in every locus
+totalpop = 100
+#rate of the shared divisions
+division_rate = 1.0
+#how long to simulate every cell for
+duration = 10.0
+#range of r_hm_m over the loci, relative to the default
+r_hm_m_low = 0.8
+r_hm_m_high = 1.2
+#starting counts of methylated and unmethylated sites
+methylatedpop = 50
+unmethylatedpop = 50
+seed = 0
+#-----------Rates Dictionary---------
+#the collaborative parameters are per site - they get divided by the number of sites
+per_site_parameters = {"r_hm": 0.5,   #0
+                       "r_hm_m": 20,  #1
+                       "r_hm_h": 10,  #2
+                       "r_uh": 0.35,  #3
+                       "r_uh_m": 11,  #4
+                       "r_uh_h": 5.5, #5
+                       "r_mh": 0.1,   #6
+                       "r_mh_u": 10,  #7
+                       "r_mh_h": 5,   #8
+                       "r_hu": 0.1,   #9
+                       "r_hu_u": 10,  #10
+                       "r_hu_h": 5,   #11
+                       "birth_rate": division_rate #12
+}
+parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+per_site_arr = np.array([per_site_parameters[key] for key in parameter_labels], dtype=np.float64)
+param_matrix = np.tile(per_site_arr, (loci_per_cell, 1))
+param_matrix[:, 1] *= np.linspace(r_hm_m_low, r_hm_m_high, loci_per_cell)
+param_matrix = gillespie_longrun.scale_parameters(param_matrix, totalpop)
+
+#-----------compile both versions before timing them-----------
+gillespie_longrun.CellOccupancy(param_matrix[:2], totalpop, methylatedpop, unmethylatedpop, 2, division_rate, 1.0, seed)
+gillespie_longrun.LociOccupancy(param_matrix[:2], totalpop, methylatedpop, unmethylatedpop, 1.0, seed)
+
+#-----------benchmark-----------
+start = time.perf_counter()
+shared, methylated, unmethylated, divisions, shared_steps = gillespie_longrun.CellOccupancy(param_matrix, totalpop, methylatedpop, unmethylatedpop,
+                                                                                            cell_count, division_rate, duration, seed)
+shared_time = time.perf_counter() - start
+
+#the same loci in every cell, each dividing on its own
+start = time.perf_counter()
+independent, independent_steps = gillespie_longrun.LociOccupancy(np.tile(param_matrix, (cell_count, 1)), totalpop, methylatedpop, unmethylatedpop,
+                                                                 duration, seed)
+independent_time = time.perf_counter() - start
+independent = np.mean(independent.reshape(cell_count, loci_per_cell, 4), axis=0)
+
+print(f"{cell_count} cells x {loci_per_cell} loci, {duration} units of time, {numba.get_num_threads()} threads")
+print(f"  shared divisions:      {shared_time:8.2f} s, {1e9*shared_time/shared_steps:6.1f} ns/step, {np.mean(divisions):.1f} divisions per cell")
+print(f"  independent divisions: {independent_time:8.2f} s, {1e9*independent_time/independent_steps:6.1f} ns/step")
+print("  proportions (methylated, unmethylated, middle, sort-of methylated), averaged over the loci:")
+print("    shared:     ", np.round(np.mean(shared, axis=0), 4))
+print("    independent:", np.round(np.mean(independent, axis=0), 4))
@@ -0,0 +1,9 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from methylation_sim import (state_index, state_count, build_generator, generator_matrix, stationary_distribution,
+                             aggregate_regions, LongRunProportions)
+
+"""
+Re-exports methylation_sim.ctmc (the exact long-run solver, see methylation_sim/ctmc.py) under the old names.
+"""
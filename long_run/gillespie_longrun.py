@@ -1,7 +1,12 @@
+import os
+import sys
 import numpy as np
-from numba import jit
-from numba import njit
-import matplotlib.pyplot as plt
+from numba import njit, types
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from methylation_sim import (generator_type, maintenance_rate_collaborative, denovo_rate_collaborative,
+                             demaintenance_rate_collaborative, demethylation_rate_collaborative, birth_rate, region_cutoffs,
+                             classify_state_cutoff, events, build_rate_table, SAMPLED, build_occupancy_table, occupancy_kernel,
+                             scale_parameters, LociOccupancy, CellOccupancy)
 
 """
 This file represents a long-run version of the gillespie algorithm. 
@@ -11,72 +16,18 @@ Goal: Get the proportion of time spent in a variety of regions for a specific pa
 Input: steps, parameter list, target parameter, parameter start, parameter end, bin count
 Output: wide variety of descriptive statistics
 
+The model and the table-based simulation loop live in the shared methylation_sim package at the top of the repository -
+the functions below keep their old arguments and return values, and the package's functions that long_run uses are re-exported from here.
 """
 
-@njit
-def maintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (param_local[0] + param_local[2]*hemimethylated + param_local[1]*methylated)#r_hm param
-    #rate = hemimethylated * (self.params["r_hm"] + self.params["r_hm_h"]*hemimethylated + self.params["r_hm_m"]*methylated)
-@njit
-def denovo_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return unmethylated * (param_local[3] + param_local[5]*hemimethylated + param_local[4]*methylated)
-    #rate = unmethylated * (self.params["r_uh"] + self.params["r_uh_h"]*hemimethylated + self.params["r_uh_m"]*methylated)
-@njit
-def demaintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (param_local[9] + param_local[11]*hemimethylated + param_local[10]*unmethylated)
-    #rate = hemimethylated * (self.params["r_hu"] + self.params["r_hu_h"]*hemimethylated + self.params["r_hu_u"]*unmethylated)
-@njit
-def demethylation_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return methylated * (param_local[6] + param_local[8]*hemimethylated + param_local[7]*unmethylated)
-    #rate = methylated * (self.params["r_mh"] + self.params["r_mh_h"]*hemimethylated + self.params["r_mh_u"]*unmethylated)
-@njit
-def birth_rate(param_local):
-      return param_local[12]
-
-#Helper function that finds the state of the model for given site_count
-#1 means >70% methylated, -1 means >70% unmethylated, 0 means somewhere in the middle
-#2 means less than 30% methylated
-@njit
-def classify_state(methylated, unmethylated, site_count):
-      if methylated > 0.7*site_count:
-          return 1
-      elif unmethylated > 0.7*site_count:
-          return -1
-      elif unmethylated < 0.3*site_count:
-          return 2
-      return 0
-
-#This function defines the events that can happen. It's equivalent to the event list in config.py
-#i_local indicates which loop called this function - that is, i_local indicates which event we're doing.
-@njit
-def events(methylated, unmethylated, totalpop, i_local, rng_local):
-    #maintenance event
-    if i_local == 0:
-        return methylated+1, unmethylated
-    #denovo methylation event
-    elif i_local == 1:
-        return methylated, unmethylated-1
-    #demaintenance event
-    elif i_local == 2:
-        return methylated, unmethylated+1
-    #demethylation event
-    elif i_local == 3:
-        return methylated-1, unmethylated
-    #birth event
-    elif i_local == 4:
-        hemimethylated = totalpop - (methylated + unmethylated)
-        newly_unmethylated = rng_local.binomial(hemimethylated, 0.5)
-        return 0, (unmethylated + newly_unmethylated)
-
-@njit
+@njit(cache=True)
 def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rng):
-    methylated_arr = np.zeros(steps)
-    unmethylated_arr = np.zeros(steps)
+    #the counts are whole numbers of sites, so they are stored as integers
+    methylated_arr = np.zeros(steps, dtype=np.int32)
+    unmethylated_arr = np.zeros(steps, dtype=np.int32)
     time_arr = np.zeros(steps) 
+    #the counts that classify_state compares with, worked out once instead of on every step
+    high_cutoff, low_cutoff = region_cutoffs(totalpop)
     #set the first elements of the methylated/unmethylated arrays to the starting values
     methylated_arr[0] = pop_methyl 
     unmethylated_arr[0] = pop_unmethyl
@@ -111,7 +62,7 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
         time_arr[i] = tau + time_arr[i-1]
 
         #calculate the time increment after calculating tau but BEFORE calculating the next step
-        curr_state = classify_state(methylated_arr[i-1], unmethylated_arr[i-1], totalpop)
+        curr_state = classify_state_cutoff(methylated_arr[i-1], unmethylated_arr[i-1], high_cutoff, low_cutoff)
         if curr_state == 1:
             methyl_cumulative += tau
         elif curr_state == -1:
@@ -143,3 +94,46 @@ def GillespieLongRunFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, rn
     #we should reach this return point on every run
     return (methyl_cumulative, unmethyl_cumulative, middle_cumulative, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop)
 
+
+#Same as GillespieLongRunFun, but looks up the rates in a table from build_rate_table instead of recomputing them every step.
+@njit((types.int64, types.float64[:, ::1], types.int64, types.int64, types.int64, generator_type), cache=True)
+def GillespieLongRunTableFun(steps, rate_table, totalpop, pop_methyl, pop_unmethyl, rng):
+    #record every step - samples holds the time and the cumulative proportions (methylated, unmethylated, sort-of methylated)
+    totals = np.zeros(5)
+    samples = np.zeros((4, steps))
+    occupancy_kernel(steps, rate_table, build_occupancy_table(rate_table, totalpop, SAMPLED), totalpop, pop_methyl, pop_unmethyl,
+                     rng, SAMPLED == SAMPLED, totals, None, np.arange(steps), samples, None)
+
+    #we should reach this return point on every run
+    return (totals[0], totals[1], totals[2], samples[0], samples[1], samples[2], samples[3])
+
+#Step numbers to record for GillespieLongRunStreamFun - sample_count steps spread evenly between 0 and steps-1
+@njit((types.int64, types.int64), cache=True)
+def linear_samples(steps, sample_count):
+    stride = max(1, (steps - 1) // max(1, sample_count - 1))
+    return np.arange(0, steps, stride)
+
+#Step numbers to record for GillespieLongRunStreamFun - about sample_count steps spread logarithmically between 1 and steps-1,
+#so the start of the run (where the proportions change the most) gets as many points as the end
+@njit((types.int64, types.int64), cache=True)
+def log_samples(steps, sample_count):
+    samples = np.unique(np.logspace(0, np.log10(steps - 1), sample_count).astype(np.int64))
+    return np.concatenate((np.zeros(1, dtype=np.int64), samples))
+
+#Same as GillespieLongRunTableFun, but only keeps the cumulative proportions at the steps in sample_steps (a sorted array
+#from linear_samples or log_samples, for example) instead of storing every step. Everything else is kept in a few running
+#totals, so the memory used only depends on the number of samples - runs of 10^10 steps need no more memory than short ones.
+#For the same seed, the samples are exactly the entries of the full arrays from GillespieLongRunTableFun.
+#Returns the time spent in each region (methylated, unmethylated, middle, sort-of methylated), the total time,
+#and the time and cumulative proportions at each sample.
+@njit((types.int64, types.float64[:, ::1], types.int64, types.int64, types.int64, generator_type, types.int64[:]), cache=True)
+def GillespieLongRunStreamFun(steps, rate_table, totalpop, pop_methyl, pop_unmethyl, rng, sample_steps):
+    #define our four amounts of cumulative time spent in different areas, and their sum (the current time)
+    totals = np.zeros(5)
+    #the kth column is the time, and the proportion of cumulative time spent in each state, by step sample_steps[k]
+    samples = np.zeros((4, len(sample_steps)))
+    occupancy_kernel(steps, rate_table, build_occupancy_table(rate_table, totalpop, SAMPLED), totalpop, pop_methyl, pop_unmethyl,
+                     rng, SAMPLED == SAMPLED, totals, None, sample_steps, samples, None)
+
+    return (totals[0], totals[1], totals[2], totals[3], totals[4],
+            samples[0], samples[1], samples[2], samples[3])
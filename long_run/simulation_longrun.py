@@ -1,7 +1,7 @@
 import numpy as np
 import gillespie_longrun as gillespie_longrun
+import ctmc_longrun as ctmc_longrun
 import matplotlib.pyplot as plt
-import numba
 
 """
 Performs a single, very long, gillespie run to see what proportion of time is spent in each state - 
@@ -10,12 +10,22 @@ Performs a single, very long, gillespie run to see what proportion of time is sp
 it is a state where 70% of the sites are either methylated or hemimethylated.
 
 There are no alternate output options for this program - just edit the parameters and run it to get a graph.
+The run only keeps sample_count points of the cumulative proportions (evenly spaced, or logarithmically spaced if
+log_samples is True), so the memory it needs doesn't grow with trial_max_length - 10^10 step runs are fine.
+If you only need the final proportions, set exact_solution to True. This skips the simulation and
+solves for the long-run proportions directly (see ctmc_longrun.py), which takes milliseconds instead of minutes.
 """
 
 
 #-----------parameters - edit here-----------
-#number of steps that the gillespie algorithm will take (large values can cause memory issues, starting around 1,000,000,000)
+#set to True to compute the exact long-run proportions instead of running the simulation
+exact_solution = False
+#number of steps that the gillespie algorithm will take
 trial_max_length = 100000000
+#number of points of the cumulative proportions to keep for the graph - this is what determines the memory used
+sample_count = 1000000
+#set to True to space the samples logarithmically, which shows the start of the run in more detail
+log_samples = False
 #define starting population
 totalpop = 100
 methylatedpop = 50
@@ -62,62 +72,69 @@ parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh
 default_arr = np.array([default_parameters[key] for key in parameter_labels])
 
 #-----------simulation-----------
-@numba.jit()
-def main(rng):
-        methyl_time, unmethyl_time, middle_time, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop = gillespie_longrun.GillespieLongRunFun(trial_max_length, default_arr, totalpop, methylatedpop, unmethylatedpop, rng)
-        return methyl_time,unmethyl_time,middle_time, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop
+#the kernels it calls are compiled (or loaded from the cache) when gillespie_longrun is imported, so this stays plain python
+def main(rng, sample_steps):
+        return gillespie_longrun.GillespieLongRunStreamFun(trial_max_length, gillespie_longrun.build_rate_table(default_arr, totalpop), totalpop, methylatedpop, unmethylatedpop, rng, sample_steps)
     
-#-----------setup-----------
-
-#create a random number generator - this generator can be seeded if desired
-generator = np.random.default_rng()
-
-#-----------Call simulation-----------
-#call our gillespie algorithm and save the raw data
-methylated_time, unmethylated_time, time_in_middle, time_arr, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop = main(generator)
-
-#print the amount of time that our simulation lasted
-total_time = time_arr[-1]
-print(f'Check that everything adds up: \nTotal time: {total_time}')
-
-#calculate the proportion of time that we spent in each state
-total_prop = methyl_cumulative_prop[-1] + unmethyl_cumulative_prop[-1] + sortamethyl_cumulative_prop[-1]
-methylated_prop = methylated_time/total_time
-unmethylated_prop = unmethylated_time/total_time
-time_in_middle_prop = time_in_middle/total_time
-proportions = [methylated_prop,unmethylated_prop,time_in_middle_prop]
-labels = ['methylated_prop','unmethylated_prop','time_in_middle_prop']
-
-#print out the proportions of time that we spent in each state
-print('Proportions:')
-print(f"Methylated : {methylated_prop}, Unmethylated: {unmethylated_prop}, middle: {time_in_middle_prop}, middle (<30% unmethylated) {sortamethyl_cumulative_prop[-1]}")
-print(f"Sum of proportions: {methylated_prop + unmethylated_prop + time_in_middle_prop + sortamethyl_cumulative_prop[-1]}")
-print('Times:')
-print(f"Methylated : {methylated_time}, Unmethylated: {unmethylated_time}, middle: {time_in_middle}, middle (<30% unmethylated) {total_time * sortamethyl_cumulative_prop[-1]}")
-
-#thin out our data by saving only every 100th observation - this makes it easier to graph
-xes = list(range(trial_max_length//100)) 
-#create the arrays that we will use
-methyl_cumulative_prop_thinned = np.zeros(trial_max_length//100)
-unmethyl_cumulative_prop_thinned = np.zeros(trial_max_length//100)
-sortamethyl_cumulative_prop_thinned = np.zeros(trial_max_length//100)
-middle_cumulative_prop_thinned = np.zeros(trial_max_length//100)
-#populate the arrays by picking every 100th number
-for i in range(trial_max_length//100):
-      methyl_cumulative_prop_thinned[i] = methyl_cumulative_prop[i*100]
-      unmethyl_cumulative_prop_thinned[i] = unmethyl_cumulative_prop[i*100]
-      sortamethyl_cumulative_prop_thinned[i] = sortamethyl_cumulative_prop[i*100]
-      middle_cumulative_prop_thinned[i] = 1 - (methyl_cumulative_prop_thinned[i] + unmethyl_cumulative_prop_thinned[i] + sortamethyl_cumulative_prop_thinned[i])
-
-#plot our results
-plt.title(f'Methylated : {methylated_prop:.3f}, Unmethylated: {unmethylated_prop:.3f},\n middle: {time_in_middle_prop:.3f}, middle (<30% unmethylated) {sortamethyl_cumulative_prop[-1]:.3f} \n simulated with {totalpop} sites over {trial_max_length} iterations',fontsize=10)
-plt.xlabel('x-axis samples every hundredth point to improve readability')
-plt.ylabel('cumulative proportion of time spent')
-plt.plot(xes, methyl_cumulative_prop_thinned,label="Methylated")
-plt.plot(xes, unmethyl_cumulative_prop_thinned,label="Unmethylated")
-plt.plot(xes, sortamethyl_cumulative_prop_thinned,label="Sort of methylated")
-plt.plot(xes, middle_cumulative_prop_thinned,label="Transitionary")
-plt.legend(loc='upper right')
-plt.show()
+#-----------exact solution-----------
+if exact_solution:
+    methylated_prop, unmethylated_prop, time_in_middle_prop, sortamethyl_prop = ctmc_longrun.LongRunProportions(default_arr, totalpop)
+    print('Proportions:')
+    print(f"Methylated : {methylated_prop}, Unmethylated: {unmethylated_prop}, middle: {time_in_middle_prop}, middle (<30% unmethylated) {sortamethyl_prop}")
+    print(f"Sum of proportions: {methylated_prop + unmethylated_prop + time_in_middle_prop + sortamethyl_prop}")
+
+    plt.title(f'Methylated : {methylated_prop:.3f}, Unmethylated: {unmethylated_prop:.3f},\n middle: {time_in_middle_prop:.3f}, middle (<30% unmethylated) {sortamethyl_prop:.3f} \n exact long-run proportions with {totalpop} sites',fontsize=10)
+    plt.ylabel('long-run proportion of time spent')
+    plt.bar(["Methylated", "Unmethylated", "Sort of methylated", "Transitionary"], [methylated_prop, unmethylated_prop, sortamethyl_prop, time_in_middle_prop])
+    plt.show()
+else:
+    #-----------setup-----------
+
+    #create a random number generator - this generator can be seeded if desired
+    generator = np.random.default_rng()
+
+    #pick the steps where we record the cumulative proportions
+    if log_samples:
+        sample_steps = gillespie_longrun.log_samples(trial_max_length, sample_count)
+    else:
+        sample_steps = gillespie_longrun.linear_samples(trial_max_length, sample_count)
+
+    #-----------Call simulation-----------
+    #call our gillespie algorithm and save the raw data
+    methylated_time, unmethylated_time, time_in_middle, sortamethyl_time, total_time, sample_times, methyl_cumulative_prop, unmethyl_cumulative_prop, sortamethyl_cumulative_prop = main(generator, sample_steps)
+
+    #print the amount of time that our simulation lasted
+    print(f'Check that everything adds up: \nTotal time: {total_time}')
+
+    #calculate the proportion of time that we spent in each state
+    methylated_prop = methylated_time/total_time
+    unmethylated_prop = unmethylated_time/total_time
+    time_in_middle_prop = time_in_middle/total_time
+    sortamethyl_prop = sortamethyl_time/total_time
+    proportions = [methylated_prop,unmethylated_prop,time_in_middle_prop]
+    labels = ['methylated_prop','unmethylated_prop','time_in_middle_prop']
+
+    #print out the proportions of time that we spent in each state
+    print('Proportions:')
+    print(f"Methylated : {methylated_prop}, Unmethylated: {unmethylated_prop}, middle: {time_in_middle_prop}, middle (<30% unmethylated) {sortamethyl_prop}")
+    print(f"Sum of proportions: {methylated_prop + unmethylated_prop + time_in_middle_prop + sortamethyl_prop}")
+    print('Times:')
+    print(f"Methylated : {methylated_time}, Unmethylated: {unmethylated_time}, middle: {time_in_middle}, middle (<30% unmethylated) {sortamethyl_time}")
+
+    #the rest of the time was spent in the middle
+    middle_cumulative_prop = 1 - (methyl_cumulative_prop + unmethyl_cumulative_prop + sortamethyl_cumulative_prop)
+
+    #plot our results
+    plt.title(f'Methylated : {methylated_prop:.3f}, Unmethylated: {unmethylated_prop:.3f},\n middle: {time_in_middle_prop:.3f}, middle (<30% unmethylated) {sortamethyl_prop:.3f} \n simulated with {totalpop} sites over {trial_max_length} iterations',fontsize=10)
+    plt.xlabel(f'step ({len(sample_steps)} {"logarithmically" if log_samples else "evenly"} spaced samples)')
+    plt.ylabel('cumulative proportion of time spent')
+    if log_samples:
+        plt.xscale('log')
+    plt.plot(sample_steps, methyl_cumulative_prop,label="Methylated")
+    plt.plot(sample_steps, unmethyl_cumulative_prop,label="Unmethylated")
+    plt.plot(sample_steps, sortamethyl_cumulative_prop,label="Sort of methylated")
+    plt.plot(sample_steps, middle_cumulative_prop,label="Transitionary")
+    plt.legend(loc='upper right')
+    plt.show()
       
         
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+The simulation core shared by every folder of this repository.
+
+- model.py: the rate model - the event rates, the events, how states are classified, and the rate table
+- occupancy.py: the estimators and tables for adding up the time spent in each region, and the convergence window
+- engine.py: the simulation loops, which every table-based gillespie simulation runs through
+- ctmc.py: the generator matrix of the exact (Markov chain) solvers in the ctmc files of each folder, and the exact
+  long-run proportions
+- tau_leap.py: an approximate (tau-leaping) switching simulation for large site counts
+- loci.py: many independent domains (loci) with their own parameters, simulated together in one parallel loop, either
+  dividing on their own or inside cells that divide together
+- sweep.py: a whole parameter sweep (every parameter value x every replica) of switching simulations in one balanced
+  parallel loop, for the sweep_scheduler.py files
+- process_runner.py: the same sweep split over several processes or machines, for the process_runner.py files
+
+The gillespie files in each folder (gillespie_time.py, gillespie_coordinate.py, gillespie_longrun.py and simple_sim.py)
+are thin front-ends over this package - they keep their own function names and return values, so the scripts that use
+them don't change. Each of them puts the top folder of the repository on sys.path so that this package can be imported.
+"""
+
+from .model import (COLLABORATIVE_PARAMETERS, scale_parameters, generator_type, maintenance_rate_collaborative,
+                    denovo_rate_collaborative, demaintenance_rate_collaborative, demethylation_rate_collaborative, birth_rate,
+                    find_state, classify_state, switch_cutoff, find_state_cutoff, region_cutoffs, classify_state_cutoff, site_event,
+                    events, choose_event, spawn_generators, state_index, build_rate_table, select_event)
+from .occupancy import (SAMPLED, EXPECTED, EMBEDDED, ESTIMATORS, region_column, build_occupancy_table, batch_means_error,
+                        window_add, window_refresh, window_rmsd, converges)
+from .engine import advance, switch_kernel, switch_table_kernel, occupancy_kernel
+from .ctmc import (state_count, build_generator, switch_region, generator_matrix, stationary_distribution, aggregate_regions,
+                   LongRunProportions)
+from .tau_leap import EXACT_EVENTS, EXACT_RUN, site_rates, leap_size, leap_switch_kernel
+from .loci import (loci_switch_kernel, occupancy_until, loci_occupancy_kernel, loci_arrays, LociSwitchingTimes,
+                   LociOccupancy, cell_division_kernel, CellOccupancy)
+from .sweep import run_sweep, RunSweep, print_utilisation
+from .process_runner import RunSweepProcesses, CreateQueue, RunQueueWorker, CollectQueue
@@ -0,0 +1,143 @@
+import numpy as np
+from numba import njit
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_linalg
+from .model import (maintenance_rate_collaborative, denovo_rate_collaborative, demaintenance_rate_collaborative,
+                    demethylation_rate_collaborative, birth_rate, find_state, classify_state, site_event, state_index)
+
+"""
+The exact side of the model: the generator matrix of the continuous-time Markov chain over every (methylated,
+unmethylated) state, built from the same rate functions and events as the simulations.
+
+The ctmc files of each folder (ctmc_time.py, ctmc_coordinate.py, ctmc_longrun.py) solve different linear systems
+with it - hitting times, where the switch lands, and the stationary distribution - but they all start from
+build_generator. Its rows are numbered with model.state_index, the same numbering as the rate table.
+
+The long-run solver (LongRunProportions) is used by both long_run and classifying_viable_space, so it lives here too:
+it solves for the stationary distribution and adds up the probability of every state in each region. For 100 sites
+there are only 5,151 states, so this takes milliseconds, and the answer is exact (up to floating point) - there is no
+need to check for convergence like the long-run simulations do.
+"""
+
+#number of states with methylated + unmethylated <= totalpop
+@njit(cache=True)
+def state_count(totalpop):
+    return ((totalpop+1)*(totalpop+2))//2
+
+#This function builds the generator matrix in coordinate form (rows, columns, values).
+#Each of the four single-site events moves to one neighbouring state (model.site_event). The birth event moves to
+#(0, unmethylated + k), where k is binomially distributed just like in model.events.
+@njit(cache=True)
+def build_generator(param_arr, totalpop):
+    n_states = state_count(totalpop)
+    #each state has at most 4 single-site events, totalpop+1 birth targets, and one diagonal entry
+    max_entries = n_states * (totalpop + 6)
+    rows = np.zeros(max_entries, dtype=np.int64)
+    cols = np.zeros(max_entries, dtype=np.int64)
+    vals = np.zeros(max_entries)
+    rates = np.zeros(4)
+    count = 0
+
+    for methylated in range(totalpop+1):
+        for unmethylated in range(totalpop+1-methylated):
+            source = state_index(methylated, unmethylated, totalpop)
+            hemimethylated = totalpop - (methylated + unmethylated)
+            rates[0] = maintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            rates[1] = denovo_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            rates[2] = demaintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            rates[3] = demethylation_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            exit_rate = 0.0
+
+            #single-site events - same moves as events() with i_local = 0..3
+            for event_number in range(4):
+                if rates[event_number] <= 0:
+                    continue
+                target_methylated, target_unmethylated = site_event(methylated, unmethylated, event_number)
+                rows[count] = source
+                cols[count] = state_index(target_methylated, target_unmethylated, totalpop)
+                vals[count] = rates[event_number]
+                exit_rate += rates[event_number]
+                count += 1
+
+            #birth event - half of the hemimethylated sites become unmethylated on average
+            division_rate = birth_rate(param_arr)
+            if division_rate > 0:
+                probability = 0.5**hemimethylated
+                for newly_unmethylated in range(hemimethylated+1):
+                    target = state_index(0, unmethylated + newly_unmethylated, totalpop)
+                    #a birth that doesn't change the state isn't a transition
+                    if target != source:
+                        rows[count] = source
+                        cols[count] = target
+                        vals[count] = division_rate * probability
+                        exit_rate += division_rate * probability
+                        count += 1
+                    probability *= (hemimethylated - newly_unmethylated) / (newly_unmethylated + 1)
+
+            rows[count] = source
+            cols[count] = source
+            vals[count] = -exit_rate
+            count += 1
+
+    return rows[:count], cols[:count], vals[:count]
+
+#Marks every state where find_state == SwitchDirection - these are the absorbing states of the switching solvers
+@njit(cache=True)
+def switch_region(totalpop, SwitchDirection):
+    in_region = np.zeros(state_count(totalpop), dtype=np.bool_)
+    for methylated in range(totalpop+1):
+        for unmethylated in range(totalpop+1-methylated):
+            if find_state(methylated, unmethylated, totalpop) == SwitchDirection:
+                in_region[state_index(methylated, unmethylated, totalpop)] = True
+    return in_region
+
+#Returns the generator matrix as a scipy sparse matrix. Row i holds the rates out of state i.
+def generator_matrix(param_arr, totalpop):
+    rows, cols, vals = build_generator(np.asarray(param_arr, dtype=np.float64), totalpop)
+    n_states = state_count(totalpop)
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(n_states, n_states))
+
+#Returns the stationary distribution pi, which solves pi Q = 0 with sum(pi) = 1.
+#We replace the last equation with the normalization condition to get a nonsingular system.
+def stationary_distribution(param_arr, totalpop):
+    rows, cols, vals = build_generator(np.asarray(param_arr, dtype=np.float64), totalpop)
+    n_states = state_count(totalpop)
+    #transpose by swapping rows and columns, then drop the equations for the last state
+    keep = cols != n_states - 1
+    system_rows = np.concatenate((cols[keep], np.full(n_states, n_states - 1)))
+    system_cols = np.concatenate((rows[keep], np.arange(n_states)))
+    system_vals = np.concatenate((vals[keep], np.ones(n_states)))
+    system = sparse.csc_matrix((system_vals, (system_rows, system_cols)), shape=(n_states, n_states))
+    right_side = np.zeros(n_states)
+    right_side[-1] = 1
+    stationary = sparse_linalg.spsolve(system, right_side)
+    #clean up tiny negative values caused by round-off
+    stationary = np.maximum(stationary, 0)
+    return stationary / np.sum(stationary)
+
+#Adds up the stationary distribution over each region, using the same classify_state as the simulation
+@njit(cache=True)
+def aggregate_regions(stationary, totalpop):
+    methyl_prop = 0.0
+    unmethyl_prop = 0.0
+    middle_prop = 0.0
+    sortamethyl_prop = 0.0
+    for methylated in range(totalpop+1):
+        for unmethylated in range(totalpop+1-methylated):
+            probability = stationary[state_index(methylated, unmethylated, totalpop)]
+            curr_state = classify_state(methylated, unmethylated, totalpop)
+            if curr_state == 1:
+                methyl_prop += probability
+            elif curr_state == -1:
+                unmethyl_prop += probability
+            elif curr_state == 2:
+                sortamethyl_prop += probability
+            else:
+                middle_prop += probability
+    return methyl_prop, unmethyl_prop, middle_prop, sortamethyl_prop
+
+#Exact version of the long-run proportions. Returns (methylated, unmethylated, middle, sort-of methylated).
+#Unlike the simulation, the starting population doesn't matter - the long-run behavior is the same from every state.
+def LongRunProportions(param_arr, totalpop):
+    stationary = stationary_distribution(param_arr, totalpop)
+    return aggregate_regions(stationary, totalpop)
@@ -0,0 +1,231 @@
+import numpy as np
+from numba import njit, types
+from .model import (generator_type, maintenance_rate_collaborative, denovo_rate_collaborative, demaintenance_rate_collaborative,
+                    demethylation_rate_collaborative, birth_rate, switch_cutoff, find_state_cutoff, events, choose_event, state_index,
+                    select_event)
+from .occupancy import window_add, window_refresh, window_rmsd, converges
+
+"""
+The simulation loops. Every gillespie step in the table-based simulations is the one in `advance`, and there are two
+loops that take it:
+- switch_table_kernel runs until the state switches (or times out), for the switching time and coordinate simulations
+- occupancy_kernel runs a long simulation and adds up the time spent in each region, for the long-run simulations
+
+What occupancy_kernel observes along the way is chosen by which optional arguments are arrays and which are None -
+the batches for the standard errors, the proportions at given sample steps, and the convergence window. Numba compiles
+a separate version of the loop for every combination it is called with, and a None argument removes its code from
+that version entirely (just like the trajectory of switch_kernel), so a simulation only pays for what it records.
+Unlike passing hook functions as arguments, this keeps the compiled versions in the on-disk cache.
+"""
+
+#Takes one gillespie step from (methylated, unmethylated) with a rate table from model.build_rate_table.
+#If sample_wait is True the time the step took is drawn (like every simulation used to do), otherwise it is returned
+#as 1.0 and nothing is drawn - the estimators that use the expected holding time don't need it.
+#Returns the row of the state the step started from, the time it took, and the new state.
+#The loops below write the same step out in full: calling a function with the rate table and the generator on every
+#step costs about 30 ns on top of the ~70 ns of the step itself, because both are reference counted on the way in and out.
+@njit(cache=True)
+def advance(rate_table, totalpop, methylated, unmethylated, rng, sample_wait):
+    row = state_index(methylated, unmethylated, totalpop)
+    cumulative_rates = rate_table[row]
+    rate_sum = cumulative_rates[4]
+
+    #find the expected wait for an event to happen
+    wait = 1.0
+    if sample_wait:
+        wait = rng.exponential(scale = 1/rate_sum)
+
+    #select which event happens with a binary search over the cumulative rates
+    event_number = select_event(cumulative_rates, rng.uniform() * rate_sum)
+    methylated, unmethylated = events(methylated, unmethylated, totalpop, event_number, rng)
+    return row, wait, methylated, unmethylated
+
+#Runs a single simulation until it reaches SwitchDirection or times out after `steps` steps.
+#The state is kept in plain integers and the rates in local variables, so nothing is allocated per run.
+#If trajectory is a (3, steps) array, the methylated count, unmethylated count and time of every step are written into its rows.
+#If trajectory is None, numba removes the recording code entirely.
+#Returns the time of the switch (negative if we timed out), the final state, and how many steps were recorded.
+@njit(cache=True)
+def switch_kernel(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng, trajectory):
+    curr_methylated = pop_methyl
+    curr_unmethylated = pop_unmethyl
+    curr_time = 0.0
+    cutoff = switch_cutoff(totalpop)
+    if trajectory is not None:
+        trajectory[0, 0] = pop_methyl
+        trajectory[1, 0] = pop_unmethyl
+        trajectory[2, 0] = 0
+
+    #main loop - each generation or step is one iteration of this loop
+    for i in range(1, steps): #start at 1, since the first step is given by pop_methyl/pop_unmethyl
+
+        #find the rates of each event for the current parameters
+        rate_0 = maintenance_rate_collaborative(curr_methylated,curr_unmethylated,totalpop,param_arr)
+        rate_1 = denovo_rate_collaborative(curr_methylated,curr_unmethylated,totalpop,param_arr)
+        rate_2 = demaintenance_rate_collaborative(curr_methylated,curr_unmethylated,totalpop,param_arr)
+        rate_3 = demethylation_rate_collaborative(curr_methylated,curr_unmethylated,totalpop,param_arr)
+        rate_4 = birth_rate(param_arr)
+        rate_sum = rate_0 + rate_1 + rate_2 + rate_3 + rate_4
+
+        #find the expected wait for an event to happen
+        tau = rng.exponential(scale = 1/rate_sum)
+        curr_time += tau
+
+        #select which event happens by comparing the normalized rates to a random variable
+        event_number = choose_event(rng.uniform(), rate_0, rate_1, rate_2, rate_3, rate_4, rate_sum)
+        if event_number >= 0:
+            curr_methylated, curr_unmethylated = events(curr_methylated, curr_unmethylated, totalpop,event_number,rng)
+        if trajectory is not None:
+            trajectory[0, i] = curr_methylated
+            trajectory[1, i] = curr_unmethylated
+            trajectory[2, i] = curr_time
+
+        # decide which state we are in - if we switched, this block will terminate the program
+        if find_state_cutoff(curr_methylated, curr_unmethylated, cutoff) == SwitchDirection:
+            return curr_time, curr_methylated, curr_unmethylated, i + 1
+
+    #we timed out - return a negative value to indicate that this isn't a normal run.
+    return -1 * curr_time, curr_methylated, curr_unmethylated, steps
+
+#Same as switch_kernel, but looks up the rates in a table from build_rate_table instead of recomputing them every step.
+#Returns the time of the switch (negative if we timed out), the final state, and how many steps were taken.
+@njit((types.int64, types.float64[:, ::1], types.int64, types.int64, types.int64, types.int64, generator_type), cache=True)
+def switch_table_kernel(steps, rate_table, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng):
+    curr_methylated = pop_methyl
+    curr_unmethylated = pop_unmethyl
+    curr_time = 0.0
+    cutoff = switch_cutoff(totalpop)
+
+    #main loop - each generation or step is one iteration of this loop
+    for i in range(1, steps): #start at 1, since the first step is given by pop_methyl/pop_unmethyl
+        cumulative_rates = rate_table[state_index(curr_methylated, curr_unmethylated, totalpop)]
+        rate_sum = cumulative_rates[4]
+
+        #find the expected wait for an event to happen
+        tau = rng.exponential(scale = 1/rate_sum)
+        curr_time += tau
+
+        #select which event happens with a binary search over the cumulative rates
+        event_number = select_event(cumulative_rates, rng.uniform() * rate_sum)
+        curr_methylated, curr_unmethylated = events(curr_methylated, curr_unmethylated, totalpop,event_number,rng)
+
+        # decide which state we are in - if we switched, this block will terminate the program
+        if find_state_cutoff(curr_methylated, curr_unmethylated, cutoff) == SwitchDirection:
+            return curr_time, curr_methylated, curr_unmethylated, i
+
+    #we timed out - return a negative value to indicate that this isn't a normal run.
+    return -1 * curr_time, curr_methylated, curr_unmethylated, steps - 1
+
+#Runs a long simulation and adds up the time spent in each region with an occupancy table from
+#occupancy.build_occupancy_table: every visit to a state adds wait * (its row of the table) to totals, where wait is the
+#sampled holding time if sample_wait is True and 1 otherwise. totals is a caller-supplied array of 5 - the time in each
+#region (methylated, unmethylated, middle, sort-of methylated) and the total time. The optional observers are:
+#- batch_sums: a (batch_count, 5) array - the run is split into batch_count batches of consecutive steps, and each
+#  batch is also added up on its own (see occupancy.batch_means_error)
+#- sample_steps and samples: a sorted array of step numbers, and a (4, len(sample_steps)) array that gets the total
+#  time and the methylated, unmethylated and sort-of methylated proportions at each of those steps
+#- convergence: a (tolerances, sample_n_steps, window_size) tuple - every sample_n_steps steps the proportions
+#  (methylated, unmethylated, sort-of methylated, middle) are added to a rolling window of window_size samples, and the
+#  run stops once the RMSD of every proportion over a full window is below its tolerance
+#Each of them can be None, which compiles the loop without it.
+#Callers should pass sample_wait as a computed bool (e.g. SAMPLED == SAMPLED) rather than the constant True - numba
+#compiles a separate copy of the loop for a constant, with the branch removed, and that copy runs about 40% slower.
+#Returns the step where the run stopped (steps - 1 unless it converged).
+@njit(cache=True)
+def occupancy_kernel(steps, rate_table, occupancy_table, totalpop, pop_methyl, pop_unmethyl, rng, sample_wait, totals,
+                     batch_sums, sample_steps, samples, convergence):
+    curr_methylated = pop_methyl
+    curr_unmethylated = pop_unmethyl
+
+    if batch_sums is not None:
+        batch_count = batch_sums.shape[0]
+        batch_length = max(1, (steps - 1) // batch_count)
+        batch = 0
+        batch_steps = 0
+
+    if sample_steps is not None:
+        #step 0 has no time in any state yet, so its samples stay at 0
+        next_sample = 0
+        while next_sample < len(sample_steps) and sample_steps[next_sample] <= 0:
+            next_sample += 1
+
+    if convergence is not None:
+        tolerances, sample_n_steps, window_size = convergence
+        #the rolling window of proportions - see occupancy.window_add
+        window = np.zeros((4, window_size))
+        sums = np.zeros(4)
+        sums_sq = np.zeros(4)
+        sample = np.zeros(4)
+        rmsd = np.zeros(4)
+
+    #the running totals are kept in local variables, which the compiler can keep in registers (it can't for an array
+    #argument, since it might share memory with the other arrays), and written back to totals at the end
+    methyl_time = totals[0]
+    unmethyl_time = totals[1]
+    middle_time = totals[2]
+    sortamethyl_time = totals[3]
+    total_time = totals[4]
+    stop_step = steps - 1
+
+    #main loop - each generation or step is one iteration of this loop
+    for i in range(1, steps): #start at 1, since the first step is given by pop_methyl/pop_unmethyl
+        row = state_index(curr_methylated, curr_unmethylated, totalpop)
+        cumulative_rates = rate_table[row]
+        rate_sum = cumulative_rates[4]
+
+        #only the sampled estimator needs the actual wait for the event
+        wait = 1.0
+        if sample_wait:
+            wait = rng.exponential(scale = 1/rate_sum)
+        #select which event happens with a binary search over the cumulative rates
+        event_number = select_event(cumulative_rates, rng.uniform() * rate_sum)
+
+        #add the time in the state we were in BEFORE the step
+        methyl_time += wait * occupancy_table[row, 0]
+        unmethyl_time += wait * occupancy_table[row, 1]
+        middle_time += wait * occupancy_table[row, 2]
+        sortamethyl_time += wait * occupancy_table[row, 3]
+        total_time += wait * occupancy_table[row, 4]
+
+        if batch_sums is not None:
+            for column in range(5):
+                batch_sums[batch, column] += wait * occupancy_table[row, column]
+            batch_steps += 1
+            if batch_steps == batch_length and batch < batch_count - 1:
+                batch += 1
+                batch_steps = 0
+
+        #record the proportions if this step is one of our samples
+        if sample_steps is not None:
+            if next_sample < len(sample_steps) and sample_steps[next_sample] == i:
+                samples[0, next_sample] = total_time
+                samples[1, next_sample] = methyl_time / total_time
+                samples[2, next_sample] = unmethyl_time / total_time
+                samples[3, next_sample] = sortamethyl_time / total_time
+                next_sample += 1
+
+        curr_methylated, curr_unmethylated = events(curr_methylated, curr_unmethylated, totalpop, event_number, rng)
+
+        #add the proportions to the window every sample_n_steps steps, and stop if they have converged
+        if convergence is not None:
+            if i % sample_n_steps == 0:
+                index = (i // sample_n_steps) % window_size
+                sample[0] = methyl_time / total_time
+                sample[1] = unmethyl_time / total_time
+                sample[2] = sortamethyl_time / total_time
+                sample[3] = middle_time / total_time
+                window_add(window, sums, sums_sq, index, sample)
+                if index == window_size - 1:
+                    window_refresh(window, sums, sums_sq)
+                window_rmsd(window, sums, sums_sq, rmsd)
+                #only stop once the window is full of real samples
+                if i >= sample_n_steps * window_size and converges(rmsd, tolerances):
+                    stop_step = i
+                    break
+
+    totals[0] = methyl_time
+    totals[1] = unmethyl_time
+    totals[2] = middle_time
+    totals[3] = sortamethyl_time
+    totals[4] = total_time
+    return stop_step
@@ -0,0 +1,227 @@
+import numpy as np
+import numba
+from numba import njit, prange, types
+from .model import (generator_type, maintenance_rate_collaborative, denovo_rate_collaborative, demaintenance_rate_collaborative,
+                    demethylation_rate_collaborative, birth_rate, region_cutoffs, classify_state_cutoff, events, choose_event,
+                    spawn_generators)
+from .engine import switch_kernel
+
+"""
+Many independent domains (loci) simulated together.
+
+Every entry point in the folders simulates one (methylated, unmethylated) system per call, so simulating K genomic
+regions with different parameters means K calls from python. Here the K domains are kept as a structure of arrays -
+a (K, 13) matrix of parameter vectors, and arrays of K site counts, methylated counts, unmethylated counts and clocks -
+and advanced together in one parallel loop. The domains are split into chunks of chunk_size consecutive domains. Each
+chunk is one work item of the loop and owns one random number generator (see model.spawn_generators), so with a fixed
+seed the results don't depend on the number of threads. Every domain has its own parameters, so the rates are
+recomputed on every step like in engine.switch_kernel - a rate table per domain would take longer to build than most
+runs take.
+
+The kernels update the state arrays in place, so a batch can be advanced over several calls: loci_switch_kernel only
+runs the domains that haven't switched yet, and loci_occupancy_kernel moves every domain on by the same amount of time.
+LociSwitchingTimes and LociOccupancy do the whole thing for a batch from the starting counts.
+
+In those, every domain divides on its own (the birth event of model.events, at its own birth_rate). In a real cell all
+of the loci divide together, so cell_division_kernel simulates whole cells instead: every cell carries one copy of
+each domain and a single division clock. The time to the next division is drawn once per cell, every domain of the
+cell is simulated up to it without the birth event (they are independent in between, and the birth rate doesn't have
+to be added to every domain's rates), and then the binomial split of model.events is applied to all of them at once.
+Here the work items are the cells, each with its own generator. CellOccupancy runs it from the starting counts.
+"""
+
+#Runs every domain that hasn't switched yet (switch_times[k] is nan) for up to `steps` more steps, or until it reaches
+#SwitchDirection. Domain k continues from (methylated[k], unmethylated[k]) at time clocks[k], and all three are
+#updated in place. When it switches, the time of the switch is written into switch_times[k].
+#Domain k uses the generator rngs[k // chunk_size].
+#Returns the number of steps each chunk took.
+@njit((types.float64[:, ::1], types.int64[::1], types.int64[::1], types.int64[::1], types.float64[::1], types.float64[::1], types.int64, types.int64,
+       types.List(generator_type, reflected=True), types.int64), parallel=True, cache=True)
+def loci_switch_kernel(param_matrix, site_counts, methylated, unmethylated, clocks, switch_times, SwitchDirection, steps, rngs, chunk_size):
+    domain_count = param_matrix.shape[0]
+    chunk_count = -(-domain_count // chunk_size)
+    chunk_steps = np.zeros(chunk_count, dtype=np.int64)
+
+    for chunk in prange(chunk_count):
+        rng = rngs[chunk]
+        for k in range(chunk*chunk_size, min(domain_count, (chunk+1)*chunk_size)):
+            if not np.isnan(switch_times[k]):
+                continue
+            #switch_kernel counts the state it starts from as its first step
+            curr_time, curr_methylated, curr_unmethylated, run_steps = switch_kernel(steps + 1, param_matrix[k], site_counts[k], methylated[k],
+                                                                                     unmethylated[k], SwitchDirection, rng, None)
+            methylated[k] = curr_methylated
+            unmethylated[k] = curr_unmethylated
+            #a negative time means we ran out of steps before switching
+            clocks[k] += abs(curr_time)
+            if curr_time >= 0:
+                switch_times[k] = clocks[k]
+            chunk_steps[chunk] += run_steps - 1
+
+    return chunk_steps
+
+#Simulates one domain from curr_time until end_time, and adds the time it spends in each region to occupancy
+#(methylated, unmethylated, middle, sort-of methylated - the same order as GillespieLongRunTableFun).
+#The waits are exponential, so the step that would go past end_time can just be cut off there: the next call draws a
+#fresh wait from the same state, which gives the same distribution as carrying on.
+#If births is False the birth event is left out, for cells whose divisions are driven from outside (see cell_division_kernel).
+#Returns the new state and the number of steps taken.
+@njit(cache=True)
+def occupancy_until(param_arr, totalpop, methylated, unmethylated, curr_time, end_time, rng, occupancy, births):
+    high_cutoff, low_cutoff = region_cutoffs(totalpop)
+    steps_taken = 0
+    while curr_time < end_time:
+        #find the rates of each event for the current parameters
+        rate_0 = maintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+        rate_1 = denovo_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+        rate_2 = demaintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+        rate_3 = demethylation_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+        rate_4 = 0.0
+        if births:
+            rate_4 = birth_rate(param_arr)
+        rate_sum = rate_0 + rate_1 + rate_2 + rate_3 + rate_4
+
+        #nothing can happen in this state, so the domain stays in it until end_time
+        wait = end_time - curr_time
+        if rate_sum > 0:
+            wait = min(wait, rng.exponential(scale = 1/rate_sum))
+
+        #add the time in the state we were in BEFORE the step
+        curr_state = classify_state_cutoff(methylated, unmethylated, high_cutoff, low_cutoff)
+        if curr_state == 1:
+            occupancy[0] += wait
+        elif curr_state == -1:
+            occupancy[1] += wait
+        elif curr_state == 2:
+            occupancy[3] += wait
+        else:
+            occupancy[2] += wait
+        curr_time += wait
+        if curr_time >= end_time:
+            break
+
+        #select which event happens by comparing the normalized rates to a random variable
+        event_number = choose_event(rng.uniform(), rate_0, rate_1, rate_2, rate_3, rate_4, rate_sum)
+        if event_number >= 0:
+            methylated, unmethylated = events(methylated, unmethylated, totalpop, event_number, rng)
+        steps_taken += 1
+
+    return methylated, unmethylated, steps_taken
+
+#Moves every domain on by `duration` units of time, and adds the time each one spends in each region to its row of
+#occupancy, a (K, 4) array. The state arrays and clocks are updated in place, like in loci_switch_kernel.
+#Returns the number of steps each chunk took.
+@njit((types.float64[:, ::1], types.int64[::1], types.int64[::1], types.int64[::1], types.float64[::1], types.float64[:, ::1], types.float64,
+       types.List(generator_type, reflected=True), types.int64), parallel=True, cache=True)
+def loci_occupancy_kernel(param_matrix, site_counts, methylated, unmethylated, clocks, occupancy, duration, rngs, chunk_size):
+    domain_count = param_matrix.shape[0]
+    chunk_count = -(-domain_count // chunk_size)
+    chunk_steps = np.zeros(chunk_count, dtype=np.int64)
+
+    for chunk in prange(chunk_count):
+        rng = rngs[chunk]
+        for k in range(chunk*chunk_size, min(domain_count, (chunk+1)*chunk_size)):
+            curr_methylated, curr_unmethylated, steps_taken = occupancy_until(param_matrix[k], site_counts[k], methylated[k], unmethylated[k], clocks[k],
+                                                                              clocks[k] + duration, rng, occupancy[k], True)
+            methylated[k] = curr_methylated
+            unmethylated[k] = curr_unmethylated
+            clocks[k] += duration
+            chunk_steps[chunk] += steps_taken
+
+    return chunk_steps
+
+#Moves cell_count cells on by `duration` units of time. Every cell carries every domain of the batch (row k of
+#param_matrix with site_counts[k] sites), and methylated and unmethylated are (cell_count, K) arrays of their counts.
+#The cells divide at division_rate - column 12 of param_matrix (birth_rate) isn't used - and a division splits every
+#domain of the cell (event 4 of model.events). Cell c uses the generator rngs[c], and continues from clocks[c].
+#The states and clocks are updated in place, like in loci_occupancy_kernel.
+#The time the cells spend in each region is added up per domain, over all cells, in one (K, 4) array per thread -
+#thread_count must be at least the number of threads numba can use (see sweep_scheduler.run_sweep).
+#Returns the per-thread occupancy (sum it over the first axis), the number of divisions of each cell and the number of
+#steps each cell took.
+@njit((types.float64[:, ::1], types.int64[::1], types.int64[:, ::1], types.int64[:, ::1], types.float64[::1], types.float64, types.float64,
+       types.List(generator_type, reflected=True), types.int64), parallel=True, cache=True)
+def cell_division_kernel(param_matrix, site_counts, methylated, unmethylated, clocks, division_rate, duration, rngs, thread_count):
+    cell_count, domain_count = methylated.shape
+    thread_occupancy = np.zeros((thread_count, domain_count, 4))
+    divisions = np.zeros(cell_count, dtype=np.int64)
+    cell_steps = np.zeros(cell_count, dtype=np.int64)
+
+    for cell in prange(cell_count):
+        rng = rngs[cell]
+        occupancy = thread_occupancy[numba.get_thread_id()]
+        curr_time = clocks[cell]
+        end_time = curr_time + duration
+        while curr_time < end_time:
+            #the divisions are the only thing the domains of a cell share, so each of them can run up to the next one on its own
+            next_division = np.inf
+            if division_rate > 0:
+                next_division = curr_time + rng.exponential(scale = 1/division_rate)
+            interval_end = min(next_division, end_time)
+            for k in range(domain_count):
+                curr_methylated, curr_unmethylated, steps_taken = occupancy_until(param_matrix[k], site_counts[k], methylated[cell, k], unmethylated[cell, k],
+                                                                                  curr_time, interval_end, rng, occupancy[k], False)
+                methylated[cell, k] = curr_methylated
+                unmethylated[cell, k] = curr_unmethylated
+                cell_steps[cell] += steps_taken
+            curr_time = interval_end
+
+            #the cell divides - every domain loses about half of its methylation at once
+            if next_division < end_time:
+                for k in range(domain_count):
+                    curr_methylated, curr_unmethylated = events(methylated[cell, k], unmethylated[cell, k], site_counts[k], 4, rng)
+                    methylated[cell, k] = curr_methylated
+                    unmethylated[cell, k] = curr_unmethylated
+                divisions[cell] += 1
+        clocks[cell] = end_time
+
+    return thread_occupancy, divisions, cell_steps
+
+#Turns the inputs of LociSwitchingTimes/LociOccupancy into the arrays of the kernels. site_counts, pop_methyl and
+#pop_unmethyl can be arrays of K values or single values for every domain.
+def loci_arrays(param_matrix, site_counts, pop_methyl, pop_unmethyl):
+    param_matrix = np.ascontiguousarray(np.atleast_2d(param_matrix), dtype=np.float64)
+    domain_count = param_matrix.shape[0]
+    site_counts = np.array(np.broadcast_to(site_counts, domain_count), dtype=np.int64)
+    methylated = np.array(np.broadcast_to(pop_methyl, domain_count), dtype=np.int64)
+    unmethylated = np.array(np.broadcast_to(pop_unmethyl, domain_count), dtype=np.int64)
+    return param_matrix, site_counts, methylated, unmethylated, np.zeros(domain_count)
+
+#Simulates every domain until it switches to SwitchDirection, like GillespieSwitchFun with row k of param_matrix
+#(already scaled for its site count, see model.scale_parameters). trial_max_length is the time-out in steps, counted
+#the same way as the steps of GillespieSwitchFun.
+#Returns the switching times (negative for time-outs, like GillespieSwitchFun) and the total number of steps.
+def LociSwitchingTimes(param_matrix, site_counts, pop_methyl, pop_unmethyl, SwitchDirection, trial_max_length, seed=None, chunk_size=64):
+    param_matrix, site_counts, methylated, unmethylated, clocks = loci_arrays(param_matrix, site_counts, pop_methyl, pop_unmethyl)
+    switch_times = np.full(len(clocks), np.nan)
+    rngs = spawn_generators(-(-len(clocks) // chunk_size), seed)
+    chunk_steps = loci_switch_kernel(param_matrix, site_counts, methylated, unmethylated, clocks, switch_times, SwitchDirection,
+                                     trial_max_length - 1, rngs, chunk_size)
+    timed_out = np.isnan(switch_times)
+    switch_times[timed_out] = -clocks[timed_out]
+    return switch_times, np.sum(chunk_steps)
+
+#Simulates every domain for `duration` units of time and returns the proportion of it spent in each region, as a (K, 4)
+#array with the columns methylated, unmethylated, middle and sort-of methylated (the order of GillespieLongRunTableFun),
+#together with the total number of steps.
+def LociOccupancy(param_matrix, site_counts, pop_methyl, pop_unmethyl, duration, seed=None, chunk_size=64):
+    param_matrix, site_counts, methylated, unmethylated, clocks = loci_arrays(param_matrix, site_counts, pop_methyl, pop_unmethyl)
+    occupancy = np.zeros((len(clocks), 4))
+    rngs = spawn_generators(-(-len(clocks) // chunk_size), seed)
+    chunk_steps = loci_occupancy_kernel(param_matrix, site_counts, methylated, unmethylated, clocks, occupancy, duration, rngs, chunk_size)
+    return occupancy / duration, np.sum(chunk_steps)
+
+#Simulates cell_count cells that each carry every domain of the batch and divide together at division_rate (see
+#cell_division_kernel) for `duration` units of time, starting from the same counts in every cell.
+#Returns the proportion of time spent in each region by every domain, over all of the cells, as a (K, 4) array in the
+#same order as LociOccupancy, the final (cell_count, K) methylated and unmethylated counts, the number of divisions of
+#each cell and the total number of steps.
+def CellOccupancy(param_matrix, site_counts, pop_methyl, pop_unmethyl, cell_count, division_rate, duration, seed=None):
+    param_matrix, site_counts, methylated, unmethylated, clocks = loci_arrays(param_matrix, site_counts, pop_methyl, pop_unmethyl)
+    methylated = np.tile(methylated, (cell_count, 1))
+    unmethylated = np.tile(unmethylated, (cell_count, 1))
+    clocks = np.zeros(cell_count)
+    rngs = spawn_generators(cell_count, seed)
+    thread_occupancy, divisions, cell_steps = cell_division_kernel(param_matrix, site_counts, methylated, unmethylated, clocks, division_rate, duration,
+                                                                   rngs, numba.config.NUMBA_NUM_THREADS)
+    return np.sum(thread_occupancy, axis=0) / (cell_count * duration), methylated, unmethylated, divisions, np.sum(cell_steps)
@@ -0,0 +1,229 @@
+import numpy as np
+from numba import njit, typeof, types
+
+"""
+The rate model shared by every simulation: the five events, their rates, and how states are classified.
+
+A state is a (methylated, unmethylated) pair with methylated + unmethylated <= totalpop - the hemimethylated count is
+whatever is left. The rates of events 0-3 only depend on the state and the first 12 parameters, and the birth rate is
+parameter 12 (see the parameter dictionaries in the simulation files for the order).
+
+The engine (engine.py) never calls the rate functions itself - it only looks up rows of the table from build_rate_table,
+which holds the cumulative sums of the five rates for every state. So another rate model can be plugged in by building
+a table with the same layout (one row per state_index, cumulative rates of events 0-4 in order), as long as the events
+themselves are the ones in `events`.
+"""
+
+#The collaborative parameters (r_hm_m, r_hm_h, r_uh_m, r_uh_h, r_mh_u, r_mh_h, r_hu_u, r_hu_h) multiply a count of sites
+#in the rates, so they are usually given per site - the parameter dictionaries write them as 20/totalpop and so on.
+#scale_parameters does that division for any number of sites, so the same per-site parameters can be used for every
+#site count: scale_parameters(per_site, totalpop) with per_site["r_hm_m"] = 20 is the usual 20/totalpop.
+COLLABORATIVE_PARAMETERS = np.array([1, 2, 4, 5, 7, 8, 10, 11])
+
+#Divides the collaborative parameters of a parameter vector (or of every row of a matrix) by totalpop. Returns a copy.
+def scale_parameters(per_site_arr, totalpop):
+    param_arr = np.array(per_site_arr, dtype=np.float64)
+    param_arr[..., COLLABORATIVE_PARAMETERS] = param_arr[..., COLLABORATIVE_PARAMETERS] / totalpop
+    return param_arr
+
+#Argument types for the explicit signatures below. Kernels with a signature are compiled when this file is imported
+#(or loaded from the on-disk cache in __pycache__, which takes a fraction of a second) instead of on their first call.
+generator_type = typeof(np.random.default_rng())
+
+
+@njit(cache=True)
+def maintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
+    hemimethylated = site_count - (methylated + unmethylated)
+    return hemimethylated * (param_local[0] + param_local[2]*hemimethylated + param_local[1]*methylated)#r_hm param
+    #rate = hemimethylated * (self.params["r_hm"] + self.params["r_hm_h"]*hemimethylated + self.params["r_hm_m"]*methylated)
+@njit(cache=True)
+def denovo_rate_collaborative(methylated, unmethylated, site_count, param_local):
+    hemimethylated = site_count - (methylated + unmethylated)
+    return unmethylated * (param_local[3] + param_local[5]*hemimethylated + param_local[4]*methylated)
+    #rate = unmethylated * (self.params["r_uh"] + self.params["r_uh_h"]*hemimethylated + self.params["r_uh_m"]*methylated)
+@njit(cache=True)
+def demaintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
+    hemimethylated = site_count - (methylated + unmethylated)
+    return hemimethylated * (param_local[9] + param_local[11]*hemimethylated + param_local[10]*unmethylated)
+    #rate = hemimethylated * (self.params["r_hu"] + self.params["r_hu_h"]*hemimethylated + self.params["r_hu_u"]*unmethylated)
+@njit(cache=True)
+def demethylation_rate_collaborative(methylated, unmethylated, site_count, param_local):
+    hemimethylated = site_count - (methylated + unmethylated)
+    return methylated * (param_local[6] + param_local[8]*hemimethylated + param_local[7]*unmethylated)
+    #rate = methylated * (self.params["r_mh"] + self.params["r_mh_h"]*hemimethylated + self.params["r_mh_u"]*unmethylated)
+@njit(cache=True)
+def birth_rate(param_local):
+      return param_local[12]
+
+#Helper function that finds the state of the model for given site_count
+#1 means >70% methylated, -1 means >70% unmethylated, 0 means somewhere in the middle
+#This is what the switching simulations use to decide that a switch has happened.
+@njit(cache=True)
+def find_state(methylated, unmethylated, site_count):
+      if (methylated/ site_count) > 0.7:
+            return 1
+      if (unmethylated/ site_count) > 0.7:
+            return -1
+      return 0
+
+#Helper function that finds the region of the model for given site_count, for the long-run simulations
+#1 means >70% methylated, -1 means >70% unmethylated, 0 means somewhere in the middle
+#2 means less than 30% methylated
+@njit(cache=True)
+def classify_state(methylated, unmethylated, site_count):
+      if methylated > 0.7*site_count:
+          return 1
+      elif unmethylated > 0.7*site_count:
+          return -1
+      elif unmethylated < 0.3*site_count:
+          return 2
+      return 0
+
+#find_state and classify_state compare the counts with fractions of site_count on every call. For a fixed number of
+#sites those comparisons are the same as comparing with integer cut-offs, so the kernels work out the cut-offs once
+#and only compare integers on every step (which also keeps the division out of the inner loop).
+#switch_cutoff is the smallest count that find_state counts as more than 70% of the sites.
+@njit(cache=True)
+def switch_cutoff(site_count):
+    cutoff = int(np.floor(0.7*site_count))
+    while cutoff > 0 and ((cutoff - 1) / site_count) > 0.7:
+        cutoff -= 1
+    while (cutoff / site_count) <= 0.7:
+        cutoff += 1
+    return cutoff
+
+#Same as find_state, with the cut-off from switch_cutoff(site_count)
+@njit(cache=True)
+def find_state_cutoff(methylated, unmethylated, cutoff):
+      if methylated >= cutoff:
+            return 1
+      if unmethylated >= cutoff:
+            return -1
+      return 0
+
+#The cut-offs for classify_state: the smallest count that is more than 70% of the sites, and the smallest count that
+#isn't less than 30% of them (with exactly the same comparisons as classify_state).
+@njit(cache=True)
+def region_cutoffs(site_count):
+    high = int(np.floor(0.7*site_count))
+    while high > 0 and (high - 1) > 0.7*site_count:
+        high -= 1
+    while not high > 0.7*site_count:
+        high += 1
+    low = int(np.floor(0.3*site_count))
+    while low > 0 and not (low - 1) < 0.3*site_count:
+        low -= 1
+    while low < 0.3*site_count:
+        low += 1
+    return high, low
+
+#Same as classify_state, with the cut-offs from region_cutoffs(site_count)
+@njit(cache=True)
+def classify_state_cutoff(methylated, unmethylated, high, low):
+      if methylated >= high:
+          return 1
+      elif unmethylated >= high:
+          return -1
+      elif unmethylated < low:
+          return 2
+      return 0
+
+#The four single-site events (i_local = 0..3 in events) each move to a neighbouring state, without any random numbers.
+#They are split out of events so that the exact solvers (see ctmc.py) can find where each event leads.
+@njit(cache=True)
+def site_event(methylated, unmethylated, i_local):
+    #maintenance event
+    if i_local == 0:
+        return methylated+1, unmethylated
+    #denovo methylation event
+    elif i_local == 1:
+        return methylated, unmethylated-1
+    #demaintenance event
+    elif i_local == 2:
+        return methylated, unmethylated+1
+    #demethylation event
+    return methylated-1, unmethylated
+
+#This function defines the events that can happen. It's equivalent to the event list in config.py
+#i_local indicates which loop called this function - that is, i_local indicates which event we're doing.
+@njit(cache=True)
+def events(methylated, unmethylated, totalpop, i_local, rng_local):
+    #single-site events
+    if 0 <= i_local <= 3:
+        return site_event(methylated, unmethylated, i_local)
+    #birth event
+    elif i_local == 4:
+        hemimethylated = totalpop - (methylated + unmethylated)
+        newly_unmethylated = rng_local.binomial(hemimethylated, 0.5)
+        return 0, (unmethylated + newly_unmethylated)
+
+#Picks an event the same way as the original loop over normalized rates: the first event whose normalized rate,
+#plus the normalized rates before it, is larger than uniform. The sums are done in the same order, so a seed gives the same run.
+#Rounding can leave the normalized rates summing to just under 1; if uniform lands in that gap, we return -1 and nothing happens.
+@njit(cache=True)
+def choose_event(uniform, rate_0, rate_1, rate_2, rate_3, rate_4, rate_sum):
+    sum_so_far = 0.0
+    normalized_rate = rate_0 / rate_sum
+    if uniform < normalized_rate + sum_so_far:
+        return 0
+    sum_so_far += normalized_rate
+    normalized_rate = rate_1 / rate_sum
+    if uniform < normalized_rate + sum_so_far:
+        return 1
+    sum_so_far += normalized_rate
+    normalized_rate = rate_2 / rate_sum
+    if uniform < normalized_rate + sum_so_far:
+        return 2
+    sum_so_far += normalized_rate
+    normalized_rate = rate_3 / rate_sum
+    if uniform < normalized_rate + sum_so_far:
+        return 3
+    sum_so_far += normalized_rate
+    normalized_rate = rate_4 / rate_sum
+    if uniform < normalized_rate + sum_so_far:
+        return 4
+    return -1
+
+#Creates `count` independent random number generators with SeedSequence.spawn, so that every block of replicas
+#can have its own stream instead of sharing one generator between threads (which numba doesn't protect).
+#With a fixed seed, the results don't depend on how many threads run the blocks, as long as the replicas inside a
+#block are run in order. Creating a generator takes ~30 microseconds, so use blocks of several replicas for big sweeps.
+def spawn_generators(count, seed=None):
+    children = np.random.SeedSequence(seed).spawn(count)
+    return [np.random.Generator(np.random.PCG64(child)) for child in children]
+
+#Helper function that converts a (methylated, unmethylated) pair into a row of the rate table.
+#States are ordered by methylated count first, then unmethylated count.
+@njit(cache=True)
+def state_index(methylated, unmethylated, totalpop):
+    return methylated*(totalpop+1) - (methylated*(methylated-1))//2 + unmethylated
+
+#The rates only depend on the current (methylated, unmethylated) state, so for a fixed parameter set we can compute
+#them once for every state instead of on every step. Row state_index(methylated, unmethylated) holds the cumulative
+#sums of the five event rates, so the last column is the total rate. For 100 sites this is 5,151 x 5 entries.
+@njit((types.float64[:], types.int64), cache=True)
+def build_rate_table(param_arr, totalpop):
+    rate_table = np.zeros((((totalpop+1)*(totalpop+2))//2, 5))
+    for methylated in range(totalpop+1):
+        for unmethylated in range(totalpop+1-methylated):
+            row = state_index(methylated, unmethylated, totalpop)
+            rate_table[row, 0] = maintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            rate_table[row, 1] = rate_table[row, 0] + denovo_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            rate_table[row, 2] = rate_table[row, 1] + demaintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            rate_table[row, 3] = rate_table[row, 2] + demethylation_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+            rate_table[row, 4] = rate_table[row, 3] + birth_rate(param_arr)
+    return rate_table
+
+#Picks the event for a uniform draw in [0, total rate) with a binary search over one row of the rate table.
+#Events with a rate of zero can never be picked, since they take up no space in the cumulative sums.
+@njit(cache=True)
+def select_event(cumulative_rates, target):
+    low = 0
+    high = 4
+    while low < high:
+        middle = (low + high) // 2
+        if target < cumulative_rates[middle]:
+            high = middle
+        else:
+            low = middle + 1
+    return low
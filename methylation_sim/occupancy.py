@@ -0,0 +1,131 @@
+import numpy as np
+import math
+from numba import njit, types
+from .model import classify_state, state_index
+
+"""
+Everything the long-run simulations need to add up the time spent in each region and to decide when to stop.
+
+The regions are the four from model.classify_state, always in the order methylated, unmethylated, middle, sort-of
+methylated (the order of the proportions that every long-run simulation returns).
+"""
+
+#Estimators for the time spent in each region (the `estimator` argument of the kernels that take an occupancy table):
+#SAMPLED adds the sampled holding time tau to the current region, just like GillespieLongRunTableFun.
+#EXPECTED adds the expected holding time 1/rate_sum instead. The long-run proportions are the same, but the noise from
+#drawing tau is gone (and so is the exponential draw itself).
+#EMBEDDED adds the expected holding time of the *next* state, averaged over every event that can happen from the current
+#one with the jump probabilities of the embedded chain, so the noise from picking the event is mostly gone as well.
+SAMPLED = 0
+EXPECTED = 1
+EMBEDDED = 2
+ESTIMATORS = {"sampled": SAMPLED, "expected": EXPECTED, "embedded": EMBEDDED}
+
+#Helper function that gives the column of each region in the occupancy table - the same order as the proportions
+#from GillespieLongRunTableFun: methylated, unmethylated, middle, sort-of methylated
+@njit(cache=True)
+def region_column(methylated, unmethylated, site_count):
+    curr_state = classify_state(methylated, unmethylated, site_count)
+    if curr_state == 1:
+        return 0
+    elif curr_state == -1:
+        return 1
+    elif curr_state == 2:
+        return 3
+    return 2
+
+#Like the rate table, but for the estimators above: row state_index(methylated, unmethylated) holds how much each visit to
+#that state adds to the time spent in each region (columns from region_column), and the last column is their sum.
+#For SAMPLED the row is 1 in the state's region and gets multiplied by the sampled tau, for EXPECTED it is 1/rate_sum,
+#and for EMBEDDED it is the expected 1/rate_sum of the next state, split up by the region that state is in.
+@njit((types.float64[:, ::1], types.int64, types.int64), cache=True)
+def build_occupancy_table(rate_table, totalpop, estimator):
+    occupancy_table = np.zeros((rate_table.shape[0], 5))
+    #the moves made by events 0-3 (see events) - births are handled separately, since they are random
+    methylated_moves = (1, 0, 0, -1)
+    unmethylated_moves = (0, -1, 1, 0)
+    for methylated in range(totalpop+1):
+        for unmethylated in range(totalpop+1-methylated):
+            row = state_index(methylated, unmethylated, totalpop)
+            rate_sum = rate_table[row, 4]
+            if estimator == SAMPLED:
+                occupancy_table[row, region_column(methylated, unmethylated, totalpop)] = 1.0
+            elif estimator == EXPECTED:
+                occupancy_table[row, region_column(methylated, unmethylated, totalpop)] = 1/rate_sum
+            else:
+                previous = 0.0
+                for event in range(4):
+                    probability = (rate_table[row, event] - previous) / rate_sum
+                    previous = rate_table[row, event]
+                    if probability > 0:
+                        next_methylated = methylated + methylated_moves[event]
+                        next_unmethylated = unmethylated + unmethylated_moves[event]
+                        next_row = state_index(next_methylated, next_unmethylated, totalpop)
+                        occupancy_table[row, region_column(next_methylated, next_unmethylated, totalpop)] += probability / rate_table[next_row, 4]
+                #a birth leaves every hemimethylated site unmethylated with probability 0.5
+                birth_probability = (rate_sum - previous) / rate_sum
+                hemimethylated = totalpop - (methylated + unmethylated)
+                for newly_unmethylated in range(hemimethylated+1):
+                    binomial_probability = math.exp(math.lgamma(hemimethylated+1) - math.lgamma(newly_unmethylated+1)
+                                                    - math.lgamma(hemimethylated-newly_unmethylated+1) - hemimethylated*math.log(2))
+                    next_row = state_index(0, unmethylated + newly_unmethylated, totalpop)
+                    occupancy_table[row, region_column(0, unmethylated + newly_unmethylated, totalpop)] += birth_probability * binomial_probability / rate_table[next_row, 4]
+            occupancy_table[row, 4] = np.sum(occupancy_table[row, :4])
+    return occupancy_table
+
+#Turns per-batch sums of the occupancy (batch_sums[batch, column], with the total in column 4) into the proportions and
+#their standard errors by the method of batch means. Each proportion is a ratio of two sums, so the error of batch j is
+#measured as region_j - proportion * total_j, which is zero on average.
+@njit(cache=True)
+def batch_means_error(batch_sums):
+    batch_count = batch_sums.shape[0]
+    totals = np.sum(batch_sums, axis=0)
+    proportions = totals[:4] / totals[4]
+    standard_errors = np.zeros(4)
+    if batch_count < 2:
+        return proportions, standard_errors
+    mean_total = totals[4] / batch_count
+    for column in range(4):
+        squares = 0.0
+        for batch in range(batch_count):
+            residual = batch_sums[batch, column] - proportions[column] * batch_sums[batch, 4]
+            squares += residual * residual
+        standard_errors[column] = math.sqrt(squares / (batch_count * (batch_count - 1))) / mean_total
+    return proportions, standard_errors
+
+#Helper functions for the rolling window of proportions that decides when a run has converged.
+#The window is a (series x window size) ring buffer - a new sample overwrites the oldest one at column `index`.
+#Instead of recomputing the means over the whole window on every sample, we keep the running sum and sum of squares
+#of each series, so adding a sample and finding the RMSD are both O(1) per series.
+@njit(cache=True)
+def window_add(window, sums, sums_sq, index, values):
+    for series in range(window.shape[0]):
+        old = window[series, index]
+        sums[series] += values[series] - old
+        sums_sq[series] += values[series] ** 2 - old**2
+        window[series, index] = values[series]
+
+#Adding and subtracting for millions of samples slowly builds up rounding error, so once per trip around
+#the ring buffer we recompute the sums from scratch. That's O(window size) every window size samples, so still O(1) per sample.
+@njit(cache=True)
+def window_refresh(window, sums, sums_sq):
+    for series in range(window.shape[0]):
+        sums[series] = np.sum(window[series])
+        sums_sq[series] = np.sum(window[series] ** 2)
+
+#Writes the root mean square deviance of each series in the window into rmsd
+@njit(cache=True)
+def window_rmsd(window, sums, sums_sq, rmsd):
+    size = window.shape[1]
+    for series in range(window.shape[0]):
+        mean = sums[series] / size
+        #rounding can push a (nearly) zero variance slightly below zero
+        rmsd[series] = np.sqrt(max(sums_sq[series] / size - mean**2, 0.0))
+
+#True if every series' RMSD (from window_rmsd) is below its tolerance
+@njit(cache=True)
+def converges(rmsd, tolerances):
+    for series in range(len(rmsd)):
+        if rmsd[series] >= tolerances[series]:
+            return False
+    return True
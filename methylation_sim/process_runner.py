@@ -0,0 +1,167 @@
+import numpy as np
+import numba
+import os
+import json
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .sweep import RunSweep
+
+"""
+Runs one sweep (see sweep.py) over several processes, or several machines, when it is too big for a single Numba process.
+The process_runner.py files of switching_times and switching_coordinates are front-ends over this module.
+
+The parameter grid (one row of param_matrix per parameter value) is split into blocks of consecutive steps,
+and each block is run with sweep.RunSweep by whichever worker is free. There are two ways to do this:
+
+- RunSweepProcesses runs the blocks on a pool of local processes. Every worker writes its rows straight into
+  one shared-memory result array, so the results never have to be copied back through a pipe.
+  Because the workers are started fresh (not forked), call it from inside `if __name__ == "__main__":`.
+- CreateQueue writes the sweep into a directory that every machine can see (a shared drive, for example).
+  Then `python process_runner.py worker <directory>` can be started on any number of machines - each worker
+  claims a block by creating a file, saves its rows next to it, and moves on to the next free block.
+  CollectQueue waits for every block and assembles them into one memory-mapped result array.
+
+Each block rebuilds exactly the random number generators that model.spawn_generators(count, seed) would
+give its steps, so for a fixed seed the result is identical to running the sweep in one process,
+no matter how the work is split. run_sweep is cached on disk (cache=True), and the first process compiles it
+before any workers start, so the workers load it from the cache instead of each spending ~20 seconds compiling it.
+"""
+
+#Recreates the random number generators for streams first, first+1, ..., first+count-1.
+#These are exactly the generators that model.spawn_generators would make from the same seed,
+#so every process can build just the ones it needs.
+def stream_generators(entropy, first, count):
+    return [np.random.Generator(np.random.PCG64(np.random.SeedSequence(entropy, spawn_key=(index,)))) for index in range(first, first+count)]
+
+#Splits the steps into (first, last) blocks of consecutive steps, last not included.
+#Using more blocks than workers lets the workers that get the fast parameter values pick up more blocks.
+def partition_steps(step_count, partitions):
+    bounds = np.linspace(0, step_count, min(partitions, step_count)+1).astype(np.int64)
+    return [(int(bounds[block]), int(bounds[block+1])) for block in range(len(bounds)-1)]
+
+#Everything a worker needs to know about the sweep, apart from the parameter values.
+#The seed is turned into its entropy here, so that seed = None still gives every worker the same streams.
+#record_state is passed on to sweep.RunSweep - it decides whether every run keeps the state it switched into.
+def sweep_settings(batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream, record_state):
+    return {"batch_size": batch_size, "trial_max_length": trial_max_length, "totalpop": totalpop,
+            "pop_methyl": pop_methyl, "pop_unmethyl": pop_unmethyl, "SwitchDirection": SwitchDirection,
+            "entropy": np.random.SeedSequence(seed).entropy, "replicas_per_stream": replicas_per_stream,
+            "record_state": record_state}
+
+#shape of the results for one parameter value - (time, methylated, unmethylated) for every run if record_state is set
+def row_shape(settings):
+    if settings["record_state"]:
+        return (settings["batch_size"], 3)
+    return (settings["batch_size"],)
+
+#Runs one block of steps in this process. param_rows are the rows of the parameter matrix for steps first, first+1, ...
+#Returns the output rows for those steps and the total number of gillespie steps that were taken.
+def run_partition(param_rows, first, settings):
+    streams_per_step = -(-settings["batch_size"] // settings["replicas_per_stream"])
+    rngs = stream_generators(settings["entropy"], first*streams_per_step, len(param_rows)*streams_per_step)
+    output, thread_steps, thread_items = RunSweep(param_rows, settings["batch_size"], settings["trial_max_length"], settings["totalpop"],
+                                                  settings["pop_methyl"], settings["pop_unmethyl"], settings["SwitchDirection"], rngs, settings["replicas_per_stream"],
+                                                  record_state=settings["record_state"])
+    return output, int(np.sum(thread_steps))
+
+#Compiles run_sweep (or loads it from the cache) with a tiny sweep, so that it is in the cache before any workers start
+def warm_up(param_matrix, settings):
+    tiny_settings = dict(settings, batch_size=1, trial_max_length=2, replicas_per_stream=1)
+    run_partition(param_matrix[:1], 0, tiny_settings)
+
+#Runs once in each local worker process
+def start_worker(threads_per_worker):
+    numba.set_num_threads(threads_per_worker)
+
+#Runs one block in a local worker, and writes it into the shared result array
+def pool_task(memory_name, shape, param_rows, first, settings):
+    memory = shared_memory.SharedMemory(name=memory_name)
+    results = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+    output, steps = run_partition(param_rows, first, settings)
+    results[first:first+len(param_rows)] = output
+    del results
+    memory.close()
+    return first, first+len(param_rows), steps, os.getpid()
+
+#Runs the whole sweep on `workers` local processes, each using threads_per_worker Numba threads.
+#Returns the same array that sweep.RunSweep would, with (step_count, batch_size) entries, or (step_count, batch_size, 3)
+#if record_state is True.
+def RunSweepProcesses(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream, workers, threads_per_worker=1, partitions=None,
+                      record_state=False):
+    param_matrix = np.ascontiguousarray(param_matrix, dtype=np.float64)
+    settings = sweep_settings(batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream, record_state)
+    warm_up(param_matrix, settings)
+    if partitions is None:
+        partitions = 4*workers
+
+    shape = (len(param_matrix),) + row_shape(settings)
+    memory = shared_memory.SharedMemory(create=True, size=int(np.prod(shape))*8)
+    try:
+        results = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        #"spawn" starts clean processes - forking a process that has already run Numba's thread pool can hang
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=start_worker, initargs=(threads_per_worker,)) as executor:
+            tasks = [executor.submit(pool_task, memory.name, shape, param_matrix[first:last], first, settings) for first, last in partition_steps(len(param_matrix), partitions)]
+            for task in as_completed(tasks):
+                first, last, steps, process_id = task.result()
+                print(f"Steps {first} to {last-1} finished by process {process_id} ({steps} gillespie steps)")
+        output = results.copy()
+        del results
+    finally:
+        memory.close()
+        memory.unlink()
+    return output
+
+#Sets up a work queue for the sweep in `directory`, which should be visible to every machine that will work on it.
+#The workers read record_state from the queue, so they can be started from either folder.
+def CreateQueue(directory, param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream, partitions,
+                record_state=False):
+    os.makedirs(directory, exist_ok=True)
+    param_matrix = np.ascontiguousarray(param_matrix, dtype=np.float64)
+    settings = sweep_settings(batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream, record_state)
+    settings["partitions"] = partition_steps(len(param_matrix), partitions)
+    np.save(os.path.join(directory, "parameters.npy"), param_matrix)
+    with open(os.path.join(directory, "settings.json"), "w") as settings_file:
+        json.dump(settings, settings_file)
+
+#Works on the queue in `directory` until every block has been claimed. Any number of these can run at once, on any machine.
+#A block is claimed by creating the file claimed_<block> - if a worker crashes, delete its claimed file to let another worker redo it.
+def RunQueueWorker(directory, threads=None):
+    if threads is not None:
+        numba.set_num_threads(threads)
+    with open(os.path.join(directory, "settings.json")) as settings_file:
+        settings = json.load(settings_file)
+    param_matrix = np.load(os.path.join(directory, "parameters.npy"))
+    warm_up(param_matrix, settings)
+
+    for block, (first, last) in enumerate(settings["partitions"]):
+        try:
+            #creating the file fails if another worker already has it, so each block is only run once
+            os.close(os.open(os.path.join(directory, f"claimed_{block}"), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        output, steps = run_partition(param_matrix[first:last], first, settings)
+        #write to a temporary file first, so a half-written block never looks finished
+        temporary_path = os.path.join(directory, f"block_{block}.tmp.npy")
+        np.save(temporary_path, output)
+        os.replace(temporary_path, os.path.join(directory, f"block_{block}.npy"))
+        print(f"Steps {first} to {last-1} finished by process {os.getpid()} ({steps} gillespie steps)")
+
+#Waits until every block in the queue is finished, then puts them together in directory/output.npy.
+#Returns that file as a memory-mapped array, so a very large sweep doesn't have to fit in memory.
+def CollectQueue(directory, poll_interval=5):
+    with open(os.path.join(directory, "settings.json")) as settings_file:
+        settings = json.load(settings_file)
+    param_matrix = np.load(os.path.join(directory, "parameters.npy"), mmap_mode="r")
+    block_paths = [os.path.join(directory, f"block_{block}.npy") for block in range(len(settings["partitions"]))]
+    while not all(os.path.exists(path) for path in block_paths):
+        time.sleep(poll_interval)
+
+    shape = (len(param_matrix),) + row_shape(settings)
+    results = np.lib.format.open_memmap(os.path.join(directory, "output.npy"), mode="w+", dtype=np.float64, shape=shape)
+    for (first, last), path in zip(settings["partitions"], block_paths):
+        results[first:last] = np.load(path)
+    results.flush()
+    return results
+
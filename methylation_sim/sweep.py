@@ -0,0 +1,90 @@
+import numpy as np
+import numba
+from numba import njit, prange, types
+from .model import generator_type, build_rate_table
+from .engine import switch_table_kernel
+
+"""
+Runs a whole sweep (every parameter value x every replica) of switching simulations in one parallel loop, for the
+sweep_scheduler.py files of switching_times and switching_coordinates.
+
+Sweeps over birth rates (or any other parameter) are badly unbalanced if each parameter value is one parallel task:
+runs near the bistable birth rates take much longer than others, so the threads that get those steps finish long
+after everyone else. Here the sweep is split into small work items instead: one item is one block of
+replicas_per_stream runs for one parameter value, which is also the unit that owns a random number generator (see
+model.spawn_generators). The items are handed out to threads a few at a time as they finish (numba's parallel chunk
+size), so slow steps get spread over every core. Each item always uses the same generator in the same order, so with
+a fixed seed the output doesn't depend on the number of threads.
+
+The two folders only differ in what they keep from every run: switching_times keeps the switching time, and
+switching_coordinates also keeps the state it switched into. That is the record_state argument of RunSweep.
+"""
+
+#Runs every (parameter vector, block of replicas) work item in parallel and fills output_array[step, replica].
+#output_array[step, replica] holds row_width values: the switching time (negative for time-outs, just like
+#GillespieSwitchFun), and if row_width is 3, the methylated and unmethylated counts where it switched (-1 for time-outs).
+#rngs must hold step_count * ceil(batch_size / replicas_per_stream) generators, ordered step by step.
+#thread_count must be at least the number of threads numba can use - it is passed in (instead of calling
+#numba.get_num_threads() here) so that the compiled function can be cached on disk.
+@njit((types.float64[:, ::1], types.int64, types.int64, types.int64, types.int64, types.int64, types.int64, types.List(generator_type, reflected=True), types.int64, types.int64,
+       types.int64), parallel=True, cache=True)
+def run_sweep(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream, row_width, thread_count):
+    step_count = param_matrix.shape[0]
+    streams_per_step = -(-batch_size // replicas_per_stream)
+    output_array = np.zeros((step_count, batch_size, row_width))
+
+    #the rates only depend on the state, so we compute them once for every state and every parameter vector
+    rate_tables = np.zeros((step_count, ((totalpop+1)*(totalpop+2))//2, 5))
+    for step in prange(step_count):
+        rate_tables[step] = build_rate_table(param_matrix[step], totalpop)
+
+    #one row per thread - the padding keeps threads from writing to the same cache line
+    thread_steps = np.zeros((thread_count, 8), dtype=np.int64)
+    thread_items = np.zeros((thread_count, 8), dtype=np.int64)
+
+    #work items are interleaved across steps, so the expensive steps don't all end up at the end of the queue
+    for work in prange(step_count * streams_per_step):
+        step = work % step_count
+        stream = work // step_count
+        steps_taken = 0
+        for i in range(stream*replicas_per_stream, min(batch_size, (stream+1)*replicas_per_stream)):
+            curr_time, curr_methylated, curr_unmethylated, run_steps = switch_table_kernel(trial_max_length, rate_tables[step], totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs[step*streams_per_step + stream])
+            output_array[step, i, 0] = curr_time
+            if row_width == 3:
+                if curr_time < 0:
+                    output_array[step, i, 1:] = -1
+                else:
+                    output_array[step, i, 1] = curr_methylated
+                    output_array[step, i, 2] = curr_unmethylated
+            steps_taken += run_steps
+        thread = numba.get_thread_id()
+        thread_steps[thread, 0] += steps_taken
+        thread_items[thread, 0] += 1
+
+    return output_array, thread_steps[:, 0], thread_items[:, 0]
+
+#Runs the sweep with work items handed out chunk_size at a time. A small chunk size balances the load better,
+#at the cost of a little more scheduling overhead - one block of replicas is already plenty of work per item.
+#Returns a (step_count, batch_size) array of switching times, or a (step_count, batch_size, 3) array of
+#(time, methylated, unmethylated) if record_state is True, plus the per-thread steps and work items.
+def RunSweep(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream, chunk_size=1, record_state=False):
+    row_width = 3 if record_state else 1
+    with numba.parallel_chunksize(chunk_size):
+        output_array, thread_steps, thread_items = run_sweep(np.ascontiguousarray(param_matrix, dtype=np.float64), batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream, row_width,
+                                                             numba.config.NUMBA_NUM_THREADS)
+    if not record_state:
+        output_array = output_array[:, :, 0]
+    #only report the threads that were allowed to run (plus any others that somehow got work)
+    used = max(numba.get_num_threads(), np.max(np.nonzero(thread_items)[0], initial=-1) + 1)
+    return output_array, thread_steps[:used], thread_items[:used]
+
+#Prints how much of the work each thread did. Utilisation is the number of gillespie steps a thread ran
+#compared to the busiest thread, so 100% everywhere means the load was perfectly balanced.
+def print_utilisation(thread_steps, thread_items):
+    busiest = max(np.max(thread_steps), 1)
+    total = max(np.sum(thread_steps), 1)
+    print("Thread utilisation:")
+    for thread in range(len(thread_steps)):
+        print(f"  thread {thread}: {thread_items[thread]} work items, {thread_steps[thread]} steps, "
+              f"{100*thread_steps[thread]/busiest:.1f}% of the busiest thread, {100*thread_steps[thread]/total:.1f}% of all steps")
+    print(f"Overall utilisation: {100*np.mean(thread_steps)/busiest:.1f}%")
@@ -0,0 +1,161 @@
+import numpy as np
+from numba import njit, types
+from .model import (generator_type, maintenance_rate_collaborative, denovo_rate_collaborative, demaintenance_rate_collaborative,
+                    demethylation_rate_collaborative, birth_rate, switch_cutoff, find_state_cutoff, events)
+
+"""
+Approximate (tau-leaping) simulation for large site counts.
+
+The exact simulation takes one step per event, and the total rate of the four per-site events grows with the number of
+sites, so the steps per unit of time grow linearly with totalpop - at 10,000 sites a single switch can take millions
+of steps, and the rate table no longer fits in memory. Tau-leaping instead advances time by a leap tau and fires a
+Poisson number of each per-site event, with the rates held fixed during the leap. tau is picked with the leap condition
+of Cao, Gillespie and Petzold (2006): no count may change by more than a fraction `epsilon` of itself, so the rates
+barely change during the leap. A smaller epsilon is more accurate, a larger one takes fewer, longer leaps.
+
+Births are not leaped. Their rate doesn't depend on the state, so the time of the next birth is drawn exactly, the
+leaps are cut short so they end exactly on it, and the birth itself is the same binomial split as in model.events.
+Near the edges of the simplex (or whenever a leap would only fire a handful of events anyway) the kernel falls back to
+exact steps, and a leap that would leave the simplex M + U <= N is redrawn with half the tau, so the counts always stay valid.
+
+Only the state at the end of each leap is checked for a switch, so a short visit to the switched state in the middle of
+a leap is missed, and the switching times come out longer than the exact ones as epsilon grows. At the default
+parameters epsilon = 0.03-0.1 is indistinguishable from the exact simulation at 10,000 sites and 4-18x faster
+(see switching_times/benchmark_tau_leap.py). At around 100 sites no leap is worth taking and every step is exact.
+"""
+
+#A leap is only taken if it fires at least this many events on average - below that, exact steps are just as fast
+#and lose nothing. When a leap is turned down, the next EXACT_RUN steps are all exact before the leap size is checked
+#again, so the exact stretches don't pay for picking a leap on every step (both as recommended by Cao, Gillespie and Petzold).
+EXACT_EVENTS = 10.0
+EXACT_RUN = 100
+
+#Writes the rates of the four per-site events (maintenance, de novo methylation, demaintenance, demethylation) into rates.
+#Returns their sum.
+@njit(cache=True)
+def site_rates(methylated, unmethylated, totalpop, param_arr, rates):
+    rates[0] = maintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+    rates[1] = denovo_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+    rates[2] = demaintenance_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+    rates[3] = demethylation_rate_collaborative(methylated,unmethylated,totalpop,param_arr)
+    return rates[0] + rates[1] + rates[2] + rates[3]
+
+#Helper function for leap_size - the largest tau for which a count x, drifting at `drift` per unit time with
+#variance `variance` per unit time, is expected to change by no more than max(epsilon*x/order, 1).
+#order is the highest order of the rates in x, so that the rates change by no more than about epsilon.
+@njit(cache=True)
+def count_bound(count, drift, variance, epsilon, order):
+    bound = max(epsilon * count / order, 1.0)
+    tau = np.inf
+    if drift != 0:
+        tau = bound / abs(drift)
+    if variance > 0:
+        tau = min(tau, bound * bound / variance)
+    return tau
+
+#Picks the leap for the current rates with the leap condition of Cao, Gillespie and Petzold (2006), from the drift and
+#variance of each count. Events 0/2 turn a hemimethylated site into a methylated/unmethylated one, and events 1/3
+#turn an unmethylated/methylated site into a hemimethylated one.
+#The rates are quadratic in the hemimethylated count (the h*h terms), and products of two counts otherwise.
+@njit(cache=True)
+def leap_size(methylated, unmethylated, totalpop, rates, epsilon):
+    hemimethylated = totalpop - (methylated + unmethylated)
+    hemimethylated_order = 2.0
+    if hemimethylated > 1:
+        hemimethylated_order += 1 / (hemimethylated - 1)
+    tau = count_bound(methylated, rates[0] - rates[3], rates[0] + rates[3], epsilon, 2.0)
+    tau = min(tau, count_bound(unmethylated, rates[2] - rates[1], rates[1] + rates[2], epsilon, 2.0))
+    tau = min(tau, count_bound(hemimethylated, rates[1] + rates[3] - rates[0] - rates[2], rates[0] + rates[1] + rates[2] + rates[3],
+                               epsilon, hemimethylated_order))
+    return tau
+
+#Same as engine.switch_kernel, but leaps over many per-site events at once (see above). epsilon is the leap condition.
+#Each leap or exact step counts as one of the `steps`, so the time-out is in leaps rather than events.
+#The switch is checked after every leap, so the switching time can overshoot by up to one leap (a small fraction of
+#the time it takes for any count to change by epsilon).
+#Returns the time of the switch (negative if we timed out), the final state, the number of leaps and the number of exact steps.
+@njit((types.int64, types.float64[:], types.int64, types.int64, types.int64, types.int64, generator_type, types.float64), cache=True)
+def leap_switch_kernel(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng, epsilon):
+    curr_methylated = pop_methyl
+    curr_unmethylated = pop_unmethyl
+    curr_time = 0.0
+    cutoff = switch_cutoff(totalpop)
+    rates = np.zeros(4)
+    leaps = 0
+    exact_steps = 0
+
+    #births happen at a constant rate, so we can draw when the next one is before simulating up to it
+    rate_4 = birth_rate(param_arr)
+    next_birth = np.inf
+    if rate_4 > 0:
+        next_birth = rng.exponential(scale = 1/rate_4)
+
+    #how many more exact steps to take before checking the leap size again
+    exact_left = 0
+
+    #main loop - each leap or exact step is one iteration of this loop
+    for i in range(1, steps):
+        rate_sum = site_rates(curr_methylated, curr_unmethylated, totalpop, param_arr, rates)
+        birth = False
+        if exact_left == 0:
+            tau = leap_size(curr_methylated, curr_unmethylated, totalpop, rates, epsilon)
+            if rate_sum == 0 or rate_sum * tau < EXACT_EVENTS:
+                exact_left = EXACT_RUN
+
+        if exact_left > 0:
+            #too few events for a leap to be worth it - take an exact step instead
+            exact_left -= 1
+            exact_steps += 1
+            wait = np.inf
+            if rate_sum > 0:
+                wait = rng.exponential(scale = 1/rate_sum)
+            elif next_birth == np.inf:
+                #nothing can ever happen again
+                break
+            if curr_time + wait >= next_birth:
+                curr_time = next_birth
+                birth = True
+            else:
+                curr_time += wait
+                target = rng.uniform() * rate_sum
+                event_number = 0
+                while event_number < 3 and target >= rates[event_number]:
+                    target -= rates[event_number]
+                    event_number += 1
+                curr_methylated, curr_unmethylated = events(curr_methylated, curr_unmethylated, totalpop, event_number, rng)
+        else:
+            leaps += 1
+            #stop the leap at the next birth
+            if curr_time + tau >= next_birth:
+                tau = next_birth - curr_time
+                birth = True
+            while True:
+                maintenance = rng.poisson(rates[0] * tau)
+                denovo = rng.poisson(rates[1] * tau)
+                demaintenance = rng.poisson(rates[2] * tau)
+                demethylation = rng.poisson(rates[3] * tau)
+                new_methylated = curr_methylated + maintenance - demethylation
+                new_unmethylated = curr_unmethylated - denovo + demaintenance
+                if new_methylated >= 0 and new_unmethylated >= 0 and new_methylated + new_unmethylated <= totalpop:
+                    break
+                #the leap would leave the simplex - try again with half of it (this no longer reaches the birth)
+                tau /= 2
+                birth = False
+            curr_methylated = new_methylated
+            curr_unmethylated = new_unmethylated
+            curr_time += tau
+            if birth:
+                curr_time = next_birth
+
+        # decide which state we are in - if we switched, this block will terminate the program
+        if find_state_cutoff(curr_methylated, curr_unmethylated, cutoff) == SwitchDirection:
+            return curr_time, curr_methylated, curr_unmethylated, leaps, exact_steps
+
+        if birth:
+            curr_methylated, curr_unmethylated = events(curr_methylated, curr_unmethylated, totalpop, 4, rng)
+            next_birth = curr_time + rng.exponential(scale = 1/rate_4)
+            if find_state_cutoff(curr_methylated, curr_unmethylated, cutoff) == SwitchDirection:
+                return curr_time, curr_methylated, curr_unmethylated, leaps, exact_steps
+
+    #we timed out - return a negative value to indicate that this isn't a normal run.
+    return -1 * curr_time, curr_methylated, curr_unmethylated, leaps, exact_steps
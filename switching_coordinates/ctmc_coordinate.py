@@ -0,0 +1,81 @@
+import os
+import sys
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_linalg
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from methylation_sim import state_index, state_count, build_generator, switch_region
+
+"""
+This file is an exact alternative to running batches of gillespie_coordinate.GillespieSwitchFun.
+
+The model only tracks (methylated, unmethylated) with methylated + unmethylated <= totalpop,
+so for 100 sites there are only 5,151 possible states. If we treat every state where
+find_state == SwitchDirection as absorbing, the coordinates where a switch happens are just the state
+the chain is absorbed into. The probability of being absorbed into each state can be found with a single
+sparse linear solve, using the same rate functions and events that the gillespie file uses.
+
+Input: parameter list, totalpop, starting population, SwitchDirection (and optionally a list of birth rates)
+Output: every coordinate in the switch region, the probability that the switch happens there, and the mean coordinates
+
+Unlike the simulation, there are no time-outs. The starting state should be outside of the switch region.
+
+The generator matrix comes from the shared methylation_sim package (methylation_sim/ctmc.py).
+"""
+
+#Returns the probability that a switch from (pop_methyl, pop_unmethyl) first lands on each coordinate of the switch region.
+#If T is the generator restricted to the states outside the switch region and R holds the rates into the switch region,
+#the expected time spent in each outside state solves T^T x = -start, and the probability of landing in state j is (x R)_j.
+#Returns the methylated coordinates, unmethylated coordinates and probabilities of every state in the switch region.
+def SwitchingCoordinateDistribution(param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection):
+    rows, cols, vals = build_generator(np.asarray(param_arr, dtype=np.float64), totalpop)
+    in_region = switch_region(totalpop, SwitchDirection)
+    transient_count = np.count_nonzero(~in_region)
+    region_count = np.count_nonzero(in_region)
+    #map every state to its place among the outside (transient) states or among the switch region states
+    local_index = np.zeros(len(in_region), dtype=np.int64)
+    local_index[~in_region] = np.arange(transient_count)
+    local_index[in_region] = np.arange(region_count)
+
+    #switch region coordinates, in the same order as the columns of R
+    methylated_coords = np.zeros(region_count, dtype=np.int64)
+    unmethylated_coords = np.zeros(region_count, dtype=np.int64)
+    for methylated in range(totalpop+1):
+        for unmethylated in range(totalpop+1-methylated):
+            index = state_index(methylated, unmethylated, totalpop)
+            if in_region[index]:
+                methylated_coords[local_index[index]] = methylated
+                unmethylated_coords[local_index[index]] = unmethylated
+
+    if in_region[state_index(pop_methyl, pop_unmethyl, totalpop)]:
+        #we're already in the switch region
+        probabilities = np.zeros(region_count)
+        probabilities[local_index[state_index(pop_methyl, pop_unmethyl, totalpop)]] = 1
+        return methylated_coords, unmethylated_coords, probabilities
+
+    keep = ~in_region[rows] & ~in_region[cols]
+    transient = sparse.csc_matrix((vals[keep], (local_index[rows[keep]], local_index[cols[keep]])),
+                                  shape=(transient_count, transient_count))
+    entering = ~in_region[rows] & in_region[cols]
+    switch_rates = sparse.csr_matrix((vals[entering], (local_index[rows[entering]], local_index[cols[entering]])),
+                                     shape=(transient_count, region_count))
+
+    start_distribution = np.zeros(transient_count)
+    start_distribution[local_index[state_index(pop_methyl, pop_unmethyl, totalpop)]] = 1
+    occupation = sparse_linalg.spsolve(transient.T.tocsc(), -start_distribution)
+    probabilities = np.maximum(switch_rates.T @ occupation, 0)
+    return methylated_coords, unmethylated_coords, probabilities / np.sum(probabilities)
+
+#Returns the mean (methylated, unmethylated) coordinates where the switch happens
+def mean_coordinates(methylated_coords, unmethylated_coords, probabilities):
+    return np.sum(methylated_coords * probabilities), np.sum(unmethylated_coords * probabilities)
+
+#Runs SwitchingCoordinateDistribution for every birth rate in birth_rates, keeping the other parameters fixed.
+#Returns a list with one (methylated_coords, unmethylated_coords, probabilities) tuple per birth rate.
+def SwitchingCoordinateSweep(param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, birth_rates):
+    results = []
+    for rate in birth_rates:
+        temp_arr = np.array(param_arr, dtype=np.float64)
+        temp_arr[12] = rate
+        results.append(SwitchingCoordinateDistribution(temp_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection))
+    return results
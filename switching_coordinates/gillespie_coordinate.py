@@ -1,6 +1,8 @@
-import numpy as np
-from numba import njit
-import matplotlib.pyplot as plt
+import os
+import sys
+from numba import njit, types
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from methylation_sim import generator_type, spawn_generators, build_rate_table, switch_kernel, switch_table_kernel
 
 """
 This variant of the optimized gillespie simulation returns a tuple object containing the time at which the switch occured,
@@ -12,109 +14,33 @@ Specifically, config files might need to be defined in the file instead of impor
 We will use prange across different simulations (since each simulation is seperate, can be executed in parallel)
 This code does not support debugging toggles, and doesn't print output at the simulation level.
 There might be some weirdness with rng, see here: https://numba.readthedocs.io/en/stable/reference/pysupported.html
-"""
-
-@njit
-def maintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (param_local[0] + param_local[2]*hemimethylated + param_local[1]*methylated)#r_hm param
-    #rate = hemimethylated * (self.params["r_hm"] + self.params["r_hm_h"]*hemimethylated + self.params["r_hm_m"]*methylated)
-@njit
-def denovo_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return unmethylated * (param_local[3] + param_local[5]*hemimethylated + param_local[4]*methylated)
-    #rate = unmethylated * (self.params["r_uh"] + self.params["r_uh_h"]*hemimethylated + self.params["r_uh_m"]*methylated)
-@njit
-def demaintenance_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return hemimethylated * (param_local[9] + param_local[11]*hemimethylated + param_local[10]*unmethylated)
-    #rate = hemimethylated * (self.params["r_hu"] + self.params["r_hu_h"]*hemimethylated + self.params["r_hu_u"]*unmethylated)
-@njit
-def demethylation_rate_collaborative(methylated, unmethylated, site_count, param_local):
-    hemimethylated = site_count - (methylated + unmethylated)
-    return methylated * (param_local[6] + param_local[8]*hemimethylated + param_local[7]*unmethylated)
-    #rate = methylated * (self.params["r_mh"] + self.params["r_mh_h"]*hemimethylated + self.params["r_mh_u"]*unmethylated)
-@njit
-def birth_rate(param_local):
-      return param_local[12]
-
-#Helper function that finds the state of the model for given site_count
-#1 means >70% methylated, -1 means >70% unmethylated, 0 means somewhere in the middle
-@njit
-def find_state(methylated, unmethylated, site_count):
-      if (methylated/ site_count) > 0.7:
-            return 1
-      if (unmethylated/ site_count) > 0.7:
-            return -1
-      return 0
 
-#This function defines the events that can happen. It's equivalent to the event list in config.py
-#i_local indicates which loop called this function - that is, i_local indicates which event we're doing.
-@njit
-def events(methylated, unmethylated, totalpop, i_local, rng_local):
-    #maintenance event
-    if i_local == 0:
-        return methylated+1, unmethylated
-    #denovo methylation event
-    elif i_local == 1:
-        return methylated, unmethylated-1
-    #demaintenance event
-    elif i_local == 2:
-        return methylated, unmethylated+1
-    #demethylation event
-    elif i_local == 3:
-        return methylated-1, unmethylated
-    #birth event
-    elif i_local == 4:
-        hemimethylated = totalpop - (methylated + unmethylated)
-        newly_unmethylated = rng_local.binomial(hemimethylated, 0.5)
-        return 0, (unmethylated + newly_unmethylated)
+The model and the simulation loops live in the shared methylation_sim package at the top of the repository - this file
+only turns their results into (time, (methylated, unmethylated)) tuples, and re-exports spawn_generators and
+build_rate_table (for GillespieSwitchTableFun).
+"""
 
-@njit
+@njit(cache=True)
 def GillespieSwitchFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng):
-    methylated_arr = np.zeros(steps)
-    unmethylated_arr = np.zeros(steps)
-    methylated_arr[0] = pop_methyl 
-    unmethylated_arr[0] = pop_unmethyl
-    time_arr = np.zeros(steps) 
-    time_arr[0] = 0 #initialize first value to zero to stay in sync with (un)methylated_arr
-    start_state = find_state(pop_methyl,pop_unmethyl, totalpop)
-    rates = np.zeros(5) #using numpy array may or may not be optimal here - possible refactor point
-
-    #main loop - each generation or step is one iteration of this loop
-    for i in range(1, steps): #start at 1, since the first step is given by pop_methyl/pop_unmethyl
-
-        #find the rates of each event for the current parameters
-        rates[0] = maintenance_rate_collaborative(methylated_arr[i-1],unmethylated_arr[i-1],totalpop,param_arr)
-        rates[1] = denovo_rate_collaborative(methylated_arr[i-1],unmethylated_arr[i-1],totalpop,param_arr)
-        rates[2] = demaintenance_rate_collaborative(methylated_arr[i-1],unmethylated_arr[i-1],totalpop,param_arr)
-        rates[3] = demethylation_rate_collaborative(methylated_arr[i-1],unmethylated_arr[i-1],totalpop,param_arr)
-        rates[4] = birth_rate(param_arr)
-        rate_sum = np.sum(rates)
-
-        #find the expected wait for an event to happen
-        tau = rng.exponential(scale = 1/rate_sum)
-        time_arr[i] = tau + time_arr[i-1]
-
-        #normalize the rates to be within (0,1)
-        normalized_rates= rates / rate_sum
-
-        #select which event happens by comparing the normalized rates to a random variable
-        sum_so_far = 0
-        uniform = rng.uniform()
-        for event_number in range(5):
-            if uniform < normalized_rates[event_number] + sum_so_far:
-                methylated_arr[i], unmethylated_arr[i] = events(methylated_arr[i-1], unmethylated_arr[i-1], totalpop,event_number,rng)
-                break
-            else:
-                sum_so_far += normalized_rates[event_number]
-
-        # decide which state we are in - if we switched, this block will terminate the program
-        curr_state = find_state(methylated_arr[i], unmethylated_arr[i], totalpop)
-        if curr_state == SwitchDirection:
-            #select final coordinates and return them
-            final_coords = (methylated_arr[i],unmethylated_arr[i])
-            return time_arr[i], final_coords
-        
+    curr_time, curr_methylated, curr_unmethylated, recorded = switch_kernel(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng, None)
+    if curr_time >= 0:
+        return curr_time, (curr_methylated, curr_unmethylated)
     #we timed out - return a negative value to indicate that this isn't a normal run.
-    return (-1 * time_arr[i]), (-1,-1)
+    return (curr_time), (-1,-1)
+
+#Same as GillespieSwitchFun, but also writes the whole run into trajectory, a caller-supplied (3, steps) array
+#with rows (methylated, unmethylated, time). Only the first `recorded` columns are filled in.
+#The array can be reused between runs, so only allocate one when the trajectory is actually needed.
+@njit(cache=True)
+def GillespieSwitchTrajectoryFun(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng, trajectory):
+    curr_time, curr_methylated, curr_unmethylated, recorded = switch_kernel(steps, param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng, trajectory)
+    return curr_time, recorded
+
+
+#Same as GillespieSwitchFun, but looks up the rates in a table from build_rate_table instead of recomputing them every step.
+@njit((types.int64, types.float64[:, ::1], types.int64, types.int64, types.int64, types.int64, generator_type), cache=True)
+def GillespieSwitchTableFun(steps, rate_table, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng):
+    curr_time, curr_methylated, curr_unmethylated, steps_taken = switch_table_kernel(steps, rate_table, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rng)
+    if curr_time < 0:
+        return curr_time, (-1,-1)
+    return curr_time, (curr_methylated, curr_unmethylated)
@@ -0,0 +1,103 @@
+import numpy as np
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+#gillespie_coordinate puts the top folder of the repository on sys.path
+import gillespie_coordinate
+import methylation_sim
+from methylation_sim import RunQueueWorker, CollectQueue
+
+"""
+Runs one sweep over several processes, or several machines, when it is too big for a single Numba process.
+
+The runner itself is shared with switching_times and lives in methylation_sim/process_runner.py - this file only
+asks it to keep the state every run switched into. RunSweepProcesses runs the sweep on a pool of local processes,
+and CreateQueue / RunQueueWorker / CollectQueue run it through a work queue in a directory that every machine can see.
+For a fixed seed the result is identical to running sweep_scheduler.RunSweep in one process, no matter how the work is split.
+
+Running this file directly runs the sweep in the parameters block at the bottom and saves it with np.save.
+Like sweep_scheduler.RunSweep, entry [step, run] of the result is (switching time, methylated, unmethylated),
+with a negative time and (-1, -1) for runs that timed out.
+"""
+
+#Returns the same array that sweep_scheduler.RunSweep would, with (step_count, batch_size, 3) entries.
+def RunSweepProcesses(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream, workers, threads_per_worker=1, partitions=None):
+    return methylation_sim.RunSweepProcesses(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream,
+                                             workers, threads_per_worker, partitions, record_state=True)
+
+#Sets up a work queue for the sweep in `directory` - the workers keep the state every run switched into.
+def CreateQueue(directory, param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream, partitions):
+    methylation_sim.CreateQueue(directory, param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed, replicas_per_stream,
+                                partitions, record_state=True)
+
+
+if __name__ == "__main__":
+    #`python process_runner.py worker <directory> [threads]` joins an existing work queue
+    if len(sys.argv) > 2 and sys.argv[1] == "worker":
+        RunQueueWorker(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None)
+        sys.exit()
+
+    #-----------parameters - edit here-----------
+    #these work just like the parameters in simulation_coordinate.py, except that one parameter is swept
+    #between param_begin_val and param_end_val in step_count steps (like in switching_times/simulation_time.py)
+    param_begin_val = 0
+    param_end_val = 3
+    step_count = 100
+    param_to_change = "birth_rate"
+    batch_size = 5000
+    trial_max_length = 10000
+    seed = None
+    replicas_per_stream = 10
+    totalpop = 100
+    methylatedpop = 15
+    unmethylatedpop = 75
+    SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+    #number of local worker processes, and how many Numba threads each of them uses
+    workers = 4
+    threads_per_worker = 1
+    #number of blocks the steps are split into - more blocks balance the load better
+    partitions = 16
+    #set to a directory that other machines can see to let them join in (with `python process_runner.py worker <directory>`),
+    #or None to only use local processes
+    queue_directory = None
+    #the results are saved here with np.save
+    output_file = "sweep_output.npy"
+    #-----------Rates Dictionary---------
+    default_parameters = {"r_hm": 0.5,          #0
+                          "r_hm_m": 20/totalpop, #1
+                          "r_hm_h": 10/totalpop, #2
+                          "r_uh": 0.35,         #3
+                          "r_uh_m": 11/totalpop,#4
+                          "r_uh_h": 5.5/totalpop,#5
+                          "r_mh": 0.1,           #6
+                          "r_mh_u": 10/totalpop, #7
+                          "r_mh_h": 5/totalpop,  #8
+                          "r_hu": 0.1,            #9
+                          "r_hu_u": 10/totalpop, #10
+                          "r_hu_h": 5/totalpop,   #11
+                          "birth_rate": 1.6         #12
+    }
+    parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+    default_arr = np.array([default_parameters[key] for key in parameter_labels])
+    index_to_change = parameter_labels.index(param_to_change)
+    step_size = round((param_end_val-param_begin_val)/(step_count-1), 5)
+
+    #one row of parameters for every step
+    param_matrix = np.tile(default_arr, (step_count, 1))
+    param_matrix[:, index_to_change] = param_begin_val + (np.arange(step_count)*step_size)
+
+    start = time.perf_counter()
+    if queue_directory is None:
+        output = RunSweepProcesses(param_matrix, batch_size, trial_max_length, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, seed, replicas_per_stream, workers, threads_per_worker, partitions)
+    else:
+        CreateQueue(queue_directory, param_matrix, batch_size, trial_max_length, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, seed, replicas_per_stream, partitions)
+        print(f"Other machines can join with: python process_runner.py worker {os.path.abspath(queue_directory)}")
+        #the local workers are just queue workers too
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for task in [executor.submit(RunQueueWorker, queue_directory, threads_per_worker) for worker in range(workers)]:
+                task.result()
+        output = CollectQueue(queue_directory)
+    print(f"Sweep of {step_count} x {batch_size} runs took {time.perf_counter() - start:.1f} seconds")
+    np.save(output_file, output)
@@ -1,9 +1,8 @@
 import numpy as np
 import gillespie_coordinate
+import ctmc_coordinate
+import sweep_scheduler
 import matplotlib.pyplot as plt
-import numba
-import statistics
-from numba import prange
 
 """
 switching_coordinates: performs many gillespie runs at once to find the average amount of methylation and unmethylation when switches happen. 
@@ -12,6 +11,9 @@ Edit the birth rate directly in the dictionary (on line 47) in this file.
 
 If you want histograms showing more detailed distributions, find the code blocks that say `edit here` and uncomment the graphing code.
 This will make a histogram for each switching direction in addition to the single, default graph.
+
+Set `solver` to "exact" to skip the simulations and compute the exact probability of switching at every coordinate
+instead (see ctmc_coordinate.py). Each coordinate is drawn with a size proportional to its probability.
 """
 
 #-----------parameters - edit here-------------
@@ -20,12 +22,18 @@ This will make a histogram for each switching direction in addition to the singl
 batch_size = 5000
 #define length of trials in steps (default 1000) - they will usually stop earlier, this is more for allocating space
 trial_max_length = 10000
+#random seed - set to an integer to make the results reproducible, or None for different results every run
+seed = None
+#each block of this many runs gets its own random number generator (see gillespie_coordinate.spawn_generators)
+replicas_per_stream = 10
 #define starting population
 totalpop = 100
 methylatedpop = 15
 unmethylatedpop = 75
 #SwitchDirection - a simulation terminates when it reaches this state
 SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+#solver - "gillespie" runs batches of simulations, "exact" finds the exact distribution of the switching coordinates
+solver = "gillespie"
 #-----------Rates Dictionary---------
 default_parameters = {"r_hm": 0.5,          #0
                       "r_hm_m": 20/totalpop, #1
@@ -65,37 +73,43 @@ parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh
 #this line creates a numpy array with the same values as the dictionary - it is VITAL that they stay in the same order!!
 #changing the order of either the labels or the stuff in this list will create subtle errors in the rate calculations!
 default_arr = np.array([default_parameters[key] for key in parameter_labels])
-
-#-----------simulation - unmethylated to methylated-----------
-@numba.jit(nopython=True, parallel=True)
-def main(rng):
-    output_array = np.zeros(batch_size)
-    crossing_coordinates = [(-1,-1)] * batch_size
-
-    #run a batch of identical gillespie algorithms, store the results in output_array[step]
-    for i in prange(batch_size):
-        output_array[i],crossing_coordinates[i]  = gillespie_coordinate.GillespieSwitchFun(trial_max_length, default_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection,rng)
-    return output_array,crossing_coordinates
-
-generator = np.random.default_rng()
-
-#-----------Call simulation-----------
-output,crossing_coordinates = main(generator)
-
-#-----------Process results#----------
-#filter out all timed-out runs and their coordinates
-methyl_tuple_output = [(output[index],crossing_coordinates[index]) for index in range(batch_size) if output[index] >= 0]
-#unpack the valid pairs into times and coordinates
-methyl_valid_times, methyl_valid_coordinates = zip(*methyl_tuple_output)
-#unpack the coordinates into x and y arrays
-methyl_xcoords, methyl_ycoords = zip(*methyl_valid_coordinates)
-
-#if histograms are desired, uncomment the following code
-#-------edit here-------
-# plt.close()
-# plt.title("U->M histogram")
-# plt.hist(methyl_ycoords)
-# plt.show()
+#number of random number generators used for each switching direction
+stream_count = -(-batch_size // replicas_per_stream)
+#every block of runs gets an independent stream - the first half is used for U->M and the second half for M->U
+generators = gillespie_coordinate.spawn_generators(2*stream_count, seed)
+
+#-----------simulation-----------
+#runs a batch of identical gillespie algorithms from the current starting populations (see sweep_scheduler.py - this is
+#a sweep with a single parameter vector), and returns the switching times and the coordinates where each run switched.
+#this is plain python, so it picks up the swapped populations below without being compiled a second time
+def main(rngs):
+    output_array, thread_steps, thread_items = sweep_scheduler.RunSweep(default_arr[np.newaxis, :], batch_size, trial_max_length, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, rngs, replicas_per_stream)
+    crossing_coordinates = [(int(methylated), int(unmethylated)) for methylated, unmethylated in output_array[0, :, 1:]]
+    return output_array[0, :, 0], crossing_coordinates
+
+if solver == "gillespie":
+    #-----------Call simulation-----------
+    output,crossing_coordinates = main(generators[:stream_count])
+
+    #-----------Process results#----------
+    #filter out all timed-out runs and their coordinates
+    methyl_tuple_output = [(output[index],crossing_coordinates[index]) for index in range(batch_size) if output[index] >= 0]
+    #unpack the valid pairs into times and coordinates
+    methyl_valid_times, methyl_valid_coordinates = zip(*methyl_tuple_output)
+    #unpack the coordinates into x and y arrays
+    methyl_xcoords, methyl_ycoords = zip(*methyl_valid_coordinates)
+
+    #if histograms are desired, uncomment the following code
+    #-------edit here-------
+    # plt.close()
+    # plt.title("U->M histogram")
+    # plt.hist(methyl_ycoords)
+    # plt.show()
+
+    #every simulated switch counts equally
+    methyl_weights = np.ones(len(methyl_xcoords)) / len(methyl_xcoords)
+else:
+    methyl_xcoords, methyl_ycoords, methyl_weights = ctmc_coordinate.SwitchingCoordinateDistribution(default_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection)
 
 #-----------switch parameters-----------
 SwitchDirection = -1
@@ -103,54 +117,53 @@ temp = methylatedpop
 methylatedpop = unmethylatedpop
 unmethylatedpop = temp
 
-#-----------simulation - methylated to unmethylated-----------
-@numba.jit(nopython=True, parallel=True)
-def main(rng):
-    output_array = np.zeros(batch_size)
-    crossing_coordinates = [(-1,-1)] * batch_size
-
-    #run a batch of identical gillespie algorithms, store the results in output_array[step]
-    for i in range(batch_size):
-        output_array[i],crossing_coordinates[i]  = gillespie_coordinate.GillespieSwitchFun(trial_max_length, default_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection,rng)
-    return output_array,crossing_coordinates
-
-generator = np.random.default_rng()
-
-#-----------Call simulation-----------
-output,crossing_coordinates = main(generator)
-
-#-----------Process results-----------
-#filter out all timed-out runs and their coordinates
-unmethyl_tuple_output = [(output[index],crossing_coordinates[index]) for index in range(batch_size) if output[index] >= 0]
-#unpack the valid pairs into times and coordinates
-unmethyl_valid_times, unmethyl_valid_coordinates = zip(*unmethyl_tuple_output)
-#unpack the coordinates into x and y arrays
-unmethyl_xcoords, unmethyl_ycoords = zip(*unmethyl_valid_coordinates)
-
-#if histograms are desired, uncomment the following code
-#-------edit here-------
-# plt.close()
-# plt.title("M->U histogram")
-# plt.hist(unmethyl_xcoords)
-# plt.show()
+if solver == "gillespie":
+    #-----------Call simulation-----------
+    output,crossing_coordinates = main(generators[stream_count:])
+
+    #-----------Process results-----------
+    #filter out all timed-out runs and their coordinates
+    unmethyl_tuple_output = [(output[index],crossing_coordinates[index]) for index in range(batch_size) if output[index] >= 0]
+    #unpack the valid pairs into times and coordinates
+    unmethyl_valid_times, unmethyl_valid_coordinates = zip(*unmethyl_tuple_output)
+    #unpack the coordinates into x and y arrays
+    unmethyl_xcoords, unmethyl_ycoords = zip(*unmethyl_valid_coordinates)
+
+    #if histograms are desired, uncomment the following code
+    #-------edit here-------
+    # plt.close()
+    # plt.title("M->U histogram")
+    # plt.hist(unmethyl_xcoords)
+    # plt.show()
+
+    unmethyl_weights = np.ones(len(unmethyl_xcoords)) / len(unmethyl_xcoords)
+else:
+    unmethyl_xcoords, unmethyl_ycoords, unmethyl_weights = ctmc_coordinate.SwitchingCoordinateDistribution(default_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection)
+
+#find the mean coordinates of each transition, weighted by how likely each coordinate is
+methyl_mean = (np.average(methyl_xcoords, weights=methyl_weights), np.average(methyl_ycoords, weights=methyl_weights))
+unmethyl_mean = (np.average(unmethyl_xcoords, weights=unmethyl_weights), np.average(unmethyl_ycoords, weights=unmethyl_weights))
+#the exact solver draws each coordinate with a size proportional to its probability
+methyl_sizes = None if solver == "gillespie" else 200 * methyl_weights / np.max(methyl_weights)
+unmethyl_sizes = None if solver == "gillespie" else 200 * unmethyl_weights / np.max(unmethyl_weights)
 
 plt.rcParams["figure.autolayout"] = True
 fig = plt.figure()
 ax = fig.add_subplot(1,1,1)
-plt.title(f"""Mean of methylated side: ({statistics.mean(methyl_xcoords):.2f},{statistics.mean(methyl_ycoords):.2f}),
-        Mean of unmethylated side: ({statistics.mean(unmethyl_xcoords):.2f},{statistics.mean(unmethyl_ycoords):.2f})\n
+plt.title(f"""Mean of methylated side: ({methyl_mean[0]:.2f},{methyl_mean[1]:.2f}),
+        Mean of unmethylated side: ({unmethyl_mean[0]:.2f},{unmethyl_mean[1]:.2f})\n
         Start condition = {methylatedpop}/{unmethylatedpop}, Birth rate = {default_parameters['birth_rate']}""")
 
 ax.set_xlim(0, 100)
 ax.set_ylim(0, 100)
 ax.grid(True)
 #plot scatter and mean for the U->M transition
-ax.scatter(methyl_xcoords,methyl_ycoords,linestyle='',marker='.')
-ax.plot(statistics.mean(methyl_xcoords),statistics.mean(methyl_ycoords),'ro')
+ax.scatter(methyl_xcoords,methyl_ycoords,s=methyl_sizes,linestyle='',marker='.')
+ax.plot(methyl_mean[0],methyl_mean[1],'ro')
 
 #plot scatter and mean for the M->U transition
-ax.scatter(unmethyl_xcoords,unmethyl_ycoords,linestyle='',marker='.')
-ax.plot(statistics.mean(unmethyl_xcoords),statistics.mean(unmethyl_ycoords),'ro')
+ax.scatter(unmethyl_xcoords,unmethyl_ycoords,s=unmethyl_sizes,linestyle='',marker='.')
+ax.plot(unmethyl_mean[0],unmethyl_mean[1],'ro')
 
 
 ax.plot([100, 0],[0, 100], label='Boundary of Triangle')
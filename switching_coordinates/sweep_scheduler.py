@@ -0,0 +1,20 @@
+#gillespie_coordinate puts the top folder of the repository on sys.path
+import gillespie_coordinate
+import methylation_sim
+from methylation_sim import run_sweep, print_utilisation
+
+"""
+This file runs a whole sweep (every parameter value x every replica) in one parallel loop with methylation_sim/sweep.py,
+and asks it to keep the state every run switched into.
+
+Input: a (step_count, 13) matrix of parameter vectors, the batch size and the usual simulation settings
+Output: a (step_count, batch_size, 3) array - for every run, the switching time (negative for time-outs, just like
+GillespieSwitchFun), then the methylated and unmethylated counts where it switched (-1 for time-outs),
+plus the number of gillespie steps and work items each thread ran, which is how we measure utilisation.
+"""
+
+#Runs the sweep with work items handed out chunk_size at a time (see methylation_sim.RunSweep), and keeps the
+#(time, methylated, unmethylated) of every run.
+def RunSweep(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream, chunk_size=1):
+    return methylation_sim.RunSweep(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream,
+                                    chunk_size, record_state=True)
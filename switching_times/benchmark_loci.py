@@ -0,0 +1,77 @@
+import numpy as np
+import numba
+import gillespie_time as gillespie_time
+import time
+
+"""
+Compares simulating many independent domains (loci) with methylation_sim.LociSwitchingTimes against calling
+GillespieSwitchFun for each of them from python.
+
+Every domain gets its own parameter vector - the defaults, with the birth rate drawn between birth_rate_low and
+birth_rate_high - and both versions run the same switches with the same generators (one per chunk of chunk_size domains),
+so the switching times must come out identical. We print how long each version took, the number of domains per second
+and the time per gillespie step. The batch version saves a python call per domain and runs the chunks on every core
+(numba.get_num_threads() of them), so most of its speed-up comes from the number of cores.
+"""
+
+#-----------parameters - edit here-----------
+#number of domains
+domain_count = 100000
+#number of sites in every domain
+totalpop = 100
+#define length of trials in steps - domains that don't switch by then count as time-outs
+trial_max_length = 2000
+#each chunk of this many domains is one work item of the parallel loop, with its own random number generator
+chunk_size = 64
+#range of the birth rates of the domains
+birth_rate_low = 0.5
+birth_rate_high = 3.0
+#starting counts of methylated and unmethylated sites
+methylatedpop = 10
+unmethylatedpop = 90
+#SwitchDirection - a simulation terminates when it reaches this state
+SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+seed = 0
+#-----------Rates Dictionary---------
+#the collaborative parameters are per site - they get divided by the number of sites
+per_site_parameters = {"r_hm": 0.5,   #0
+                       "r_hm_m": 20,  #1
+                       "r_hm_h": 10,  #2
+                       "r_uh": 0.35,  #3
+                       "r_uh_m": 11,  #4
+                       "r_uh_h": 5.5, #5
+                       "r_mh": 0.1,   #6
+                       "r_mh_u": 10,  #7
+                       "r_mh_h": 5,   #8
+                       "r_hu": 0.1,   #9
+                       "r_hu_u": 10,  #10
+                       "r_hu_h": 5,   #11
+                       "birth_rate": 1 #12
+}
+parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+per_site_arr = np.array([per_site_parameters[key] for key in parameter_labels], dtype=np.float64)
+param_matrix = np.tile(per_site_arr, (domain_count, 1))
+param_matrix[:, 12] = np.random.default_rng(seed).uniform(birth_rate_low, birth_rate_high, domain_count)
+param_matrix = gillespie_time.scale_parameters(param_matrix, totalpop)
+
+#-----------compile both versions before timing them-----------
+gillespie_time.LociSwitchingTimes(param_matrix[:2], totalpop, methylatedpop, unmethylatedpop, SwitchDirection, 10, seed, chunk_size)
+gillespie_time.GillespieSwitchFun(10, param_matrix[0], totalpop, methylatedpop, unmethylatedpop, SwitchDirection, np.random.default_rng(seed))
+
+#-----------benchmark-----------
+#the generators are made outside the timed loop, since the batch version makes the same ones
+rngs = gillespie_time.spawn_generators(-(-domain_count // chunk_size), seed)
+start = time.perf_counter()
+looped = np.array([gillespie_time.GillespieSwitchFun(trial_max_length, param_matrix[k], totalpop, methylatedpop, unmethylatedpop, SwitchDirection, rngs[k // chunk_size])
+                   for k in range(domain_count)])
+looped_time = time.perf_counter() - start
+
+start = time.perf_counter()
+batched, steps = gillespie_time.LociSwitchingTimes(param_matrix, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, trial_max_length, seed, chunk_size)
+batched_time = time.perf_counter() - start
+
+print(f"{domain_count} domains, {steps} steps, {100*np.mean(batched < 0):.1f}% timed out, {numba.get_num_threads()} threads")
+print(f"  python loop: {looped_time:8.2f} s, {domain_count/looped_time:10.0f} domains/s, {1e9*looped_time/steps:6.1f} ns/step")
+print(f"  batch:       {batched_time:8.2f} s, {domain_count/batched_time:10.0f} domains/s, {1e9*batched_time/steps:6.1f} ns/step "
+      f"({looped_time/batched_time:.1f}x faster)")
+print(f"  same switching times: {np.array_equal(looped, batched)}")
@@ -0,0 +1,77 @@
+import numpy as np
+import gillespie_time as gillespie_time
+import time
+
+"""
+Measures the cost of one gillespie step of the switching time simulations as the number of sites grows.
+
+The parameters are given per site and scaled for each site count (see methylation_sim.scale_parameters), and every
+run starts from the same proportions. For each site count we run switches until step_budget steps have been taken and
+print the time per step of:
+- switch_kernel, which recomputes the rates on every step - this should stay flat, since the switch is checked against
+  integer cut-offs (methylation_sim.switch_cutoff) and nothing else depends on the number of sites
+- switch_table_kernel, which looks the rates up in a table with (N+1)(N+2)/2 rows - whether that beats recomputing
+  them depends on the machine, but the table can't be built past table_limit sites (10,000 sites would need 2 GB)
+"""
+
+#-----------parameters - edit here-----------
+site_counts = [100, 300, 1000, 3000, 10000, 30000]
+#the rate table is only built up to this many sites
+table_limit = 3000
+#how many steps to time for each site count
+step_budget = 20000000
+#starting proportions of methylated and unmethylated sites
+methylated_fraction = 0.1
+unmethylated_fraction = 0.9
+#SwitchDirection - a simulation terminates when it reaches this state
+SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+seed = 0
+#-----------Rates Dictionary---------
+#the collaborative parameters are per site - they get divided by the number of sites
+per_site_parameters = {"r_hm": 0.5,   #0
+                       "r_hm_m": 20,  #1
+                       "r_hm_h": 10,  #2
+                       "r_uh": 0.35,  #3
+                       "r_uh_m": 11,  #4
+                       "r_uh_h": 5.5, #5
+                       "r_mh": 0.1,   #6
+                       "r_mh_u": 10,  #7
+                       "r_mh_h": 5,   #8
+                       "r_hu": 0.1,   #9
+                       "r_hu_u": 10,  #10
+                       "r_hu_h": 5,   #11
+                       "birth_rate": 1 #12
+}
+parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+per_site_arr = np.array([per_site_parameters[key] for key in parameter_labels], dtype=np.float64)
+
+#-----------compile both versions before timing them-----------
+param_arr = gillespie_time.scale_parameters(per_site_arr, 100)
+gillespie_time.switch_kernel(10, param_arr, 100, 10, 90, SwitchDirection, np.random.default_rng(seed), None)
+gillespie_time.switch_table_kernel(10, gillespie_time.build_rate_table(param_arr, 100), 100, 10, 90, SwitchDirection, np.random.default_rng(seed))
+
+#-----------benchmark-----------
+#Runs switches with run(steps, rng) until step_budget steps have been taken - the last run is cut short so the total
+#is exactly step_budget. run returns the number of steps it took. Returns the time per step in nanoseconds.
+def time_per_step(run):
+    rng = np.random.default_rng(seed)
+    steps_left = step_budget
+    start = time.perf_counter()
+    while steps_left > 0:
+        steps_left -= run(steps_left + 1, rng)
+    return 1e9 * (time.perf_counter() - start) / step_budget
+
+print(f"{'sites':>8} {'recomputed rates':>18} {'rate table':>18}")
+for totalpop in site_counts:
+    param_arr = gillespie_time.scale_parameters(per_site_arr, totalpop)
+    methylatedpop = int(round(methylated_fraction * totalpop))
+    unmethylatedpop = int(round(unmethylated_fraction * totalpop))
+
+    #switch_kernel counts the starting state as a step, the table kernel doesn't
+    direct = time_per_step(lambda steps, rng: gillespie_time.switch_kernel(steps, param_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, rng, None)[3] - 1)
+    table_text = "-"
+    if totalpop <= table_limit:
+        rate_table = gillespie_time.build_rate_table(param_arr, totalpop)
+        table = time_per_step(lambda steps, rng: gillespie_time.switch_table_kernel(steps, rate_table, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, rng)[3])
+        table_text = f"{table:.1f} ns/step"
+    print(f"{totalpop:>8} {direct:>10.1f} ns/step {table_text:>18}")
@@ -0,0 +1,78 @@
+import numpy as np
+import scipy.stats as stats
+import gillespie_time as gillespie_time
+import time
+
+"""
+Compares the tau-leaping simulation (gillespie_time.GillespieSwitchLeapFun, see methylation_sim/tau_leap.py) with the
+exact one (GillespieSwitchFun) for growing site counts.
+
+For every site count the parameters are the defaults, scaled by the site count like in simulation_time.py, and both
+simulations start from the same proportions. Every version runs the same number of switches (with different random
+streams), and we print how long they took, the mean and standard deviation of the switching times, and the p-value of a
+two-sample KS test against the exact switching times - a small p-value means the leaps changed the distribution.
+The exact simulation recomputes the rates on every step, since the rate table for 10,000 sites doesn't fit in memory.
+"""
+
+#-----------parameters - edit here-----------
+#site counts to compare, and how many switches to simulate for each of them
+site_counts = [100, 1000, 10000]
+runs = {100: 1000, 1000: 200, 10000: 50}
+#leap conditions to try - a larger epsilon takes longer leaps
+epsilons = [0.03, 0.1, 0.3]
+#define length of trials - the exact simulation times out after this many steps, the approximate one after this many leaps
+trial_max_length = 1000000000
+#starting proportions of methylated and unmethylated sites
+methylated_fraction = 0.1
+unmethylated_fraction = 0.9
+#SwitchDirection - a simulation terminates when it reaches this state
+SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+seed = 0
+#-----------Rates Dictionary---------
+def default_array(totalpop):
+    default_parameters = {"r_hm": 0.5,          #0
+                          "r_hm_m": 20/totalpop, #1
+                          "r_hm_h": 10/totalpop, #2
+                          "r_uh": 0.35,         #3
+                          "r_uh_m": 11/totalpop,#4
+                          "r_uh_h": 5.5/totalpop,#5
+                          "r_mh": 0.1,           #6
+                          "r_mh_u": 10/totalpop, #7
+                          "r_mh_h": 5/totalpop,  #8
+                          "r_hu": 0.1,            #9
+                          "r_hu_u": 10/totalpop, #10
+                          "r_hu_h": 5/totalpop,   #11
+                          "birth_rate": 1         #12
+    }
+    parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+    return np.array([default_parameters[key] for key in parameter_labels])
+
+#-----------compile both versions before timing them-----------
+gillespie_time.GillespieSwitchFun(10, default_array(100), 100, 10, 90, SwitchDirection, np.random.default_rng(seed))
+gillespie_time.GillespieSwitchLeapFun(10, default_array(100), 100, 10, 90, SwitchDirection, np.random.default_rng(seed), epsilons[0])
+
+#-----------benchmark-----------
+#Runs `count` switches with function(*args, rng, *extra), each with its own random stream.
+#Returns the switching times and how long they took.
+def switching_times(function, count, args, extra=()):
+    rngs = gillespie_time.spawn_generators(count, seed)
+    start = time.perf_counter()
+    output = np.array([function(*args, rng, *extra) for rng in rngs])
+    return output, time.perf_counter() - start
+
+for totalpop in site_counts:
+    param_arr = default_array(totalpop)
+    methylatedpop = int(methylated_fraction * totalpop)
+    unmethylatedpop = int(unmethylated_fraction * totalpop)
+    args = (trial_max_length, param_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection)
+
+    exact, exact_time = switching_times(gillespie_time.GillespieSwitchFun, runs[totalpop], args)
+    exact = exact[exact >= 0]
+    print(f"{totalpop} sites, {runs[totalpop]} switches")
+    print(f"  exact:          {exact_time:8.2f} s, mean {np.mean(exact):8.3f}, sd {np.std(exact):8.3f}")
+    for epsilon in epsilons:
+        leaped, leaped_time = switching_times(gillespie_time.GillespieSwitchLeapFun, runs[totalpop], args, (epsilon,))
+        leaped = leaped[leaped >= 0]
+        p_value = stats.ks_2samp(exact, leaped).pvalue
+        print(f"  epsilon = {epsilon:<5}: {leaped_time:8.2f} s, mean {np.mean(leaped):8.3f}, sd {np.std(leaped):8.3f}, "
+              f"{exact_time/leaped_time:6.1f}x faster, KS p-value {p_value:.3f}")
@@ -0,0 +1,147 @@
+import numpy as np
+import scipy.optimize as optimize
+import scipy.special as special
+import scipy.stats as stats
+
+"""
+Fits switching time distributions without throwing away the runs that timed out.
+
+A run that times out after time t (stored as -t in the output of the simulations) still tells us that the switching
+time is longer than t - it is a right-censored observation. Dropping those runs, like the original postprocessing did,
+biases every fit towards short times, and it means the fits have to be skipped once half of the runs time out.
+Here every fit is a maximum likelihood fit where a switch at time t contributes its density f(t), and a time-out at
+time t contributes the probability of not having switched yet, S(t) = 1 - F(t).
+
+- exponential_fit: the exact maximum likelihood mean (total time observed / number of switches), for every step at once
+- weibull_fit: shape and scale for every step at once - the scale has a closed form for a given shape, so the shape
+  is found by bisection on all the rows together
+- gamma_fit and normal_fit: a numerical fit of one row - these have no closed form, so they are still done row by row
+- censored_ks: the KS distance between a fitted CDF and the Kaplan-Meier estimate of the CDF, which is the censored
+  version of the empirical CDF, for every step at once
+
+Every function takes rows of the raw simulation output (negative values are time-outs). Runs that were never done
+(nan, like the unused runs of an adaptive sweep) are ignored. The locations are fixed at 0, just like the floc=0 fits in
+simulation_time.py.
+"""
+
+#Splits rows of simulation output into the observed times and whether each run switched (True) or timed out (False).
+#Runs that were never done become time-outs at time 0, which don't change the exponential and weibull fits.
+def split_censored(output):
+    output = np.asarray(output, dtype=np.float64)
+    return np.nan_to_num(np.abs(output)), output >= 0
+
+#Drops the runs that were never done from one row
+def finished_runs(output_row):
+    output_row = np.asarray(output_row, dtype=np.float64)
+    return output_row[~np.isnan(output_row)]
+
+#Exponential fit of every row: the mean switching time is the total time observed (switched or not) divided by the
+#number of switches. Returns one mean per row, nan for rows without any switches.
+def exponential_fit(output):
+    times, switched = split_censored(np.atleast_2d(output))
+    switches = np.sum(switched, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(switches > 0, np.sum(times, axis=1) / switches, np.nan)
+
+#Weibull fit of every row. For a fixed shape k the best scale is (sum of t^k / number of switches)^(1/k), and the best
+#shape solves sum(t^k log t)/sum(t^k) - 1/k - mean(log t over switches) = 0, which only has one root, so all the rows
+#are solved together by bisection on log(k). Returns the shapes and scales, nan for rows without any switches.
+def weibull_fit(output, iterations=60):
+    times, switched = split_censored(np.atleast_2d(output))
+    switches = np.sum(switched, axis=1)
+    #work relative to the largest time in each row, so t^k doesn't overflow
+    largest = np.max(times, axis=1, keepdims=True)
+    largest[largest == 0] = 1
+    scaled = times / largest
+    with np.errstate(divide='ignore'):
+        log_scaled = np.where(scaled > 0, np.log(scaled), 0.0)
+    with np.errstate(invalid='ignore'):
+        mean_log_switched = np.sum(np.where(switched, log_scaled, 0.0), axis=1) / switches
+
+    #the score is increasing in the shape, so keep the half of the bracket where it changes sign
+    def score(shape):
+        powers = np.where(scaled > 0, scaled ** shape[:, np.newaxis], 0.0)
+        return np.sum(powers * log_scaled, axis=1) / np.sum(powers, axis=1) - 1/shape - mean_log_switched
+    low = np.full(len(times), np.log(1e-3))
+    high = np.full(len(times), np.log(1e3))
+    for iteration in range(iterations):
+        middle = (low + high) / 2
+        positive = score(np.exp(middle)) > 0
+        high = np.where(positive, middle, high)
+        low = np.where(positive, low, middle)
+    shape = np.exp((low + high) / 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = largest[:, 0] * (np.sum(scaled ** shape[:, np.newaxis], axis=1) / switches) ** (1/shape)
+    no_switches = switches == 0
+    shape[no_switches] = np.nan
+    scale[no_switches] = np.nan
+    return shape, scale
+
+#Maximum likelihood fit of one row for any two-parameter distribution, given its log density and log survival function
+#in terms of the log of its parameters (so the optimizer never tries negative values), and a starting guess.
+def censored_mle(times, switched, log_pdf, log_sf, start):
+    switch_times = times[switched]
+    censored_times = times[~switched]
+    def negative_log_likelihood(log_parameters):
+        total = np.sum(log_pdf(switch_times, log_parameters)) + np.sum(log_sf(censored_times, log_parameters))
+        return -total if np.isfinite(total) else np.inf
+    result = optimize.minimize(negative_log_likelihood, np.log(start), method='Nelder-Mead', options={'xatol': 1e-8, 'fatol': 1e-10, 'maxiter': 2000})
+    return np.exp(result.x)
+
+#Gamma fit of one row. Returns (shape, location, scale) like stats.gamma.fit with floc=0, or Nones without any switches.
+def gamma_fit(output_row):
+    times, switched = split_censored(finished_runs(output_row))
+    if not np.any(switched):
+        return None, None, None
+    #start from the method of moments on the switches
+    mean = np.mean(times[switched])
+    variance = max(np.var(times[switched]), 1e-12 * mean**2)
+    #written out with scipy.special, since the stats.gamma methods are much slower to call thousands of times
+    def log_pdf(t, log_parameters):
+        shape, scale = np.exp(log_parameters)
+        return special.xlogy(shape - 1, t) - t/scale - shape*log_parameters[1] - special.gammaln(shape)
+    def log_sf(t, log_parameters):
+        shape, scale = np.exp(log_parameters)
+        with np.errstate(divide='ignore'):
+            return np.log(special.gammaincc(shape, t/scale))
+    shape, scale = censored_mle(times, switched, log_pdf, log_sf, [mean**2 / variance, variance / mean])
+    return shape, 0, scale
+
+#Normal fit of one row. Returns (mean, S.D.) like stats.norm.fit, or Nones without any switches.
+def normal_fit(output_row):
+    times, switched = split_censored(finished_runs(output_row))
+    if not np.any(switched):
+        return None, None
+    #the mean can't be negative here, since every time is positive, so it is fitted on a log scale too
+    log_pdf = lambda t, log_parameters: stats.norm.logpdf(t, np.exp(log_parameters[0]), np.exp(log_parameters[1]))
+    log_sf = lambda t, log_parameters: stats.norm.logsf(t, np.exp(log_parameters[0]), np.exp(log_parameters[1]))
+    mean, sd = censored_mle(times, switched, log_pdf, log_sf, [np.mean(times[switched]), max(np.std(times[switched]), 1e-6 * np.mean(times[switched]))])
+    return mean, sd
+
+#Kaplan-Meier estimate of the CDF of every row. Returns the times of each row (sorted), whether each run switched, and
+#the estimated CDF just after and just before each run. Runs that were never done are put first and take no part.
+def kaplan_meier(output):
+    output = np.atleast_2d(np.asarray(output, dtype=np.float64))
+    times, switched = split_censored(output)
+    done = ~np.isnan(output)
+    #at equal times, count the switches before the time-outs
+    order = np.lexsort((~switched, times, done), axis=-1)
+    times = np.take_along_axis(times, order, axis=1)
+    switched = np.take_along_axis(switched, order, axis=1)
+    finished = np.sum(done, axis=1, keepdims=True)
+    at_risk = finished - (np.arange(output.shape[1]) - (output.shape[1] - finished))
+    survival = np.cumprod(np.where(switched, 1 - 1/np.maximum(at_risk, 1), 1.0), axis=1)
+    survival_before = np.concatenate((np.ones((len(output), 1)), survival[:, :-1]), axis=1)
+    return times, switched, 1 - survival, 1 - survival_before
+
+#KS distance between the CDF of every row (Kaplan-Meier estimate) and a fitted CDF, over the times where switches were seen.
+#cdf is called once with the (rows, runs) array of times, so per-row parameters go in as columns (parameters[:, np.newaxis]).
+#Without any time-outs this is the usual KS statistic. Returns one distance per row, nan for rows without any switches.
+def censored_ks(output, cdf):
+    times, switched, empirical_cdf, before_jump = kaplan_meier(output)
+    fitted_cdf = cdf(times)
+    #the empirical CDF jumps at every switch, so compare on both sides of each jump
+    distance = np.where(switched, np.maximum(np.abs(empirical_cdf - fitted_cdf), np.abs(before_jump - fitted_cdf)), -np.inf)
+    distance = np.max(distance, axis=1)
+    distance[~np.any(switched, axis=1)] = np.nan
+    return distance
@@ -0,0 +1,115 @@
+import os
+import sys
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as sparse_linalg
+import scipy.linalg as linalg
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from methylation_sim import state_index, state_count, build_generator, switch_region
+
+"""
+This file is an exact alternative to running batches of gillespie_time.GillespieSwitchFun.
+
+The model only tracks (methylated, unmethylated) with methylated + unmethylated <= totalpop,
+so for 100 sites there are only 5,151 possible states. If we treat every state where
+find_state == SwitchDirection as absorbing, the switching time is the time it takes the chain to be absorbed.
+Its mean and second moment solve a sparse linear system built from the same rate functions and events
+that the gillespie file uses, so they can be computed directly instead of fitted to thousands of runs.
+
+The same absorbing chain also gives the whole distribution of the switching time (a phase-type distribution),
+so SwitchingTimeDistribution can evaluate its exact CDF and PDF on any grid of times, which is
+useful for checking how exponential the switching time really is, or checking a histogram against the exact answer.
+
+Unlike the simulation, there are no time-outs: the answer is the exact mean over all runs, however long they take.
+The starting state should be outside of the switch region, just like in the simulation files.
+
+The generator matrix comes from the shared methylation_sim package (methylation_sim/ctmc.py).
+"""
+
+#Returns the generator restricted to the states outside the switch region (the "transient" states),
+#along with an array that maps each state to its row in that matrix (-1 for states in the switch region).
+def transient_generator(param_arr, totalpop, SwitchDirection):
+    rows, cols, vals = build_generator(np.asarray(param_arr, dtype=np.float64), totalpop)
+    in_region = switch_region(totalpop, SwitchDirection)
+    transient_count = np.count_nonzero(~in_region)
+    transient_index = np.full(len(in_region), -1)
+    transient_index[~in_region] = np.arange(transient_count)
+    keep = ~in_region[rows] & ~in_region[cols]
+    transient = sparse.csc_matrix((vals[keep], (transient_index[rows[keep]], transient_index[cols[keep]])),
+                                  shape=(transient_count, transient_count))
+    return transient, transient_index
+
+#Returns the exact mean and second moment of the switching time from (pop_methyl, pop_unmethyl).
+#The mean hitting times m solve T m = -1, and the second moments s solve T s = -2m,
+#where T is the generator restricted to the states outside the switch region.
+def SwitchingTimeMoments(param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection):
+    transient, transient_index = transient_generator(param_arr, totalpop, SwitchDirection)
+    start = transient_index[state_index(pop_methyl, pop_unmethyl, totalpop)]
+    if start < 0:
+        #we're already in the switch region
+        return 0.0, 0.0
+    solver = sparse_linalg.splu(transient)
+    mean_times = solver.solve(-np.ones(transient.shape[0]))
+    second_moments = solver.solve(-2 * mean_times)
+    return mean_times[start], second_moments[start]
+
+#Approximates exp(t A) v for every t in time_grid with a shift-and-invert Krylov method.
+#The generator is very stiff (the fastest rates are ~1000x larger than the switching rate), so methods like
+#uniformization or scipy's expm_multiply need about (largest rate * time) matrix-vector products, which takes minutes.
+#Instead, we build a small Krylov space of (I - shift*A)^-1, which only needs one sparse LU factorization.
+#The result is returned projected onto the columns of weights, so the big vectors never have to be stored for each t.
+def krylov_exponential(A, v, time_grid, weights, tolerance=1e-10, max_dimension=150):
+    size = A.shape[0]
+    shift = max(np.max(time_grid), 1e-12) / 10
+    solver = sparse_linalg.splu((sparse.identity(size, format='csc') - shift * A).tocsc())
+    basis = np.zeros((size, max_dimension + 1))
+    hessenberg = np.zeros((max_dimension + 1, max_dimension))
+    norm = np.linalg.norm(v)
+    basis[:, 0] = v / norm
+    #convergence is checked on (at most) 20 of the times, and the full grid is only evaluated once at the end
+    check_times = time_grid[np.unique(np.linspace(0, len(time_grid) - 1, 20).astype(np.int64))]
+    previous = None
+
+    for j in range(max_dimension):
+        w = solver.solve(basis[:, j])
+        #orthogonalize twice to keep the basis accurate
+        for repeat in range(2):
+            h = basis[:, :j+1].T @ w
+            w -= basis[:, :j+1] @ h
+            hessenberg[:j+1, j] += h
+        hessenberg[j+1, j] = np.linalg.norm(w)
+        dimension = j + 1
+        breakdown = hessenberg[j+1, j] < 1e-14
+        if not breakdown:
+            basis[:, j+1] = w / hessenberg[j+1, j]
+
+        #check for convergence every few steps
+        if dimension % 5 == 0 or breakdown or dimension == max_dimension:
+            inverse = np.linalg.inv(hessenberg[:dimension, :dimension])
+            projected_A = (np.eye(dimension) - inverse) / shift
+            projected_weights = basis[:, :dimension].T @ weights
+            result = np.array([norm * (projected_weights.T @ linalg.expm(t * projected_A)[:, 0]) for t in check_times])
+            if breakdown or (previous is not None and np.max(np.abs(result - previous)) < tolerance):
+                break
+            previous = result
+    return np.array([norm * (projected_weights.T @ linalg.expm(t * projected_A)[:, 0]) for t in time_grid])
+
+#Returns the exact CDF and PDF of the switching time from (pop_methyl, pop_unmethyl) at every time in time_grid.
+#If p(t) is the distribution over the states outside the switch region at time t, the CDF is 1 - sum(p(t)),
+#and the PDF is the total rate of jumping into the switch region, weighted by p(t).
+def SwitchingTimeDistribution(param_arr, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, time_grid):
+    time_grid = np.asarray(time_grid, dtype=np.float64)
+    transient, transient_index = transient_generator(param_arr, totalpop, SwitchDirection)
+    start = transient_index[state_index(pop_methyl, pop_unmethyl, totalpop)]
+    if start < 0:
+        #we're already in the switch region
+        return np.ones(len(time_grid)), np.zeros(len(time_grid))
+    #rows of the transient generator sum to minus the rate of switching
+    switch_rates = -np.asarray(transient.sum(axis=1)).ravel()
+    start_distribution = np.zeros(transient.shape[0])
+    start_distribution[start] = 1
+    weights = np.column_stack((np.ones(transient.shape[0]), switch_rates))
+    result = krylov_exponential(transient.T.tocsc(), start_distribution, time_grid, weights)
+    cdf = np.clip(1 - result[:, 0], 0, 1)
+    pdf = np.maximum(result[:, 1], 0)
+    return cdf, pdf
@@ -0,0 +1,108 @@
+import numpy as np
+import parameter_design
+import sweep_statistics
+import censored_fit
+import matplotlib.pyplot as plt
+import time
+
+"""
+Runs switching time simulations for a design over several parameters at once (see parameter_design.py), instead of
+the single parameter that simulation_time.py varies. All of the design points run in one parallel sweep.
+
+For every design point this finds the mean switching time (with time-outs counted as censored observations, see
+censored_fit.py), the exponential KS error and the proportion of runs that timed out, prints them, and saves
+everything to output_file (np.load gives the design, the parameter matrix, the raw output and the fits, one row per
+design point). The graph shows the mean switching time over the first one or two changed parameters.
+"""
+
+#-----------parameters - edit here-----------
+#design - "cartesian" runs every combination of the values in grid_ranges, "latin" and "sobol" spread point_count
+#points over the (low, high) bounds in sample_ranges
+design = "cartesian"
+grid_ranges = {"birth_rate": np.linspace(0.5, 2, 7),
+               "r_hm": np.linspace(0.3, 0.7, 5)}
+sample_ranges = {"birth_rate": (0.5, 2),
+                 "r_hm": (0.3, 0.7),
+                 "r_uh": (0.2, 0.5)}
+#number of points for the "latin" and "sobol" designs
+point_count = 64
+#define batch size - this determines how many runs are done at each design point
+batch_size = 1000
+#define length of trials in steps - runs that don't switch by then count as time-outs
+trial_max_length = 10000
+#random seed - set to an integer to make the results reproducible, or None for different results every run
+seed = None
+#each block of this many runs gets its own random number generator (see gillespie_time.spawn_generators)
+replicas_per_stream = 50
+#define starting population (number of sites)
+totalpop = 100
+methylatedpop = 10
+unmethylatedpop = 90
+#SwitchDirection - a simulation terminates when it reaches this state
+SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+#where the results are saved
+output_file = "design_sweep.npz"
+#-----------Rates Dictionary---------
+default_parameters = {"r_hm": 0.5,          #0
+                      "r_hm_m": 20/totalpop, #1
+                      "r_hm_h": 10/totalpop, #2
+                      "r_uh": 0.35,         #3
+                      "r_uh_m": 11/totalpop,#4
+                      "r_uh_h": 5.5/totalpop,#5
+                      "r_mh": 0.1,           #6
+                      "r_mh_u": 10/totalpop, #7
+                      "r_mh_h": 5/totalpop,  #8
+                      "r_hu": 0.1,            #9
+                      "r_hu_u": 10/totalpop, #10
+                      "r_hu_h": 5/totalpop,   #11
+                      "birth_rate": 1         #12
+}
+parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+default_arr = np.array([default_parameters[key] for key in parameter_labels])
+
+#-----------design-----------
+if design == "cartesian":
+    ranges = grid_ranges
+    param_matrix, design_points = parameter_design.CartesianDesign(default_arr, parameter_labels, ranges)
+elif design == "latin":
+    ranges = sample_ranges
+    param_matrix, design_points = parameter_design.LatinHypercubeDesign(default_arr, parameter_labels, ranges, point_count, seed)
+elif design == "sobol":
+    ranges = sample_ranges
+    param_matrix, design_points = parameter_design.SobolDesign(default_arr, parameter_labels, ranges, point_count, seed)
+else:
+    raise ValueError(f'design must be "cartesian", "latin" or "sobol", not {design!r}')
+keys = list(ranges)
+
+#-----------simulation-----------
+start = time.perf_counter()
+output = parameter_design.RunDesign(param_matrix, batch_size, trial_max_length, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, seed, replicas_per_stream)
+print(f"{len(param_matrix)} design points x {batch_size} runs took {time.perf_counter() - start:.1f} seconds")
+
+#-----------postprocessing-----------
+switches, mean, sd, gamma_shape, gamma_scale, exponential_KS, normal_KS, gamma_KS = sweep_statistics.RowStatistics(output)
+mean_switching_time = censored_fit.exponential_fit(output)
+timeouts = 1 - switches/batch_size
+
+for point in range(len(param_matrix)):
+    values = ", ".join(f"{key} = {design_points[point, column]:.4g}" for column, key in enumerate(keys))
+    print(f"{values}: mean switching time {mean_switching_time[point]:.4g}, exponential KS error {exponential_KS[point]:.3f}, {100*timeouts[point]:.1f}% timed out")
+
+np.savez(output_file, keys=np.array(keys), design=design_points, param_matrix=param_matrix, output=output,
+         mean_switching_time=mean_switching_time, exponential_KS=exponential_KS, timeouts=timeouts)
+print(f"Saved to {output_file}")
+
+#-----------graphing-----------
+if len(keys) == 1:
+    plt.plot(design_points[:, 0], mean_switching_time, marker='.', label="mean switching time")
+    plt.plot(design_points[:, 0], 10*timeouts, label="proportion timed out, scaled by 10x")
+    plt.xlabel(keys[0])
+    plt.legend()
+else:
+    #colour each design point by its mean switching time, over the first two changed parameters
+    points = plt.scatter(design_points[:, 0], design_points[:, 1], c=np.log10(mean_switching_time))
+    plt.colorbar(points, label="log10 mean switching time")
+    plt.xlabel(keys[0])
+    plt.ylabel(keys[1])
+plt.title(f"{design} design, {len(param_matrix)} points")
+plt.show()
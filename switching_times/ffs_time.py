@@ -0,0 +1,162 @@
+import numpy as np
+from numba import njit, prange, types
+import gillespie_time
+
+"""
+Forward flux sampling (FFS) for switching times that are too rare to simulate directly.
+
+When switching is rare, almost every run in simulation_time.py times out, and raising trial_max_length just spends
+more time watching the cell sit in its starting state. FFS splits the switch into a chain of smaller steps instead.
+The progress of a switch is measured by the count that has to grow - the methylated count when switching to
+methylated (SwitchDirection = 1), and the unmethylated count when switching to unmethylated (SwitchDirection = -1).
+Interfaces are placed on that count between the starting state and the 70% threshold used by find_state:
+- a basin run starts from the starting state and counts how often the progress leaves the basin (crosses the first
+  interface after having been back at or below the starting count) - that rate per unit time is the flux
+- from the states where those crossings happened, trial runs are fired until they either reach the next interface
+  (a success - the state becomes a starting point for the next interface) or fall back into the basin
+- the switching rate is the flux times the probability of getting through every interface, and for rare switches the
+  switching time is exponential with a mean of 1/rate
+
+Each FFS run is repeated `replicas` times with independent generators, which gives the standard error of the mean
+time. The cost is bounded by the settings (basin steps, trials per interface, and the step limit of each trial),
+no matter how rare the switch is.
+"""
+
+#Helper function that gives the progress of a switch in the given direction - the count that has to grow
+@njit(cache=True)
+def progress(methylated, unmethylated, SwitchDirection):
+    if SwitchDirection == 1:
+        return methylated
+    return unmethylated
+
+#Takes one gillespie step with the rate table from gillespie_time.build_rate_table (see methylation_sim.advance).
+#Returns the time the step took and the new state.
+@njit(cache=True)
+def table_step(rate_table, methylated, unmethylated, totalpop, rng):
+    row, tau, methylated, unmethylated = gillespie_time.advance(rate_table, totalpop, methylated, unmethylated, rng, True)
+    return tau, methylated, unmethylated
+
+#Picks the interfaces: interface_count values of the progress, evenly spaced from just above the starting state's
+#progress up to just below the first value where find_state says the switch has happened.
+def default_interfaces(totalpop, pop_methyl, pop_unmethyl, SwitchDirection, interface_count):
+    start = progress(pop_methyl, pop_unmethyl, SwitchDirection)
+    #the smallest count that find_state counts as switched
+    target = gillespie_time.switch_cutoff(totalpop)
+    interfaces = np.unique(np.round(np.linspace(start+1, target, interface_count+1)[:-1]).astype(np.int64))
+    return np.append(interfaces, target)
+
+#One complete FFS estimate of the switching rate. interfaces holds the progress values of the interfaces in increasing
+#order - the last one is where find_state says the switch has happened, and the basin is everything at or below the
+#starting progress. Up to `trials` crossings are kept at every interface (a random sample if there are more), and
+#`trials` trial runs of at most trial_max_length steps are fired from each interface.
+#Returns the flux out of the basin, the probability of reaching each next interface, and how many trials timed out.
+@njit(cache=True)
+def ffs_kernel(rate_table, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, interfaces, basin_steps, trials, trial_max_length, rng):
+    basin = progress(pop_methyl, pop_unmethyl, SwitchDirection)
+    interface_count = len(interfaces)
+    probabilities = np.zeros(interface_count - 1)
+    #the states stored at the current interface, and the ones found at the next interface
+    stored = np.zeros((trials, 2), dtype=np.int64)
+    found = np.zeros((trials, 2), dtype=np.int64)
+
+    #-----------flux out of the basin-----------
+    curr_methylated = pop_methyl
+    curr_unmethylated = pop_unmethyl
+    basin_time = 0.0
+    cutoff = gillespie_time.switch_cutoff(totalpop)
+    crossings = 0
+    #a crossing only counts if the run has been back in the basin since the last one
+    armed = True
+    for i in range(basin_steps):
+        tau, curr_methylated, curr_unmethylated = table_step(rate_table, curr_methylated, curr_unmethylated, totalpop, rng)
+        basin_time += tau
+        curr_progress = progress(curr_methylated, curr_unmethylated, SwitchDirection)
+        if curr_progress <= basin:
+            armed = True
+        elif armed and curr_progress >= interfaces[0]:
+            #keep a uniform random sample of at most `trials` crossings (reservoir sampling)
+            slot = crossings if crossings < trials else rng.integers(0, crossings + 1)
+            if slot < trials:
+                stored[slot, 0] = curr_methylated
+                stored[slot, 1] = curr_unmethylated
+            crossings += 1
+            armed = False
+        #if the basin run switches by itself, start it again - the time it spent switched doesn't count
+        if gillespie_time.find_state_cutoff(curr_methylated, curr_unmethylated, cutoff) == SwitchDirection:
+            curr_methylated = pop_methyl
+            curr_unmethylated = pop_unmethyl
+            armed = True
+    flux = crossings / basin_time
+    stored_count = min(crossings, trials)
+
+    #-----------probability of reaching each next interface-----------
+    timeouts = 0
+    for interface in range(interface_count - 1):
+        if stored_count == 0:
+            break
+        successes = 0
+        for trial in range(trials):
+            start = rng.integers(0, stored_count)
+            curr_methylated = stored[start, 0]
+            curr_unmethylated = stored[start, 1]
+            finished = False
+            for i in range(trial_max_length):
+                tau, curr_methylated, curr_unmethylated = table_step(rate_table, curr_methylated, curr_unmethylated, totalpop, rng)
+                curr_progress = progress(curr_methylated, curr_unmethylated, SwitchDirection)
+                if curr_progress >= interfaces[interface + 1]:
+                    found[successes, 0] = curr_methylated
+                    found[successes, 1] = curr_unmethylated
+                    successes += 1
+                    finished = True
+                    break
+                if curr_progress <= basin:
+                    finished = True
+                    break
+            if not finished:
+                timeouts += 1
+        probabilities[interface] = successes / trials
+        stored[:successes] = found[:successes]
+        stored_count = successes
+    return flux, probabilities, timeouts
+
+#Runs `replicas` independent FFS estimates for every row of param_matrix in parallel - replica r of step s uses
+#rngs[s*replicas + r]. Returns the (step_count, replicas) switching rates, the (step_count, replicas, interfaces-1)
+#probabilities of reaching each next interface, and the number of trials that timed out in each estimate.
+@njit((types.float64[:, ::1], types.int64, types.int64, types.int64, types.int64, types.int64[:], types.int64, types.int64, types.int64, types.List(gillespie_time.generator_type, reflected=True), types.int64), parallel=True, cache=True)
+def run_ffs_sweep(param_matrix, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, interfaces, basin_steps, trials, trial_max_length, rngs, replicas):
+    step_count = param_matrix.shape[0]
+    rates = np.zeros((step_count, replicas))
+    probabilities = np.zeros((step_count, replicas, len(interfaces) - 1))
+    timeouts = np.zeros((step_count, replicas), dtype=np.int64)
+    for work in prange(step_count * replicas):
+        step = work // replicas
+        replica = work % replicas
+        rate_table = gillespie_time.build_rate_table(param_matrix[step], totalpop)
+        flux, interface_probabilities, trial_timeouts = ffs_kernel(rate_table, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, interfaces,
+                                                                   basin_steps, trials, trial_max_length, rngs[work])
+        rates[step, replica] = flux * np.prod(interface_probabilities)
+        probabilities[step, replica] = interface_probabilities
+        timeouts[step, replica] = trial_timeouts
+    return rates, probabilities, timeouts
+
+#Estimates the mean switching time for every row of param_matrix with forward flux sampling.
+#interfaces defaults to interface_count evenly spaced interfaces (see default_interfaces).
+#Returns the mean switching times (inf where no run made it through every interface), their standard errors, the
+#fraction of trials that timed out, and the raw output of run_ffs_sweep.
+def FFSSwitchingTimes(param_matrix, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed=None, replicas=8, interfaces=None,
+                      interface_count=10, basin_steps=1000000, trials=1000, trial_max_length=100000):
+    param_matrix = np.ascontiguousarray(np.atleast_2d(param_matrix), dtype=np.float64)
+    if interfaces is None:
+        interfaces = default_interfaces(totalpop, pop_methyl, pop_unmethyl, SwitchDirection, interface_count)
+    interfaces = np.asarray(interfaces, dtype=np.int64)
+    rngs = gillespie_time.spawn_generators(len(param_matrix)*replicas, seed)
+    rates, probabilities, timeouts = run_ffs_sweep(param_matrix, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, interfaces,
+                                                   basin_steps, trials, trial_max_length, rngs, replicas)
+    mean_rate = np.mean(rates, axis=1)
+    #the error of the rate carries over to its inverse (delta method)
+    rate_error = np.std(rates, axis=1, ddof=1) / np.sqrt(replicas) if replicas > 1 else np.zeros(len(rates))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_time = 1 / mean_rate
+        time_error = rate_error / mean_rate**2
+    timeout_fraction = np.sum(timeouts, axis=1) / (replicas * trials * (len(interfaces) - 1))
+    return mean_time, time_error, timeout_fraction, (rates, probabilities, timeouts)
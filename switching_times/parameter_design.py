@@ -0,0 +1,61 @@
+import numpy as np
+import scipy.stats.qmc as qmc
+import gillespie_time
+import sweep_scheduler
+
+"""
+Builds sweeps over several parameters at once, and runs them with one call to the sweep scheduler.
+
+simulation_time.py varies one parameter along a line. To look at more of the 13-dimensional parameter space, a design
+is just a list of parameter vectors - one row of a (point_count, 13) matrix per design point - and
+sweep_scheduler.run_sweep already runs any such matrix in one parallel loop, so the whole design costs one compile
+and one launch. The design functions below start every row from the default parameters and change only the keys in
+`ranges`:
+- CartesianDesign: every combination of the given values of each key (a full grid)
+- LatinHypercubeDesign and SobolDesign: `count` points spread over the given (low, high) bounds of each key. These
+  cover many dimensions with far fewer points than a grid - a Sobol design is best with a power of 2 points.
+
+Each returns the parameter matrix and a (point_count, key_count) array of the values of the changed keys, in the
+order of `ranges`. RunDesign returns the (point_count, batch_size) switching times, so row i of every array belongs
+to design point i.
+"""
+
+#Full grid over the keys of ranges, which maps parameter names to lists of values.
+#The last key changes fastest, like np.meshgrid with indexing='ij'.
+def CartesianDesign(default_arr, parameter_labels, ranges):
+    grids = np.meshgrid(*[np.asarray(values, dtype=np.float64) for values in ranges.values()], indexing='ij')
+    design = np.stack([grid.ravel() for grid in grids], axis=1)
+    return design_matrix(default_arr, parameter_labels, ranges, design), design
+
+#count points of a Latin hypercube over the bounds in ranges, which maps parameter names to (low, high)
+def LatinHypercubeDesign(default_arr, parameter_labels, ranges, count, seed=None):
+    sampler = qmc.LatinHypercube(d=len(ranges), rng=np.random.default_rng(seed))
+    design = scale_unit_design(sampler.random(count), ranges)
+    return design_matrix(default_arr, parameter_labels, ranges, design), design
+
+#count points of a scrambled Sobol sequence over the bounds in ranges, which maps parameter names to (low, high)
+def SobolDesign(default_arr, parameter_labels, ranges, count, seed=None):
+    sampler = qmc.Sobol(d=len(ranges), rng=np.random.default_rng(seed))
+    design = scale_unit_design(sampler.random(count), ranges)
+    return design_matrix(default_arr, parameter_labels, ranges, design), design
+
+#Stretches points in the unit cube to the (low, high) bounds in ranges
+def scale_unit_design(unit_points, ranges):
+    bounds = np.array(list(ranges.values()), dtype=np.float64)
+    return qmc.scale(unit_points, bounds[:, 0], bounds[:, 1])
+
+#Copies the default parameters once for every design point and fills in the changed keys
+def design_matrix(default_arr, parameter_labels, ranges, design):
+    param_matrix = np.tile(np.asarray(default_arr, dtype=np.float64), (len(design), 1))
+    for column, key in enumerate(ranges):
+        param_matrix[:, parameter_labels.index(key)] = design[:, column]
+    return param_matrix
+
+#Runs batch_size simulations for every design point with sweep_scheduler.RunSweep.
+#Returns the (point_count, batch_size) switching times (negative for time-outs), with row i for design point i.
+def RunDesign(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, seed=None, replicas_per_stream=50):
+    streams_per_step = -(-batch_size // replicas_per_stream)
+    rngs = gillespie_time.spawn_generators(len(param_matrix)*streams_per_step, seed)
+    output, thread_steps, thread_items = sweep_scheduler.RunSweep(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream)
+    sweep_scheduler.print_utilisation(thread_steps, thread_items)
+    return output
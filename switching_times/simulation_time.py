@@ -1,10 +1,12 @@
 import numpy as np
 import gillespie_time
+import sweep_scheduler
+import ctmc_time
+import ffs_time
+import censored_fit
+import sweep_statistics
 import matplotlib.pyplot as plt
 import scipy.stats as stats
-import numba
-import statistics
-from numba import prange
 
 """
 Performs many gillespie runs at once to get information about the time 
@@ -15,6 +17,25 @@ Edit the parameters in the `parameters` block.
 There are many different graphing options for this simulation! 
 You can graph various parameters and goodness-of-fit measures for exponential, normal, and gamma fits,
 as well as the empirical mean of the measurements. To enable these graphs, simply uncomment them at the bottom of the file.
+
+Set `solver` to "exact" to skip the simulations and compute the exact mean and standard deviation of the switching time
+for every parameter value instead (see ctmc_time.py), or to "both" to compare the fits against the exact values.
+The exact solver also finds how far the switching time is from an exponential distribution (the KS distance between
+the exact CDF and an exponential with the same mean), and "both" measures the KS error of the simulated times against the exact CDF.
+
+Set `solver` to "ffs" to estimate the mean switching time with forward flux sampling instead (see ffs_time.py), which
+still works when switching is so rare that every run would time out. With `ffs_fallback`, the gillespie solver also uses
+forward flux sampling for the steps it couldn't fit (fewer than min_switches switches with censor_timeouts, or more
+than half of the runs timed out without it), instead of leaving them out of the graph. Each of these steps is a full
+FFS run, so it is off by default. The FFS estimates are plotted as their own series, with their standard errors.
+
+With `censor_timeouts`, runs that time out are kept in the fits as right-censored observations (the switch takes longer
+than the time they ran for - see censored_fit.py) instead of being dropped, which would bias the fits towards short
+times. A step is then fitted as long as at least min_switches runs switched, so trial_max_length can be much shorter.
+
+With `adaptive`, the runs are done in blocks, and each step stops once the confidence interval of its mean switching
+time is within relative_tolerance of the mean (see sweep_scheduler.RunAdaptiveSweep), so batch_size becomes a cap and
+most of the time goes to the steps that need it. The number of runs each step used is printed with its time-outs.
 """
 
 
@@ -25,16 +46,44 @@ param_end_val = 3
 step_count = 100
 # define a parameter to vary - must be in the parameters dictionary
 param_to_change = "birth_rate"
-#define batch size - this determines how many runs are averaged in each step 
+#define batch size - this determines how many runs are averaged in each step (the most runs a step can use with adaptive)
 batch_size = 5000
+#set to True to stop running a step once its mean switching time is known to within relative_tolerance (a fraction of the
+#mean, at the given confidence level) - the easy steps then use far fewer than batch_size runs
+adaptive = False
+relative_tolerance = 0.05
+confidence = 0.95
 #define length of trials in steps (default 1000) - they will usually stop earlier, this is more for allocating space
 trial_max_length = 10000
+#random seed - set to an integer to make the results reproducible, or None for different results every run
+seed = None
+#each block of this many runs gets its own random number generator (see gillespie_time.spawn_generators)
+replicas_per_stream = 50
 #define starting population (number of sites)
 totalpop = 100
 methylatedpop = 10
 unmethylatedpop = 90
 #SwitchDirection - a simulation terminates when it reaches this state
 SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+#set to True to count time-outs as censored observations in the fits, or False to drop them (and skip steps where more than half time out)
+censor_timeouts = False
+#with censor_timeouts, the smallest number of switches a step needs to be fitted
+min_switches = 20
+#solver - "gillespie" runs batches of simulations, "exact" solves for the mean and S.D. directly, "both" does both,
+#"ffs" estimates the mean with forward flux sampling
+solver = "gillespie"
+#set to True to use forward flux sampling for the steps the gillespie runs couldn't fit (see censor_timeouts) -
+#every one of them is a full forward flux sampling run, which can take much longer than the gillespie sweep
+ffs_fallback = False
+#forward flux sampling settings - independent estimates per step, number of interfaces, steps used to find the flux
+#out of the starting state, and trial runs fired from each interface (see ffs_time.FFSSwitchingTimes)
+ffs_replicas = 8
+ffs_interface_count = 10
+ffs_basin_steps = 1000000
+ffs_trials = 1000
+#set to a file saved by process_runner.py to plot a sweep that was run on several processes or machines instead of running it here
+#(the parameters above have to match the ones it was run with)
+sweep_file = None
 #-----------Rates Dictionary---------
 default_parameters = {"r_hm": 0.5,          #0
                       "r_hm_m": 20/totalpop, #1
@@ -79,21 +128,24 @@ index_to_change = default_indices[param_to_change]
 
 #find the size of each step, rounded to 5 decimal places.
 step_size = round((param_end_val-param_begin_val)/(step_count-1), 5)
+#number of random number generators used for each step
+streams_per_step = -(-batch_size // replicas_per_stream)
 
 #-----------simulation-----------
-@numba.jit(nopython=True, parallel=True)
+#every (parameter value, block of replicas) pair is a separate work item, and the work items are shared out
+#between the threads as they finish - see sweep_scheduler.py
 def main(rngs):
-    output_array = np.zeros(shape=(step_count, batch_size))
-    #this loop runs in parallel because it uses prange() instead of range() - keep this in mind if debugging it
-    for step in prange(step_count):
-        #make a copy of the default parameters, change the parameter we want to study
-        temp_arr = default_arr.copy()
-        temp_arr[index_to_change] = param_begin_val + (step*step_size)
-        print("Testing parameters: ", temp_arr)
-
-        #run a batch of identical gillespie algorithms, store the results in output_array[step]
-        for i in range(batch_size):
-            output_array[step][i] = gillespie_time.GillespieSwitchFun(trial_max_length, temp_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection,rngs[step])
+    #make a copy of the default parameters for every step, change the parameter we want to study
+    param_matrix = np.tile(default_arr, (step_count, 1))
+    param_matrix[:, index_to_change] = param_begin_val + (np.arange(step_count)*step_size)
+    if adaptive:
+        #runs that weren't needed are nan
+        output_array, replicas_used, thread_steps, thread_items = sweep_scheduler.RunAdaptiveSweep(param_matrix, batch_size, trial_max_length, totalpop, methylatedpop, unmethylatedpop, SwitchDirection,
+                                                                                                  rngs, replicas_per_stream, relative_tolerance, confidence, min_switches)
+        print(f"Adaptive sweep used {np.sum(replicas_used)} of {step_count*batch_size} runs")
+    else:
+        output_array, thread_steps, thread_items = sweep_scheduler.RunSweep(param_matrix, batch_size, trial_max_length, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, rngs, replicas_per_stream)
+    sweep_scheduler.print_utilisation(thread_steps, thread_items)
     return output_array
 #-----------setup-----------
 
@@ -107,6 +159,9 @@ gamma_scale = [None] * step_count
 gamma_KS = [None] * step_count
 inverse_gamma_scale = [None] * step_count
 
+weibull_shape = [None] * step_count
+weibull_scale = [None] * step_count
+
 normal_KS = [None] * step_count
 normal_sd = [None] * step_count
 normal_mean = [None] * step_count
@@ -116,58 +171,165 @@ empirical_mean = [None] * step_count
 
 line = [None] * step_count
 
+exact_mean = [None] * step_count
+exact_sd = [None] * step_count
+exact_exponential_KS = [None] * step_count
+exact_KS = [None] * step_count
+
+ffs_mean = [None] * step_count
+ffs_error = [None] * step_count
+
 
 #list comprehension that creates an array of the values we tested for our chosen parameter
-step_array = [step_size * i for i in range(step_count)]
+step_array = [param_begin_val + step_size * i for i in range(step_count)]
 
 #create an array of random number generators that we will pass into our function
-#this makes it easier to reproduce, and also keeps Numba happy.
-generators = [None]*step_count
-for i in range(step_count):
-    generators[i] = np.random.default_rng()
-
-#-----------Call simulation-----------
-output = main(generators)
-
-#-----------postprocessing-----------
-
-#go through the output row-by-row and find the exponential parameters
-for step in range(step_count):
-    #this list comprehension makes an array of all the positive values in a given row of output_array
-    valid_array = [output[step][index] for index in range(batch_size) if output[step][index] >= 0]
-    #this list comprehension counts up all the negative (meaning timed out) values
-    raw_timeouts = batch_size - len(valid_array)
-    timeouts[step] = 10*(raw_timeouts/batch_size) #scale the timeouts to fit with the other info on the graph
-
-    #create a line representing the parameter we are varying on the y axis
-    line[step] = step_array[step]
-
-    #guess parameters only if less than half our simulations timed out
-    if len(valid_array) > batch_size/2:
-        #fit distributions to the data
-        exponential_parameters[step] = stats.expon.fit(valid_array,floc=0)[1]
-        print('exponential paramater = ' + str(exponential_parameters[step]))
-
-        gamma_shape[step],gamma_location[step],gamma_scale[step]=stats.gamma.fit(valid_array,floc=0)
-        inverse_gamma_scale[step] = 1/gamma_scale[step]
-
-        normal_mean[step], normal_sd[step] =  stats.norm.fit(valid_array,)
-        print(f'Normal mean is {normal_mean[step]} and S.D. is {normal_sd[step]}')
-
-        empirical_mean[step] = statistics.fmean(valid_array)
-
-        #calculate error for parameters with Kolmogorov-Smirnov test
-        #note that we lock the first argument, location, to 0 for the exponential distribution
-        exponential_KS[step] = 10 * (stats.kstest(valid_array, 'expon', N=len(valid_array), args=(0,exponential_parameters[step])).statistic)
-        print(exponential_KS[step])
-        normal_KS[step] = 10 * (stats.kstest(valid_array, 'norm', N=len(valid_array), args=(normal_mean[step], normal_sd[step])).statistic)
-        # print(normal_KS[step])
-        gamma_KS[step] = 10 * (stats.kstest(valid_array, stats.gamma.cdf, N=len(valid_array), args=(gamma_shape[step],0,gamma_scale[step])).statistic)
-        print(gamma_KS[step])
-
-    # print("predicted exponential parameter: ", exponential_parameters[step])
-    # print("predicted gamma shape parameter: ", gamma_shape[step])
-    print("timed-out simulations: " + str(raw_timeouts) + " out of " + str(batch_size))
+#every block of replicas gets an independent stream, which makes it easier to reproduce, and also keeps Numba happy.
+generators = gillespie_time.spawn_generators(step_count*streams_per_step, seed)
+
+#-----------exact solution-----------
+#solve for the exact mean and second moment of the switching time for each parameter value
+if solver in ("exact", "both"):
+    for step in range(step_count):
+        temp_arr = default_arr.copy()
+        temp_arr[index_to_change] = param_begin_val + (step*step_size)
+        mean, second_moment = ctmc_time.SwitchingTimeMoments(temp_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection)
+        exact_mean[step] = mean
+        exact_sd[step] = np.sqrt(second_moment - mean**2)
+        print(f'Exact mean is {exact_mean[step]} and S.D. is {exact_sd[step]}')
+
+        #compare the exact CDF to an exponential distribution with the same mean
+        time_grid = np.linspace(0, 10*mean, 500)
+        exact_cdf, exact_pdf = ctmc_time.SwitchingTimeDistribution(temp_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, time_grid)
+        exact_exponential_KS[step] = 10 * np.max(np.abs(exact_cdf - stats.expon.cdf(time_grid, 0, mean)))
+
+if solver in ("gillespie", "both"):
+    #-----------Call simulation-----------
+    if sweep_file is None:
+        output = main(generators)
+    else:
+        output = np.load(sweep_file)
+        if output.shape != (step_count, batch_size):
+            raise ValueError(f"{sweep_file} has {output.shape[0]} steps of {output.shape[1]} runs, but step_count = {step_count} and batch_size = {batch_size}")
+
+    #-----------postprocessing-----------
+
+    #the number of runs done for each step - less than batch_size for steps an adaptive sweep stopped early
+    replicas_used = np.sum(~np.isnan(output), axis=1)
+
+    #the fits that drop the time-outs are done for every step at once (see sweep_statistics.py)
+    row_switches, row_mean, row_sd, row_gamma_shape, row_gamma_scale, row_exponential_KS, row_normal_KS, row_gamma_KS = sweep_statistics.RowStatistics(output)
+
+    #the exponential and weibull fits and the KS errors with censoring are done for every step at once
+    if censor_timeouts:
+        censored_exponential = censored_fit.exponential_fit(output)
+        censored_weibull_shape, censored_weibull_scale = censored_fit.weibull_fit(output)
+        #the gamma and normal fits have no closed form, so they are still fitted one step at a time
+        censored_gamma = np.full((step_count, 2), np.nan)
+        censored_normal = np.full((step_count, 2), np.nan)
+        for step in np.nonzero(row_switches >= min_switches)[0]:
+            shape, location, scale = censored_fit.gamma_fit(output[step])
+            censored_gamma[step] = shape, scale
+            censored_normal[step] = censored_fit.normal_fit(output[step])
+        censored_exponential_KS = censored_fit.censored_ks(output, lambda x: stats.expon.cdf(x, 0, censored_exponential[:, np.newaxis]))
+        censored_normal_KS = censored_fit.censored_ks(output, lambda x: stats.norm.cdf(x, censored_normal[:, 0:1], censored_normal[:, 1:2]))
+        censored_gamma_KS = censored_fit.censored_ks(output, lambda x: stats.gamma.cdf(x, censored_gamma[:, 0:1], 0, censored_gamma[:, 1:2]))
+
+    #go through the output row-by-row and find the exponential parameters
+    for step in range(step_count):
+        #the runs that didn't time out
+        switches = row_switches[step]
+        raw_timeouts = replicas_used[step] - switches
+        timeouts[step] = 10*(raw_timeouts/replicas_used[step]) #scale the timeouts to fit with the other info on the graph
+
+        #create a line representing the parameter we are varying on the y axis
+        line[step] = step_array[step]
+
+        #with censored fits, fit every step with enough switches
+        if censor_timeouts and switches >= min_switches:
+            exponential_parameters[step] = censored_exponential[step]
+            print('exponential paramater = ' + str(exponential_parameters[step]))
+
+            gamma_shape[step],gamma_location[step],gamma_scale[step] = censored_gamma[step, 0], 0, censored_gamma[step, 1]
+            inverse_gamma_scale[step] = 1/gamma_scale[step]
+            weibull_shape[step], weibull_scale[step] = censored_weibull_shape[step], censored_weibull_scale[step]
+
+            normal_mean[step], normal_sd[step] = censored_normal[step]
+            print(f'Normal mean is {normal_mean[step]} and S.D. is {normal_sd[step]}')
+
+            empirical_mean[step] = row_mean[step]
+
+            #calculate error for parameters by comparing the fitted CDFs to the Kaplan-Meier estimate of the CDF
+            exponential_KS[step] = 10 * censored_exponential_KS[step]
+            print(exponential_KS[step])
+            normal_KS[step] = 10 * censored_normal_KS[step]
+            gamma_KS[step] = 10 * censored_gamma_KS[step]
+            print(gamma_KS[step])
+
+            #compare the simulated times to the exact distribution - the time-outs are accounted for here too
+            if solver == "both":
+                temp_arr = default_arr.copy()
+                temp_arr[index_to_change] = param_begin_val + (step*step_size)
+                exact_KS[step] = 10 * censored_fit.censored_ks(output[step], lambda x: ctmc_time.SwitchingTimeDistribution(temp_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, x[0])[0])[0]
+
+        #otherwise, guess parameters only if less than half our simulations timed out
+        elif not censor_timeouts and switches > replicas_used[step]/2:
+            #fit distributions to the data - the exponential and gamma fits have their location locked to 0
+            exponential_parameters[step] = row_mean[step]
+            print('exponential paramater = ' + str(exponential_parameters[step]))
+
+            gamma_shape[step],gamma_location[step],gamma_scale[step] = row_gamma_shape[step], 0, row_gamma_scale[step]
+            inverse_gamma_scale[step] = 1/gamma_scale[step]
+
+            normal_mean[step], normal_sd[step] = row_mean[step], row_sd[step]
+            print(f'Normal mean is {normal_mean[step]} and S.D. is {normal_sd[step]}')
+
+            empirical_mean[step] = row_mean[step]
+
+            #calculate error for parameters with Kolmogorov-Smirnov test
+            exponential_KS[step] = 10 * row_exponential_KS[step]
+            print(exponential_KS[step])
+            normal_KS[step] = 10 * row_normal_KS[step]
+            # print(normal_KS[step])
+            gamma_KS[step] = 10 * row_gamma_KS[step]
+            print(gamma_KS[step])
+
+            #compare the simulated times to the exact distribution - this ignores time-outs, so it is only fair if there are few of them
+            if solver == "both":
+                temp_arr = default_arr.copy()
+                temp_arr[index_to_change] = param_begin_val + (step*step_size)
+                valid_array = output[step][output[step] >= 0]
+                exact_KS[step] = 10 * (stats.kstest(valid_array, lambda x: ctmc_time.SwitchingTimeDistribution(temp_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, x)[0]).statistic)
+
+        # print("predicted exponential parameter: ", exponential_parameters[step])
+        # print("predicted gamma shape parameter: ", gamma_shape[step])
+        print("timed-out simulations: " + str(raw_timeouts) + " out of " + str(replicas_used[step]))
+
+#-----------forward flux sampling-----------
+#every step for the "ffs" solver, or the steps that were skipped above because too many runs timed out
+if solver == "ffs":
+    ffs_steps = list(range(step_count))
+elif solver != "exact" and ffs_fallback:
+    ffs_steps = [step for step in range(step_count) if exponential_parameters[step] is None]
+else:
+    ffs_steps = []
+if ffs_steps:
+    param_matrix = np.tile(default_arr, (len(ffs_steps), 1))
+    param_matrix[:, index_to_change] = param_begin_val + (np.array(ffs_steps)*step_size)
+    #a different seed from the gillespie runs, so the two don't share random numbers
+    ffs_seed = None if seed is None else [seed, 1]
+    mean_time, time_error, timeout_fraction, raw_ffs = ffs_time.FFSSwitchingTimes(param_matrix, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, ffs_seed, ffs_replicas,
+                                                                                   None, ffs_interface_count, ffs_basin_steps, ffs_trials, trial_max_length)
+    for index, step in enumerate(ffs_steps):
+        #no switches at all - the switching time is too long even for forward flux sampling with these settings
+        if not np.isfinite(mean_time[index]):
+            print(f'FFS found no switches for step {step}')
+            continue
+        ffs_mean[step] = mean_time[index]
+        ffs_error[step] = time_error[index]
+        if solver == "ffs":
+            timeouts[step] = 10*timeout_fraction[index]
+        print(f'FFS mean switching time is {mean_time[index]} +/- {time_error[index]}')
 
 #-----------graphing - edit here -----------
 
@@ -184,6 +346,8 @@ plt.plot(step_array, exponential_KS, label="Exponential KS error, scaled by 10x"
 # plt.plot(step_array, gamma_scale,label="Gamma scale")
 # plt.plot(step_array, inverse_gamma_scale,label = "1/Gamma scale",linestyle='dashed')
 # plt.plot(step_array, gamma_KS, label="Gamma KS error, scaled by 10x")
+# plt.plot(step_array, weibull_shape, label="Weibull shape")
+# plt.plot(step_array, weibull_scale, label="Weibull scale")
 # plt.plot(step_array, line, linestyle='dotted', label = 'Birth Rate')
 
 plt.plot(step_array, normal_mean, label='Normal mean',marker='.',linestyle='')
@@ -191,6 +355,15 @@ plt.plot(step_array, normal_sd, label='Normal S.D.',marker='.',linestyle='')
 plt.plot(step_array, normal_KS, label="Normal KS error, scaled by 10x",marker='.',linestyle='')
 # plt.plot(step_array, empirical_mean, label='Empirical Mean', linestyle='dashed')
 
+if ffs_steps:
+    plt.errorbar(step_array, np.array(ffs_mean, dtype=float), yerr=np.array(ffs_error, dtype=float), label='FFS mean switching time', marker='.', linestyle='')
+if solver in ("exact", "both"):
+    plt.plot(step_array, exact_mean, label='Exact mean', linestyle='dotted')
+    plt.plot(step_array, exact_sd, label='Exact S.D.', linestyle='dotted')
+    plt.plot(step_array, exact_exponential_KS, label='Exact distance from exponential, scaled by 10x', linestyle='dotted')
+if solver == "both":
+    plt.plot(step_array, exact_KS, label='KS error against exact distribution, scaled by 10x', marker='.', linestyle='')
+
 plt.title(final_label + "\n" + run_stats)
 plt.xlabel('Value of parameter '+ param_to_change)
 plt.ylabel('Exponential parameter of switching time distribution')
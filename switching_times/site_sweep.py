@@ -0,0 +1,78 @@
+import numpy as np
+import gillespie_time as gillespie_time
+import sweep_scheduler as sweep_scheduler
+import censored_fit
+import matplotlib.pyplot as plt
+import time
+
+"""
+Runs switching time simulations for several numbers of sites at once, instead of the single totalpop of
+simulation_time.py. The parameters are given per site and scaled for every site count (see
+methylation_sim.scale_parameters), and every run starts with the same proportions of methylated and unmethylated sites,
+so the only thing that changes between the steps is the number of sites. All of the site counts run in one parallel sweep.
+
+For every site count this prints the mean switching time (with time-outs counted as censored observations, see
+censored_fit.py) and the proportion of runs that timed out, and the graph shows the mean switching time against the
+number of sites. The time per gillespie step is printed as well - it stays the same however many sites there are.
+"""
+
+#-----------parameters - edit here-----------
+#numbers of sites to simulate
+site_counts = [50, 100, 200, 500, 1000, 2000]
+#define batch size - this determines how many runs are done for every site count
+batch_size = 200
+#define length of trials in steps (or leaps) - runs that don't switch by then count as time-outs
+trial_max_length = 100000000
+#leap condition for the approximate simulation (see methylation_sim/tau_leap.py) - 0 runs the exact simulation
+epsilon = 0.0
+#random seed - set to an integer to make the results reproducible, or None for different results every run
+seed = None
+#each block of this many runs gets its own random number generator (see gillespie_time.spawn_generators)
+replicas_per_stream = 10
+#starting proportions of methylated and unmethylated sites
+methylated_fraction = 0.1
+unmethylated_fraction = 0.9
+#SwitchDirection - a simulation terminates when it reaches this state
+SwitchDirection = 1 #1 -> mostly methylated, -1-> mostly unmethylated
+#-----------Rates Dictionary---------
+#the collaborative parameters are per site - they get divided by the number of sites
+per_site_parameters = {"r_hm": 0.5,   #0
+                       "r_hm_m": 20,  #1
+                       "r_hm_h": 10,  #2
+                       "r_uh": 0.35,  #3
+                       "r_uh_m": 11,  #4
+                       "r_uh_h": 5.5, #5
+                       "r_mh": 0.1,   #6
+                       "r_mh_u": 10,  #7
+                       "r_mh_h": 5,   #8
+                       "r_hu": 0.1,   #9
+                       "r_hu_u": 10,  #10
+                       "r_hu_h": 5,   #11
+                       "birth_rate": 1 #12
+}
+parameter_labels = ["r_hm", "r_hm_m","r_hm_h", "r_uh", "r_uh_m", "r_uh_h", "r_mh", "r_mh_u", "r_mh_h", "r_hu", "r_hu_u", "r_hu_h", "birth_rate"]
+per_site_arr = np.array([per_site_parameters[key] for key in parameter_labels], dtype=np.float64)
+
+#-----------simulation-----------
+streams_per_step = -(-batch_size // replicas_per_stream)
+rngs = gillespie_time.spawn_generators(len(site_counts) * streams_per_step, seed)
+start = time.perf_counter()
+output, thread_steps, thread_items = sweep_scheduler.RunSiteSweep(per_site_arr, site_counts, methylated_fraction, unmethylated_fraction, batch_size, trial_max_length,
+                                                                  SwitchDirection, rngs, replicas_per_stream, epsilon)
+elapsed = time.perf_counter() - start
+print(f"{len(site_counts)} site counts x {batch_size} runs took {elapsed:.1f} seconds ({1e9*elapsed/max(np.sum(thread_steps), 1):.1f} ns per step)")
+
+#-----------postprocessing-----------
+mean_switching_time = censored_fit.exponential_fit(output)
+timeouts = np.mean(output < 0, axis=1)
+for step, totalpop in enumerate(site_counts):
+    print(f"{totalpop} sites: mean switching time {mean_switching_time[step]:.4g}, {100*timeouts[step]:.1f}% timed out")
+
+#-----------graphing-----------
+plt.plot(site_counts, mean_switching_time, marker='.', label="mean switching time")
+plt.xscale("log")
+plt.xlabel("number of sites")
+plt.ylabel("mean switching time")
+plt.title(f"{batch_size} runs per site count" + (f", tau-leaping with epsilon = {epsilon}" if epsilon > 0 else ""))
+plt.legend()
+plt.show()
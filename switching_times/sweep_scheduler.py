@@ -0,0 +1,185 @@
+import numpy as np
+import numba
+from numba import njit, prange, types
+import scipy.stats as stats
+import gillespie_time
+from methylation_sim import run_sweep, RunSweep, print_utilisation
+
+"""
+This file runs a whole sweep (every parameter value x every replica) in one parallel loop - run_sweep, RunSweep and
+print_utilisation are re-exported from methylation_sim/sweep.py, which explains how the work is shared out.
+
+Input: a (step_count, 13) matrix of parameter vectors, the batch size and the usual simulation settings
+Output: a (step_count, batch_size) array of switching times (negative for time-outs, just like GillespieSwitchFun),
+plus the number of gillespie steps and work items each thread ran, which is how we measure utilisation.
+
+RunAdaptiveSweep runs the same work items, but only as many of them as each parameter value needs: the blocks are run
+in rounds, and a step stops getting new blocks once the confidence interval of its mean switching time is narrower than
+a relative tolerance (or once it reaches batch_size runs). The mean and variance of each step are kept up to date with
+Welford's method, so the easy steps stop after a few blocks and the rest of the time goes to the hard ones. Step s
+still uses generators s*streams_per_step, s*streams_per_step + 1, ..., so the runs it does are exactly the first runs
+of the same sweep with a fixed batch size. Runs that weren't needed are nan in the output.
+
+RunSiteSweep sweeps over the number of sites instead: every step has its own site count, per-site parameters that are
+scaled for it (see methylation_sim.scale_parameters) and starting counts in the same proportions. The rate table of
+10,000 sites doesn't fit in memory, so these runs recompute the rates on every step (or leap, see
+methylation_sim/tau_leap.py) - that costs the same per step whatever the number of sites.
+"""
+
+#Adds one value to a running count, mean and sum of squared differences from the mean (Welford's method)
+@njit(cache=True)
+def welford_update(count, mean, squares, value):
+    count += 1
+    difference = value - mean
+    mean += difference / count
+    squares += difference * (value - mean)
+    return count, mean, squares
+
+#Runs one round of an adaptive sweep: block b of this round for active[position] is that step's block number
+#blocks_done[step] + b, and step `active[position]` runs round_blocks[position] blocks. Work items are interleaved across
+#steps like run_sweep. This is the only parallel part - with the prange written inside the while loop of
+#run_adaptive_sweep, the compiled function crashes.
+@njit(parallel=True, cache=True)
+def run_round(output_array, rate_tables, active, round_blocks, blocks_done, blocks_per_round, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection,
+              rngs, replicas_per_stream, thread_steps, thread_items):
+    streams_per_step = -(-batch_size // replicas_per_stream)
+    active_count = len(active)
+    for work in prange(active_count * blocks_per_round):
+        position = work % active_count
+        block = work // active_count
+        #steps that are about to reach batch_size may have fewer blocks left than the others
+        if block < round_blocks[position]:
+            step = active[position]
+            stream = blocks_done[step] + block
+            steps_taken = 0
+            for i in range(stream*replicas_per_stream, min(batch_size, (stream+1)*replicas_per_stream)):
+                curr_time, curr_methylated, curr_unmethylated, run_steps = gillespie_time.switch_table_kernel(trial_max_length, rate_tables[step], totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs[step*streams_per_step + stream])
+                output_array[step, i] = curr_time
+                steps_taken += run_steps
+            thread = numba.get_thread_id()
+            thread_steps[thread, 0] += steps_taken
+            thread_items[thread, 0] += 1
+
+#Runs the work items of run_sweep in rounds - every round gives each unfinished step its next blocks_per_round blocks,
+#then updates the running statistics of the switching times of each step. A step is finished once it has min_switches
+#switches and z * (standard error of the mean) <= relative_tolerance * mean, or once it has run batch_size runs.
+#Returns the output (nan for runs that were never needed), the number of runs each step used, and the per-thread
+#steps and work items like run_sweep.
+@njit((types.float64[:, ::1], types.int64, types.int64, types.int64, types.int64, types.int64, types.int64, types.List(gillespie_time.generator_type, reflected=True), types.int64,
+       types.int64, types.float64, types.float64, types.int64, types.int64), cache=True)
+def run_adaptive_sweep(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream,
+                       blocks_per_round, relative_tolerance, z, min_switches, thread_count):
+    step_count = param_matrix.shape[0]
+    streams_per_step = -(-batch_size // replicas_per_stream)
+    output_array = np.full((step_count, batch_size), np.nan)
+
+    rate_tables = np.zeros((step_count, ((totalpop+1)*(totalpop+2))//2, 5))
+    for step in range(step_count):
+        rate_tables[step] = gillespie_time.build_rate_table(param_matrix[step], totalpop)
+
+    thread_steps = np.zeros((thread_count, 8), dtype=np.int64)
+    thread_items = np.zeros((thread_count, 8), dtype=np.int64)
+
+    #running statistics of the switching times of each step, and how many blocks each step has run
+    switch_count = np.zeros(step_count, dtype=np.int64)
+    switch_mean = np.zeros(step_count)
+    switch_squares = np.zeros(step_count)
+    blocks_done = np.zeros(step_count, dtype=np.int64)
+    active = np.arange(step_count)
+
+    while len(active) > 0:
+        #the blocks each active step runs this round (fewer if it is about to reach batch_size)
+        round_blocks = np.minimum(blocks_per_round, streams_per_step - blocks_done[active])
+        run_round(output_array, rate_tables, active, round_blocks, blocks_done, blocks_per_round, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection,
+                  rngs, replicas_per_stream, thread_steps, thread_items)
+
+        #add this round's switching times to the statistics, and keep the steps that still need more runs
+        still_active = np.zeros(len(active), dtype=np.bool_)
+        for position in range(len(active)):
+            step = active[position]
+            first = blocks_done[step] * replicas_per_stream
+            blocks_done[step] += round_blocks[position]
+            last = min(batch_size, blocks_done[step] * replicas_per_stream)
+            count = switch_count[step]
+            mean = switch_mean[step]
+            squares = switch_squares[step]
+            for i in range(first, last):
+                if output_array[step, i] >= 0:
+                    count, mean, squares = welford_update(count, mean, squares, output_array[step, i])
+            switch_count[step] = count
+            switch_mean[step] = mean
+            switch_squares[step] = squares
+            if blocks_done[step] >= streams_per_step:
+                continue
+            if count >= max(min_switches, 2) and z * np.sqrt(squares / (count - 1) / count) <= relative_tolerance * mean:
+                continue
+            still_active[position] = True
+        active = active[still_active]
+
+    replicas_used = np.minimum(blocks_done * replicas_per_stream, batch_size)
+    return output_array, replicas_used, thread_steps[:, 0], thread_items[:, 0]
+
+#Runs an adaptive sweep (see run_adaptive_sweep) - relative_tolerance is the half-width of the confidence interval of
+#the mean switching time as a fraction of the mean, at the given confidence level. batch_size is the most runs any
+#step can use, and rngs has to be the same generators RunSweep would get.
+#Returns the output, the number of runs each step used, and the per-thread steps and work items.
+def RunAdaptiveSweep(param_matrix, batch_size, trial_max_length, totalpop, pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream,
+                     relative_tolerance, confidence=0.95, min_switches=20, blocks_per_round=2, chunk_size=1):
+    z = stats.norm.ppf(0.5 + confidence/2)
+    with numba.parallel_chunksize(chunk_size):
+        output_array, replicas_used, thread_steps, thread_items = run_adaptive_sweep(np.ascontiguousarray(param_matrix, dtype=np.float64), batch_size, trial_max_length, totalpop,
+                                                                                     pop_methyl, pop_unmethyl, SwitchDirection, rngs, replicas_per_stream,
+                                                                                     blocks_per_round, relative_tolerance, z, min_switches, numba.config.NUMBA_NUM_THREADS)
+    used = max(numba.get_num_threads(), np.max(np.nonzero(thread_items)[0], initial=-1) + 1)
+    return output_array, replicas_used, thread_steps[:used], thread_items[:used]
+
+#Same as run_sweep, but step s has site_counts[s] sites and starts from (pop_methyl[s], pop_unmethyl[s]), and the
+#rows of param_matrix are already scaled for their site counts. The runs recompute the rates on every step instead of
+#using a rate table, or leap with the leap condition epsilon if epsilon > 0.
+@njit((types.float64[:, ::1], types.int64[:], types.int64[:], types.int64[:], types.int64, types.int64, types.int64, types.List(gillespie_time.generator_type, reflected=True), types.int64,
+       types.float64, types.int64), parallel=True, cache=True)
+def run_site_sweep(param_matrix, site_counts, pop_methyl, pop_unmethyl, batch_size, trial_max_length, SwitchDirection, rngs, replicas_per_stream, epsilon, thread_count):
+    step_count = param_matrix.shape[0]
+    streams_per_step = -(-batch_size // replicas_per_stream)
+    output_array = np.zeros((step_count, batch_size))
+    thread_steps = np.zeros((thread_count, 8), dtype=np.int64)
+    thread_items = np.zeros((thread_count, 8), dtype=np.int64)
+
+    #work items are interleaved across steps, so the big site counts don't all end up at the end of the queue
+    for work in prange(step_count * streams_per_step):
+        step = work % step_count
+        stream = work // step_count
+        steps_taken = 0
+        for i in range(stream*replicas_per_stream, min(batch_size, (stream+1)*replicas_per_stream)):
+            rng = rngs[step*streams_per_step + stream]
+            if epsilon > 0:
+                curr_time, curr_methylated, curr_unmethylated, leaps, exact_steps = gillespie_time.leap_switch_kernel(trial_max_length, param_matrix[step], site_counts[step], pop_methyl[step],
+                                                                                                                      pop_unmethyl[step], SwitchDirection, rng, epsilon)
+                run_steps = leaps + exact_steps
+            else:
+                curr_time, curr_methylated, curr_unmethylated, run_steps = gillespie_time.switch_kernel(trial_max_length, param_matrix[step], site_counts[step], pop_methyl[step],
+                                                                                                        pop_unmethyl[step], SwitchDirection, rng, None)
+            output_array[step, i] = curr_time
+            steps_taken += run_steps
+        thread = numba.get_thread_id()
+        thread_steps[thread, 0] += steps_taken
+        thread_items[thread, 0] += 1
+
+    return output_array, thread_steps[:, 0], thread_items[:, 0]
+
+#Runs batch_size switches for every site count in one parallel sweep. per_site_arr holds the 13 parameters with the
+#collaborative ones per site (20 rather than 20/totalpop, see methylation_sim.scale_parameters), and every run starts
+#with methylated_fraction and unmethylated_fraction of its sites methylated and unmethylated (rounded to whole sites).
+#rngs needs len(site_counts) * ceil(batch_size / replicas_per_stream) generators, like RunSweep.
+#Returns the (len(site_counts), batch_size) switching times, plus the per-thread steps and work items.
+def RunSiteSweep(per_site_arr, site_counts, methylated_fraction, unmethylated_fraction, batch_size, trial_max_length, SwitchDirection, rngs, replicas_per_stream,
+                 epsilon=0.0, chunk_size=1):
+    site_counts = np.asarray(site_counts, dtype=np.int64)
+    param_matrix = gillespie_time.scale_parameters(np.tile(per_site_arr, (len(site_counts), 1)), site_counts[:, None])
+    pop_methyl = np.round(methylated_fraction * site_counts).astype(np.int64)
+    pop_unmethyl = np.round(unmethylated_fraction * site_counts).astype(np.int64)
+    with numba.parallel_chunksize(chunk_size):
+        output_array, thread_steps, thread_items = run_site_sweep(np.ascontiguousarray(param_matrix), site_counts, pop_methyl, pop_unmethyl, batch_size, trial_max_length,
+                                                                  SwitchDirection, rngs, replicas_per_stream, epsilon, numba.config.NUMBA_NUM_THREADS)
+    used = max(numba.get_num_threads(), np.max(np.nonzero(thread_items)[0], initial=-1) + 1)
+    return output_array, thread_steps[:used], thread_items[:used]
@@ -0,0 +1,169 @@
+import numpy as np
+import math
+from numba import njit, prange, types
+
+"""
+Compiled statistics for every row of a sweep at once.
+
+The postprocessing in simulation_time.py used to go through the (step_count, batch_size) output one row at a time in
+python: a list comprehension to drop the time-outs, then stats.expon.fit, stats.gamma.fit, stats.norm.fit and three
+stats.kstest calls per row. For big sweeps this took a noticeable part of the run and only used one core.
+Here every row is handled in one parallel loop, with the same fits written out directly:
+- exponential (location 0) and normal: the maximum likelihood fits have closed forms - the mean, and the mean and S.D.
+- gamma (location 0): the best shape k solves log(k) - digamma(k) = log(mean) - mean(log t), which is solved with
+  Newton's method, and the scale is then mean/k
+- KS statistics: from the sorted switching times, the same way stats.kstest computes them
+Like the fits they replace, these only use the runs that switched - see censored_fit.py for fits that keep the time-outs.
+
+Output of RowStatistics: one array per statistic, with one value per row (nan where a row has fewer than 2 switches)
+"""
+
+#Digamma function (derivative of log gamma) for x > 0: shift x up past 6 with digamma(x) = digamma(x+1) - 1/x,
+#then use the asymptotic series
+@njit(cache=True)
+def digamma(x):
+    result = 0.0
+    while x < 6:
+        result -= 1/x
+        x += 1
+    inverse_square = 1/(x*x)
+    return result + math.log(x) - 0.5/x - inverse_square*(1/12 - inverse_square*(1/120 - inverse_square*(1/252 - inverse_square*(1/240 - inverse_square/132))))
+
+#Trigamma function (derivative of digamma) for x > 0, the same way
+@njit(cache=True)
+def trigamma(x):
+    result = 0.0
+    while x < 6:
+        result += 1/(x*x)
+        x += 1
+    inverse_square = 1/(x*x)
+    return result + 1/x + inverse_square/2 + inverse_square/x*(1/6 - inverse_square*(1/30 - inverse_square*(1/42 - inverse_square/30)))
+
+#Regularized lower incomplete gamma function P(shape, x) - the CDF of a gamma distribution with scale 1.
+#Uses the series below shape + 1 and the continued fraction above it (Numerical Recipes, gser and gcf).
+@njit(cache=True)
+def gamma_cdf(x, shape, scale):
+    x = x / scale
+    if x <= 0:
+        return 0.0
+    log_prefactor = shape*math.log(x) - x - math.lgamma(shape)
+    if x < shape + 1:
+        term = 1/shape
+        total = term
+        denominator = shape
+        for i in range(1000):
+            denominator += 1
+            term *= x/denominator
+            total += term
+            if abs(term) < abs(total)*1e-15:
+                break
+        return min(total*math.exp(log_prefactor), 1.0)
+    #modified Lentz's method for the continued fraction of the upper function Q = 1 - P
+    tiny = 1e-300
+    b = x + 1 - shape
+    c = 1/tiny
+    d = 1/b
+    fraction = d
+    for i in range(1, 1000):
+        a = -i*(i - shape)
+        b += 2
+        d = a*d + b
+        if abs(d) < tiny:
+            d = tiny
+        c = b + a/c
+        if abs(c) < tiny:
+            c = tiny
+        d = 1/d
+        delta = d*c
+        fraction *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return max(1 - math.exp(log_prefactor)*fraction, 0.0)
+
+@njit(cache=True)
+def normal_cdf(x, mean, sd):
+    return 0.5*math.erfc((mean - x)/(sd*math.sqrt(2)))
+
+@njit(cache=True)
+def exponential_cdf(x, mean):
+    if x <= 0:
+        return 0.0
+    return -math.expm1(-x/mean)
+
+#Maximum likelihood shape and scale of a gamma distribution with location 0.
+#Returns nans if the times are all the same (the shape would be infinite) or any of them is 0.
+@njit(cache=True)
+def gamma_mle(times):
+    mean = np.mean(times)
+    if np.min(times) <= 0:
+        return np.nan, np.nan
+    target = math.log(mean) - np.mean(np.log(times))
+    if target <= 0:
+        return np.nan, np.nan
+    #starting guess from Minka, "Estimating a Gamma distribution" - usually within a few percent of the answer
+    shape = (3 - target + math.sqrt((target - 3)**2 + 24*target)) / (12*target)
+    for iteration in range(100):
+        #log(k) - digamma(k) - target is decreasing in k, so Newton's method goes straight to the root
+        change = (math.log(shape) - digamma(shape) - target) / (1/shape - trigamma(shape))
+        new_shape = shape - change
+        if new_shape <= 0:
+            new_shape = shape/2
+        if abs(new_shape - shape) < 1e-12*shape:
+            shape = new_shape
+            break
+        shape = new_shape
+    return shape, mean/shape
+
+#KS statistic between sorted times and a fitted distribution: kind 0 is exponential(first), 1 is normal(first, second)
+#and 2 is gamma(first, second) with the parameters of the fits above
+@njit(cache=True)
+def ks_statistic(sorted_times, kind, first, second):
+    count = len(sorted_times)
+    largest = 0.0
+    for i in range(count):
+        if kind == 0:
+            cdf = exponential_cdf(sorted_times[i], first)
+        elif kind == 1:
+            cdf = normal_cdf(sorted_times[i], first, second)
+        else:
+            cdf = gamma_cdf(sorted_times[i], first, second)
+        #the empirical CDF jumps from i/count to (i+1)/count at this time
+        largest = max(largest, (i + 1)/count - cdf, cdf - i/count)
+    return largest
+
+#Fits every row of a sweep's output in parallel (negative values are time-outs, and are left out).
+#Returns the number of switches in each row, the mean switching time (which is also the exponential parameter and the
+#normal mean), the normal S.D., the gamma shape and scale, and the exponential, normal and gamma KS statistics.
+@njit((types.float64[:, ::1],), parallel=True, cache=True)
+def row_statistics(output):
+    step_count = output.shape[0]
+    switches = np.zeros(step_count, dtype=np.int64)
+    mean = np.full(step_count, np.nan)
+    sd = np.full(step_count, np.nan)
+    gamma_shape = np.full(step_count, np.nan)
+    gamma_scale = np.full(step_count, np.nan)
+    exponential_KS = np.full(step_count, np.nan)
+    normal_KS = np.full(step_count, np.nan)
+    gamma_KS = np.full(step_count, np.nan)
+    for step in prange(step_count):
+        times = np.sort(output[step][output[step] >= 0])
+        switches[step] = len(times)
+        if len(times) == 0:
+            continue
+        mean[step] = np.mean(times)
+        if len(times) < 2:
+            continue
+        sd[step] = np.std(times)
+        shape, scale = gamma_mle(times)
+        gamma_shape[step] = shape
+        gamma_scale[step] = scale
+        exponential_KS[step] = ks_statistic(times, 0, mean[step], 0.0)
+        if sd[step] > 0:
+            normal_KS[step] = ks_statistic(times, 1, mean[step], sd[step])
+        if np.isfinite(shape):
+            gamma_KS[step] = ks_statistic(times, 2, shape, scale)
+    return switches, mean, sd, gamma_shape, gamma_scale, exponential_KS, normal_KS, gamma_KS
+
+#Python entry point for row_statistics, which accepts any (step_count, batch_size) array
+def RowStatistics(output):
+    return row_statistics(np.ascontiguousarray(np.atleast_2d(output), dtype=np.float64))
@@ -1,10 +1,10 @@
 import numpy as np
 import gillespie_time as gillespie_time
+import sweep_scheduler as sweep_scheduler
+import censored_fit as censored_fit
+import sweep_statistics as sweep_statistics
 import matplotlib.pyplot as plt
 import scipy.stats as stats
-import numba
-import statistics
-from numba import prange
 
 """
 Performs many gillespie runs at once, in both directions, to get information about the time 
@@ -19,6 +19,8 @@ You can find these starting populations by searching for `edit here` in the file
 There are many different graphing options for this simulation! 
 You can graph various parameters and goodness-of-fit measures for exponential, normal, and gamma fits,
 as well as the empirical mean of the measurements. To enable these graphs, simply uncomment them at the bottom of the file.
+
+With `censor_timeouts`, runs that time out are kept in the exponential fits as censored observations (see censored_fit.py).
 """
 
 
@@ -33,8 +35,16 @@ param_to_change = "birth_rate"
 batch_size = 5000
 #define length of trials in steps (default 10000) - they will usually stop earlier, this is more for allocating space
 trial_max_length = 10000
+#random seed - set to an integer to make the results reproducible, or None for different results every run
+seed = None
+#each block of this many runs gets its own random number generator (see gillespie_time.spawn_generators)
+replicas_per_stream = 50
 #define starting population - the starting counts of methylated/unmethylated are further down in the file
 totalpop = 100
+#set to True to count time-outs as censored observations in the fits, or False to drop them (and skip steps where more than half time out)
+censor_timeouts = False
+#with censor_timeouts, the smallest number of switches a step needs to be fitted
+min_switches = 20
 #-----------Rates Dictionary---------
 default_parameters = {"r_hm": 0.5,          #0
                       "r_hm_m": 20/totalpop, #1
@@ -79,22 +89,19 @@ index_to_change = default_indices[param_to_change]
 
 #find the size of each step, rounded to 5 decimal places.
 step_size = round((param_end_val-param_begin_val)/(step_count-1), 5)
+#number of random number generators used for each step
+streams_per_step = -(-batch_size // replicas_per_stream)
 # step_array = step_count
 
 #-----------simulation-----------
-@numba.jit(nopython=True, parallel=True)
+#every (parameter value, block of replicas) pair is a separate work item, and the work items are shared out
+#between the threads as they finish - see sweep_scheduler.py
 def main(rngs,SwitchDirection,methylatedpop, unmethylatedpop):
-    output_array = np.zeros(shape=(step_count, batch_size))
-    #this loop runs in parallel because it uses prange() instead of range() - keep this in mind when debugging it!
-    for step in prange(step_count):
-        #make a copy of the default parameters, change the parameter we want to study
-        temp_arr = default_arr.copy()
-        temp_arr[index_to_change] = param_begin_val + (step*step_size)
-        print("Testing parameters: ", temp_arr)
-
-        #run a batch of identical gillespie algorithms, store the results in output_array[step]
-        for i in range(batch_size):
-            output_array[step][i] = gillespie_time.GillespieSwitchFun(trial_max_length, temp_arr, totalpop, methylatedpop, unmethylatedpop, SwitchDirection,rngs[step])
+    #make a copy of the default parameters for every step, change the parameter we want to study
+    param_matrix = np.tile(default_arr, (step_count, 1))
+    param_matrix[:, index_to_change] = param_begin_val + (np.arange(step_count)*step_size)
+    output_array, thread_steps, thread_items = sweep_scheduler.RunSweep(param_matrix, batch_size, trial_max_length, totalpop, methylatedpop, unmethylatedpop, SwitchDirection, rngs, replicas_per_stream)
+    sweep_scheduler.print_utilisation(thread_steps, thread_items)
     return output_array
 
 #-----------setup - METHYLATED TO UNMETHYLATED-----------
@@ -108,13 +115,12 @@ gamma_KS_MtoU = [None] * step_count
 timeouts_MtoU = [0] * step_count
 empirical_mean_MtoU = [None] * step_count
 #list comprehension that creates an array of the values we tested for our chosen parameter
-step_array = [step_size * i for i in range(step_count)]
+step_array = [param_begin_val + step_size * i for i in range(step_count)]
 
 #create an array of random number generators that we will pass into our function
-#this makes it easier to reproduce, and also keeps Numba happy.
-generators = [None]*step_count
-for i in range(step_count):
-    generators[i] = np.random.default_rng()
+#every block of replicas gets an independent stream, which makes it easier to reproduce, and also keeps Numba happy.
+#the first half is used for METHYLATED TO UNMETHYLATED and the second half for UNMETHYLATED TO METHYLATED
+generators = gillespie_time.spawn_generators(2*step_count*streams_per_step, seed)
 
 #-----------parameters - edit here - METHYLATED TO UNMETHYLATED-----------
 methylatedpop = 71
@@ -122,27 +128,38 @@ unmethylatedpop = 13
 
 #-----------Call simulation-----------
 SwitchDirection = -1
-output = main(generators,-1,methylatedpop, unmethylatedpop)
+output = main(generators[:step_count*streams_per_step],-1,methylatedpop, unmethylatedpop)
 
 #-----------postprocessing-----------
 
+#the fits that drop the time-outs are done for every step at once (see sweep_statistics.py)
+row_switches, row_mean, row_sd, row_gamma_shape, row_gamma_scale, row_exponential_KS, row_normal_KS, row_gamma_KS = sweep_statistics.RowStatistics(output)
+
 #go through the output row-by-row and find the exponential parameters
 for step in range(step_count):
-    #this list comprehension makes an array of all the positive values in a given row of output_array
-    valid_array = [output[step][index] for index in range(batch_size) if output[step][index] >= 0]
-    #this list comprehension counts up all the negative (meaning timed out) values
-    raw_timeouts = batch_size - len(valid_array)
+    #the runs that didn't time out
+    switches = row_switches[step]
+    raw_timeouts = batch_size - switches
     timeouts_MtoU[step] = 10*(raw_timeouts/batch_size) #scale the timeouts to fit with the other info on the graph
 
-    #guess parameters only if less than half our simulations timed out
-    if len(valid_array) > batch_size/2:
-        #fit distributions to the data
-        exponential_parameters_MtoU[step] = stats.expon.fit(valid_array,floc=0)[1]
+    #with censored fits, fit every step with enough switches
+    if censor_timeouts and switches >= min_switches:
+        exponential_parameters_MtoU[step] = censored_fit.exponential_fit(output[step])[0]
 
-        empirical_mean_MtoU[step] = statistics.fmean(valid_array)
+        empirical_mean_MtoU[step] = row_mean[step]
+
+        #compare the fitted CDF to the Kaplan-Meier estimate of the CDF
+        exponential_KS_MtoU[step] = 10 * censored_fit.censored_ks(output[step], lambda x: stats.expon.cdf(x, 0, exponential_parameters_MtoU[step]))[0]
+        print(exponential_KS_MtoU[step])
+    #otherwise, guess parameters only if less than half our simulations timed out
+    elif not censor_timeouts and switches > batch_size/2:
+        #fit distributions to the data - the location is locked to 0
+        exponential_parameters_MtoU[step] = row_mean[step]
+
+        empirical_mean_MtoU[step] = row_mean[step]
 
         #calculate error for parameters with Kolmogorov-Smirnov test
-        exponential_KS_MtoU[step] = 10 * (stats.kstest(valid_array, 'expon', args=(0,exponential_parameters_MtoU[step]), N=len(valid_array)).statistic)
+        exponential_KS_MtoU[step] = 10 * row_exponential_KS[step]
         print(exponential_KS_MtoU[step])
     print("timed-out simulations: " + str(raw_timeouts) + " out of " + str(batch_size))
     print('exponential paramater MtoU = ' + str(exponential_parameters_MtoU[step]))
@@ -155,7 +172,7 @@ unmethylatedpop = 72
 
 #-----------call simulation-----------
 SwitchDirection = 1
-output = main(generators,1,methylatedpop, unmethylatedpop)
+output = main(generators[step_count*streams_per_step:],1,methylatedpop, unmethylatedpop)
 
 #generate the arrays for our output - None (or null value) is the default
 exponential_parameters_UtoM = [None] * step_count
@@ -170,27 +187,35 @@ normal_mean_UtoM = [None] * step_count
 timeouts_UtoM = [0] * step_count
 empirical_mean_UtoM = [None] * step_count
 #list comprehension that creates an array of the values we tested for our chosen parameter
-#TODO: add offset of initial size
-step_array = [step_size * i for i in range(step_count)]
+step_array = [param_begin_val + step_size * i for i in range(step_count)]
 
+#the fits that drop the time-outs are done for every step at once (see sweep_statistics.py)
+row_switches, row_mean, row_sd, row_gamma_shape, row_gamma_scale, row_exponential_KS, row_normal_KS, row_gamma_KS = sweep_statistics.RowStatistics(output)
 
 for step in range(step_count):
-    #this list comprehension makes an array of all the positive values in a given row of output_array
-    valid_array = [output[step][index] for index in range(batch_size) if output[step][index] >= 0]
-    #this list comprehension counts up all the negative (meaning timed out) values
-    raw_timeouts = batch_size - len(valid_array)
+    #the runs that didn't time out
+    switches = row_switches[step]
+    raw_timeouts = batch_size - switches
     timeouts_UtoM[step] = 10*(raw_timeouts/batch_size) #scale the timeouts to fit with the other info on the graph
 
-    #guess parameters only if less than half our simulations timed out
-    if len(valid_array) > batch_size/2:
-        #fit distributions to the data
-        exponential_parameters_UtoM[step] = stats.expon.fit(valid_array,floc=0)[1]
+    #with censored fits, fit every step with enough switches
+    if censor_timeouts and switches >= min_switches:
+        exponential_parameters_UtoM[step] = censored_fit.exponential_fit(output[step])[0]
+
+        empirical_mean_UtoM[step] = row_mean[step]
+
+        #compare the fitted CDF to the Kaplan-Meier estimate of the CDF
+        exponential_KS_UtoM[step] = 10 * censored_fit.censored_ks(output[step], lambda x: stats.expon.cdf(x, 0, exponential_parameters_UtoM[step]))[0]
+        print(exponential_KS_UtoM[step])
+    #otherwise, guess parameters only if less than half our simulations timed out
+    elif not censor_timeouts and switches > batch_size/2:
+        #fit distributions to the data - the location is locked to 0
+        exponential_parameters_UtoM[step] = row_mean[step]
 
-        empirical_mean_UtoM[step] = statistics.fmean(valid_array)
+        empirical_mean_UtoM[step] = row_mean[step]
 
         #calculate error for parameters with Kolmogorov-Smirnov test
-        #TODO: add args for expon
-        exponential_KS_UtoM[step] = 10 * (stats.kstest(valid_array, 'expon', N=len(valid_array), args=(0,exponential_parameters_UtoM[step])).statistic)
+        exponential_KS_UtoM[step] = 10 * row_exponential_KS[step]
         print(exponential_KS_MtoU[step])
 
     print("timed-out simulations: " + str(raw_timeouts) + " out of " + str(batch_size))